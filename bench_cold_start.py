@@ -0,0 +1,139 @@
+"""
+Measure the start-up of the server and worker processes.
+
+By default, reports the modules that take the longest to import (as measured
+by `python -X importtime`) for:
+
+- the server (`src.api.server`),
+- the worker (`src.core.worker`),
+- the warm-up of the worker (`ml` and `ml.warm_up`, see `WORKER_PRELOAD`).
+
+With `--first-job`, also starts workers, with and without preloading, and
+reports the time from the start of the process until the worker is ready (see
+`WORKER_READY_FILE`) and until each of its first jobs has finished. The jobs
+only import what the tasks need (`ml.warm_up`), which is what the first real
+task of a new worker pays before doing any work. This needs the Redis server
+configured in `src.utils.config`; the jobs use a dedicated queue.
+"""
+
+import argparse
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--top", type=int, default=10, help="number of modules listed per process")
+parser.add_argument(
+    "--first-job", action="store_true", help="also time workers up to their first jobs"
+)
+parser.add_argument("--jobs", type=int, default=3, help="jobs timed per worker")
+args = parser.parse_args()
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+# The workers import the job functions from `src/core`, e.g. `ml.fit`
+PYTHONPATH = [ROOT, os.path.join(ROOT, "src", "core"), os.environ.get("PYTHONPATH", "")]
+ENV = {**os.environ, "PYTHONPATH": os.pathsep.join(PYTHONPATH)}
+
+
+def is_ours(module):
+    return module in ("src", "ml", "worker") or module.startswith("src.")
+
+
+def import_times(code):
+    """
+    Total import time of `code`, and the (cumulative time, module) of each
+    third-party module imported by the modules of this repository.
+    """
+    stderr = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        env=ENV,
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stderr
+    total = 0
+    times = []
+    # `-X importtime` lists the modules after the modules they import, indented
+    # by 2 spaces per level: the children of each level are pending until their
+    # parent is listed
+    children = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if not cumulative.strip().isdigit():
+            continue  # Header
+        depth = (len(name) - len(name.lstrip())) // 2
+        module, seconds = name.strip(), int(cumulative) / 1e6
+        nested = children.pop(depth + 1, [])
+        if is_ours(module):
+            times.extend(child for child in nested if not is_ours(child[1]))
+        children.setdefault(depth, []).append((seconds, module))
+        if depth == 0:
+            total += seconds
+            if not is_ours(module):
+                times.append((seconds, module))
+    return total, sorted(times, reverse=True)
+
+
+for title, code in (
+    ("server", "import src.api.server"),
+    ("worker", "import src.core.worker"),
+    ("worker warm-up", "import src.core.worker, ml; ml.warm_up()"),
+):
+    total, times = import_times(code)
+    print(f"{title}: {total:.3f}s of imports, including")
+    for seconds, module in times[: args.top]:
+        print(f"    {seconds:8.3f}s  {module}")
+
+if not args.first_job:
+    sys.exit()
+
+from rq import Queue  # noqa: E402
+
+import src.utils.config as config  # noqa: E402
+
+connection = config.get_redis_connection()
+print(f"\nseconds from the start of a worker process ({args.jobs} jobs)")
+print(f"{'':<16}{'ready':>10}" + "".join(f"{f'job {i + 1}':>10}" for i in range(args.jobs)))
+for title, preload in (("no preload", ""), ("preload ml", "ml")):
+    queue = Queue(f"neuralk-bench-{uuid.uuid4()}", connection=connection)
+    jobs = [queue.enqueue("ml.warm_up") for _ in range(args.jobs)]
+    ready_file = os.path.join(tempfile.mkdtemp(prefix="neuralk-bench-"), "ready")
+    env = {
+        **ENV,
+        "QUEUE_NAME": queue.name,
+        "WORKER_PRELOAD": preload,
+        "WORKER_READY_FILE": ready_file,
+    }
+    start = time.time()
+    worker = subprocess.Popen(
+        [sys.executable, os.path.join("src", "core", "worker.py")],
+        env=env,
+        cwd=ROOT,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    ready = None
+    try:
+        while ready is None or not all(
+            job.get_status(refresh=True) in ("finished", "failed") for job in jobs
+        ):
+            if ready is None and os.path.exists(ready_file):
+                ready = time.time() - start
+            if worker.poll() is not None:
+                raise RuntimeError(f"The worker exited with code {worker.returncode}")
+            time.sleep(0.01)
+    finally:
+        worker.send_signal(signal.SIGTERM)
+        worker.wait()
+    for job in jobs:
+        job.refresh()
+    ended = [job.ended_at.timestamp() - start for job in jobs]
+    print(f"{title:<16}{ready:>10.2f}" + "".join(f"{t:>10.2f}" for t in ended))
+    queue.delete(delete_jobs=True)
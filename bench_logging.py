@@ -0,0 +1,102 @@
+"""
+Measure the cost of logging for the threads that log.
+
+Compares the previous setup (f-string messages, and a console and a file
+handler called synchronously by each logger) with `src.utils.logger` (lazy
+`%`-style messages, queued to a background writer). For each setup, several
+threads log concurrently, as the request threads of the server do, and the
+mean time spent per call in these threads is reported:
+
+- with the level disabled (e.g. `logger.debug` in production),
+- with the level enabled.
+
+For the queued setup, the time until the background writer has written all the
+records is reported too ("drained"). Console output goes to /dev/null and log
+files to a temporary directory.
+"""
+
+import argparse
+import logging
+import logging.handlers
+import os
+import sys
+import tempfile
+import threading
+import time
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--calls", type=int, default=20_000, help="log calls per thread")
+parser.add_argument("--threads", type=int, default=8)
+args = parser.parse_args()
+
+os.chdir(tempfile.mkdtemp(prefix="neuralk-bench-logging-"))
+# The console handlers write to `sys.stderr`
+sys.stderr = open(os.devnull, "w")
+
+from src.utils.logger import flush, get_logger  # noqa: E402
+
+
+def legacy_logger(name):
+    """Logger configured like `get_logger` used to do."""
+    logger = logging.getLogger(name)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    formatter = logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    for handler in (
+        logging.StreamHandler(),
+        logging.handlers.TimedRotatingFileHandler(f"{name}.log", when="midnight"),
+    ):
+        handler.setFormatter(formatter)
+        logger.addHandler(handler)
+    return logger
+
+
+def legacy_calls(logger, level, n):
+    job_id, elapsed, shape = "0f8fad5b-d9cb-469f-a165-70867728950e", 1.234567, (1000, 50)
+    for _ in range(n):
+        logger.log(level, f"Job {job_id} trained in {elapsed:.2f}s. Shape: {shape}")
+
+
+def lazy_calls(logger, level, n):
+    job_id, elapsed, shape = "0f8fad5b-d9cb-469f-a165-70867728950e", 1.234567, (1000, 50)
+    for _ in range(n):
+        logger.log(level, "Job %s trained in %.2fs. Shape: %s", job_id, elapsed, shape)
+
+
+def run(calls, logger, level):
+    """Mean seconds per call in the logging threads."""
+    per_thread = []
+
+    def target():
+        start = time.perf_counter()
+        calls(logger, level, args.calls)
+        per_thread.append(time.perf_counter() - start)
+
+    threads = [threading.Thread(target=target) for _ in range(args.threads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return sum(per_thread) / (args.threads * args.calls)
+
+
+legacy = legacy_logger("bench.legacy")
+queued = get_logger("bench.queued")
+queued.setLevel(logging.INFO)
+
+print(f"{args.threads} threads x {args.calls} calls, mean time per call in the logging threads")
+print(f"{'':<28}{'disabled (us)':>15}{'enabled (us)':>15}{'drained (us)':>15}")
+legacy_disabled = run(legacy_calls, legacy, logging.DEBUG)
+legacy_enabled = run(legacy_calls, legacy, logging.INFO)
+print(
+    f"{'sync handlers, f-strings':<28}{legacy_disabled * 1e6:>15.2f}{legacy_enabled * 1e6:>15.2f}"
+)
+queued_disabled = run(lazy_calls, queued, logging.DEBUG)
+start = time.perf_counter()
+queued_enabled = run(lazy_calls, queued, logging.INFO)
+flush()
+drained = (time.perf_counter() - start) / (args.threads * args.calls)
+print(
+    f"{'queue handler, %-style':<28}{queued_disabled * 1e6:>15.2f}"
+    f"{queued_enabled * 1e6:>15.2f}{drained * 1e6:>15.2f}"
+)
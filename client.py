@@ -1,10 +1,16 @@
 """
 Python client for the API implemented by `server.py`
 """
+
+import io
+import json
 import time
 import datetime
 
+import numpy as np
 import polars as pl
+import pyarrow as pa
+import pyarrow.parquet as pq
 import requests
 
 import src.utils.config as config
@@ -17,27 +23,135 @@ class NoResult(Exception):
     pass
 
 
+def _read_npy(content):
+    """Array stored in the .npy bytes `content`, without copying them."""
+    buf = io.BytesIO(content)
+    if np.lib.format.read_magic(buf) == (1, 0):
+        shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(buf)
+    else:
+        shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(buf)
+    values = np.frombuffer(content, dtype=dtype, offset=buf.tell())
+    return values.reshape(shape, order="F" if fortran_order else "C")
+
+
+def _download_result(url, result_format):
+    """DataFrame of the result file in `result_format` at `url`."""
+    with requests.get(url, stream=True) as resp:
+        resp.raise_for_status()
+        match result_format:
+            case "arrow":
+                reader = pa.ipc.open_file(pa.py_buffer(resp.content))
+                return pl.from_arrow(reader.read_all())
+            case "numpy":
+                return pl.DataFrame({"y": _read_npy(resp.content)})
+            case _:
+                return pl.read_parquet(resp.raw)
+
+
+class _MultipartUpload:
+    """
+    Write-only file that uploads what is written to it as a dataset, in parts
+    of `part_size` bytes, so that a dataset is uploaded while it is written
+    without being stored on disk or in memory as a whole.
+
+    The presigned PUT urls of MinIO need the size of the uploaded body, hence
+    a multipart upload rather than a single chunked one (see `/multipart_upload`
+    in server.py). Call `complete` once the dataset is written, or `abort`.
+    """
+
+    def __init__(self, url, part_size):
+        self.url = url
+        self.part_size = part_size
+        response = requests.post(f"{url}/multipart_upload")
+        response.raise_for_status()
+        upload_info = response.json()
+        self.id, self.upload_id = upload_info["id"], upload_info["upload_id"]
+        self.buffer = bytearray()
+        self.parts = 0
+        self.size = 0
+        self.closed = False
+
+    def writable(self):
+        return True
+
+    def tell(self):
+        return self.size
+
+    def write(self, data):
+        self.buffer += data
+        self.size += memoryview(data).nbytes
+        while len(self.buffer) >= self.part_size:
+            self._upload_part(bytes(self.buffer[: self.part_size]))
+            del self.buffer[: self.part_size]
+        return memoryview(data).nbytes
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def _upload_part(self, data):
+        self.parts += 1
+        params = {"id": self.id, "upload_id": self.upload_id, "part": self.parts}
+        response = requests.get(f"{self.url}/upload_part", params=params)
+        response.raise_for_status()
+        requests.put(response.json()["url"], data=data).raise_for_status()
+
+    def complete(self):
+        """Upload the rest of the dataset, and assemble its parts."""
+        if self.buffer or not self.parts:
+            self._upload_part(bytes(self.buffer))
+            self.buffer.clear()
+        requests.post(
+            f"{self.url}/complete_upload",
+            params={"id": self.id, "upload_id": self.upload_id, "parts": self.parts},
+        ).raise_for_status()
+
+    def abort(self):
+        """Discard the parts uploaded so far."""
+        requests.delete(
+            f"{self.url}/upload", params={"id": self.id, "upload_id": self.upload_id}
+        ).raise_for_status()
+
+
 class Client:
     """Client for the API exposed by server.py"""
+
     def __init__(self, host=None, port=None):
         self.host = host or config.SERVER_HOST
         self.port = port or config.SERVER_PORT
         self.url = f"http://{self.host}:{self.port}"
         logger.info(f"Client initialized with URL: {self.url}")
 
-    def upload(self, file_path):
-        """Upload a dataset and get its ID."""
+    def upload(self, file_path, optimize=False, float32=False):
+        """
+        Upload a dataset and get its ID.
+
+        Parameters
+        ----------
+        file_path : str
+            Path of the parquet file to upload.
+        optimize : bool
+            Once uploaded, have the server rewrite the dataset in the background
+            in a layout that is faster to read for the tasks that use it.
+        float32 : bool
+            When optimizing, also downcast the float64 features to float32.
+        """
         logger.info(f"Uploading dataset: {file_path} - {self.url}/upload")
         try:
             dataset_info = requests.get(f"{self.url}/upload").json()
             dataset_id = dataset_info["id"]
             logger.debug(f"Got upload URL and ID: {dataset_id}")
-            
+
             with open(file_path, "rb") as f:
                 response = requests.put(dataset_info["url"], f)
                 response.raise_for_status()
-                
+
             logger.info(f"Dataset uploaded successfully. ID: {dataset_id}")
+
+            if optimize:
+                self._optimize(dataset_id, float32)
             return dataset_id
         except FileNotFoundError:
             logger.error(f"File not found: {file_path}")
@@ -46,17 +160,84 @@ class Client:
             logger.error(f"Error uploading dataset: {str(e)}")
             raise
 
+    def upload_frame(
+        self,
+        df,
+        optimize=False,
+        float32=False,
+        compression="zstd",
+        row_group_size=None,
+        part_size=16 * 2**20,
+    ):
+        """
+        Upload a DataFrame as a dataset and get its ID.
+
+        The DataFrame is written as parquet one row group at a time, and what
+        is written is uploaded in parts as it goes: neither a file nor a copy
+        of the whole parquet file is made.
+
+        Parameters
+        ----------
+        df : polars.DataFrame or pyarrow.Table
+            The dataset to upload.
+        optimize : bool
+            Same as for `upload`.
+        float32 : bool
+            Same as for `upload`.
+        compression : str
+            Compression codec of the parquet file.
+        row_group_size : int, optional
+            Maximum number of rows per row group (the pyarrow default if None).
+        part_size : int
+            Bytes uploaded per request, at least 5 MiB. The memory used while
+            uploading is about one part and one row group.
+        """
+        table = df.to_arrow() if isinstance(df, pl.DataFrame) else df
+        logger.info(f"Uploading DataFrame of shape {table.shape} - {self.url}/multipart_upload")
+        try:
+            upload = _MultipartUpload(self.url, part_size)
+            logger.debug(f"Started multipart upload. ID: {upload.id}")
+            try:
+                with pq.ParquetWriter(upload, table.schema, compression=compression) as writer:
+                    writer.write_table(table, row_group_size=row_group_size)
+                upload.complete()
+            except BaseException:
+                try:
+                    upload.abort()
+                except Exception as e:
+                    # The original error is more useful than that of the abort
+                    logger.error(f"Error aborting upload of dataset {upload.id}: {str(e)}")
+                raise
+            logger.info(
+                f"Dataset uploaded successfully in {upload.parts} parts "
+                f"({upload.size} bytes). ID: {upload.id}"
+            )
+
+            if optimize:
+                self._optimize(upload.id, float32)
+            return upload.id
+        except requests.exceptions.RequestException as e:
+            logger.error(f"Error uploading dataset: {str(e)}")
+            raise
+
+    def _optimize(self, dataset_id, float32):
+        requests.post(
+            f"{self.url}/optimize",
+            params={"id": dataset_id, "float32": int(float32)},
+        ).raise_for_status()
+        logger.debug(f"Dataset optimization requested. ID: {dataset_id}")
+
     def _wait(self, job_id, timeout):
-        if timeout < 0.0:
+        if timeout is not None and timeout < 0.0:
             return
-            
+
         logger.debug(f"Waiting for job {job_id} with timeout: {timeout}")
         start = time.monotonic()
         prev = None
-        
+
         while True:
             status, since = self.status(job_id)
-            
+
             # Log status changes
             if status != prev:
                 if prev is not None:
@@ -64,23 +245,23 @@ class Client:
                 else:
                     logger.info(f"Job {job_id} status: {status}")
                 prev = status
-                
+
             # Handle terminal states
             if status in ["failed", "stopped", "canceled"]:
                 logger.error(f"Job {job_id} {status} after {since:.1f}s")
                 raise NoResult(f"Stopped waiting on job {job_id} with status: {status}")
-                
+
             if status == "finished":
                 logger.info(f"Job {job_id} finished successfully after {since:.1f}s")
                 break
-                
+
             # Progress update
             if int(since) % 5 == 0:  # Log only every 5 seconds to avoid excessive logging
                 logger.debug(f"Job {job_id} still {status} after {since:.1f}s")
-            
+
             # Terminal update for user feedback
             print(f"{status: <10}{since:.1f}s", end="\r")
-            
+
             # Handle timeout
             if timeout is None:
                 wait_for = 0.5
@@ -90,37 +271,130 @@ class Client:
                     logger.warning(f"Job {job_id} timed out after {timeout}s")
                     raise TimeoutError(f"Timed out waiting for job {job_id}")
                 wait_for = min(wait_for, 0.5)
-                
+
             time.sleep(wait_for)
 
-    def fit(self, dataset_id, timeout=-1):
+    def fit(
+        self,
+        dataset_id,
+        timeout=-1,
+        out_of_core=False,
+        deadline=None,
+        base_model_id=None,
+        iterations=None,
+        replay_ids=(),
+        replay=0.0,
+    ):
         """
         Start fitting a model and return the corresponding job ID.
 
         Parameters
         ----------
-        dataset_id : str
-            An ID returned by `upload`. The dataset to use to fit the model.
+        dataset_id : str or list of str
+            An ID returned by `upload`. The dataset to use to fit the model,
+            or several datasets with the same columns.
         timeout : float
             If < 0:  launch the job and return immediately
             If None: launch the job and wait until the job is finished. Raise
                      a NoResult exception if the job failed.
             If >= 0: Same as when timeout=None, but raise a TimeoutError if the
-                     job has not fninised after `timeout` seconds.
+                     job has not fninised after `timeout` seconds. The job
+                     keeps running (see `deadline` and `cancel`).
+        out_of_core : bool
+            Train without loading the whole dataset in the memory of the
+            worker, for datasets that do not fit in it.
+        deadline : float, optional
+            Number of seconds after which the server abandons the job if it
+            has not finished. By default, the job has none.
+        base_model_id : str, optional
+            An ID returned by `fit`. Instead of training a new model from
+            scratch, continue the training of this one on `dataset_id` only
+            (e.g. the rows added since it was trained). The base model is kept.
+        iterations : int, optional
+            Boosting iterations added to the base model (by default
+            `WARM_START_ITERATIONS` on the server).
+        replay_ids : list of str
+            IDs returned by `upload`, e.g. the datasets the base model was
+            trained on, of which a fraction `replay` of the rows is added to
+            the training data of the base model.
+        replay : float
+            Fraction of the rows of `replay_ids` used.
         """
         logger.info(f"Starting model training with dataset ID: {dataset_id}")
+        params = {
+            "id": dataset_id,
+            "out_of_core": int(out_of_core),
+            "deadline": deadline,
+        }
+        if base_model_id is not None:
+            params.update(
+                base_model_id=base_model_id,
+                iterations=iterations,
+                replay_id=list(replay_ids),
+                replay=replay,
+            )
         try:
-            fit_info = requests.post(f"{self.url}/fit", params={"id": dataset_id}).json()
+            response = requests.post(f"{self.url}/fit", params=params)
+            response.raise_for_status()
+            fit_info = response.json()
             model_id = fit_info["id"]
             logger.debug(f"Model training job created with ID: {model_id}")
-            
+
             self._wait(model_id, timeout=timeout)
             return model_id
         except requests.exceptions.RequestException as e:
             logger.error(f"Error requesting model training: {str(e)}")
             raise
 
-    def predict(self, dataset_id, model_id, timeout=-1):
+    def fit_sweep(self, dataset_id, configs, cv=0, timeout=-1):
+        """
+        Start fitting one model per hyperparameter configuration.
+
+        Returns a pair (sweep job ID, list of model IDs in the order of
+        `configs`). Once the job is finished, `download` with the sweep job ID
+        returns the table of scores.
+
+        Parameters
+        ----------
+        dataset_id : str
+            An ID returned by `upload`. The dataset to use to fit the models.
+        configs : list of dict
+            `HistGradientBoostingClassifier` parameters of each model.
+        cv : int
+            Number of cross-validation folds used to score the models. If < 2,
+            the models are scored on a holdout split of the rows instead.
+        timeout : float
+            Same as for `fit`.
+        """
+        logger.info(
+            f"Starting sweep of {len(configs)} configurations with dataset ID: {dataset_id}"
+        )
+        try:
+            response = requests.post(
+                f"{self.url}/fit_sweep",
+                params={"id": dataset_id, "configs": json.dumps(configs), "cv": cv},
+            )
+            response.raise_for_status()
+            sweep_info = response.json()
+            sweep_id = sweep_info["id"]
+            logger.debug(f"Sweep job created with ID: {sweep_id}")
+
+            self._wait(sweep_id, timeout=timeout)
+            return sweep_id, sweep_info["model_ids"]
+        except requests.exceptions.RequestException as e:
+            logger.error(f"Error requesting sweep: {str(e)}")
+            raise
+
+    def predict(
+        self,
+        dataset_id,
+        model_id,
+        timeout=-1,
+        output_format="parquet",
+        compression=None,
+        deadline=None,
+        shards=None,
+    ):
         """
         Start a prediction and return the corresponding job ID.
 
@@ -135,79 +409,218 @@ class Client:
             If None: launch the job and wait until the job is finished. Raise
                      a NoResult exception if the job failed.
             If >= 0: Same as when timeout=None, but raise a TimeoutError if the
-                     job has not fninised after `timeout` seconds.
+                     job has not fninised after `timeout` seconds. The job
+                     keeps running (see `deadline` and `cancel`).
+        output_format : str
+            Format in which the server stores the prediction: 'parquet',
+            'arrow' (Arrow IPC, the fastest to `download`) or 'numpy'.
+        compression : str, optional
+            Compression codec of the 'parquet' or 'arrow' file, one of the
+            `RESULT_COMPRESSIONS` of its format (see src/utils/formats.py).
+        deadline : float, optional
+            Same as for `fit`.
+        shards : int, optional
+            Number of shards predicted in parallel by the workers. By default,
+            only datasets larger than the `PREDICT_SHARD_ROWS` of the server
+            are sharded. `download` reassembles the shards.
         """
         logger.info(f"Starting prediction with dataset ID: {dataset_id} and model ID: {model_id}")
         try:
-            predict_info = requests.post(
+            response = requests.post(
                 f"{self.url}/predict",
-                params={"dataset_id": dataset_id, "model_id": model_id},
-            ).json()
+                params={
+                    "dataset_id": dataset_id,
+                    "model_id": model_id,
+                    "format": output_format,
+                    "compression": compression,
+                    "deadline": deadline,
+                    "shards": shards,
+                },
+            )
+            response.raise_for_status()
+            predict_info = response.json()
             prediction_id = predict_info["id"]
             logger.debug(f"Prediction job created with ID: {prediction_id}")
-            
+
             self._wait(prediction_id, timeout=timeout)
             return prediction_id
         except requests.exceptions.RequestException as e:
             logger.error(f"Error requesting prediction: {str(e)}")
             raise
 
+    def pipeline(self, train_id, test_id, timeout=-1, deadline=None):
+        """
+        Start fitting a model and a prediction that uses it, in one request.
+
+        The server runs the fit and the prediction in a single job, so the
+        client does not wait for the fit, and the prediction uses the model
+        from memory. Returns a pair (model ID, prediction ID); only the
+        prediction ID is a job ID.
+
+        Parameters
+        ----------
+        train_id : str
+            An ID returned by `upload`. The dataset to use to fit the model.
+        test_id : str
+            An ID returned by `upload`. The dataset for which to make predictions.
+        timeout : float
+            Same as for `fit`.
+        deadline : float, optional
+            Same as for `fit`.
+        """
+        logger.info(
+            f"Starting pipeline with train dataset ID: {train_id} and test dataset ID: {test_id}"
+        )
+        try:
+            response = requests.post(
+                f"{self.url}/pipeline",
+                params={
+                    "train_id": train_id,
+                    "test_id": test_id,
+                    "deadline": deadline,
+                },
+            )
+            response.raise_for_status()
+            pipeline_info = response.json()
+            model_id, prediction_id = pipeline_info["model_id"], pipeline_info["id"]
+            logger.debug(f"Pipeline job created with ID: {prediction_id}, model ID: {model_id}")
+
+            self._wait(prediction_id, timeout=timeout)
+            return model_id, prediction_id
+        except requests.exceptions.RequestException as e:
+            logger.error(f"Error requesting pipeline: {str(e)}")
+            raise
+
+    def cancel(self, job_id):
+        """
+        Cancel a job, or stop it if it is running, along with the jobs waiting
+        for it. Returns the status of the job after the request.
+        """
+        logger.info(f"Canceling job with ID: {job_id}")
+        try:
+            response = requests.post(f"{self.url}/cancel", params={"id": job_id})
+            response.raise_for_status()
+            return response.json()["status"]
+        except requests.exceptions.RequestException as e:
+            logger.error(f"Error canceling job {job_id}: {str(e)}")
+            raise
+
+    def delete_model(self, model_id):
+        """
+        Delete a model returned by `fit`, with the predictions cached for it.
+        """
+        logger.info(f"Deleting model with ID: {model_id}")
+        try:
+            response = requests.delete(f"{self.url}/model", params={"id": model_id})
+            response.raise_for_status()
+        except requests.exceptions.RequestException as e:
+            logger.error(f"Error deleting model {model_id}: {str(e)}")
+            raise
+
+    def info(self, job_id):
+        """
+        Get the status of a job and the timestamps (UNIX times, or None) when
+        it was created, enqueued, started and ended, as a dict.
+        """
+        try:
+            response = requests.get(f"{self.url}/status", params={"id": job_id})
+            response.raise_for_status()
+            return response.json()
+        except requests.exceptions.RequestException as e:
+            logger.error(f"Error fetching status for job {job_id}: {str(e)}")
+            raise
+
     def status(self, job_id):
         """
         Get the status of a `fit` or `predict` job
 
         Returns a pair (status string, timestamp when this status was reached).
         """
+        info = self.info(job_id)
+        status = info["status"]
+        now = datetime.datetime.now().timestamp()
+
+        # The first timestamp that the job has, e.g. a deferred job that was
+        # canceled was never enqueued, and has no end either
+        match status:
+            case "started":
+                keys = ("started_at",)
+            case "finished" | "stopped" | "failed" | "canceled":
+                keys = ("ended_at", "enqueued_at", "created_at")
+            case "deferred":
+                keys = ("created_at",)
+            case _:
+                keys = ("enqueued_at", "created_at")
+        since = next((info[key] for key in keys if info.get(key) is not None), None)
+        elapsed = 0 if since is None else now - since
+
+        logger.debug(f"Job {job_id} status: {status}, elapsed: {elapsed:.1f}s")
+        return status, elapsed
+
+    def _result(self, result_id):
+        """Presigned urls (one per shard of a sharded prediction) and format
+        of the result `result_id`."""
+        response = requests.get(f"{self.url}/result", params={"id": result_id})
+        response.raise_for_status()
+        result_info = response.json()
+        urls = result_info.get("urls") or [result_info["url"]]
+        return urls, result_info.get("format", "parquet")
+
+    def download_lazy(self, result_id):
+        """
+        Get a prediction made by `predict` as a `polars.LazyFrame`, which
+        downloads only what the query needs when it is collected.
+
+        Parquet results are read with HTTP range requests: only the row groups
+        and columns that the query selects are downloaded. Arrow IPC results
+        are downloaded as a whole when collected, and numpy results right away.
+        The url of the result expires after 7 days, and so does the LazyFrame.
+        The files of the shards of a sharded prediction are scanned together.
+        """
+        logger.info(f"Opening prediction results for ID: {result_id}")
         try:
-            info = requests.get(f"{self.url}/status", params={"id": job_id}).json()
-            status = info["status"]
-            now = datetime.datetime.now().timestamp()
-            
-            elapsed = 0
-            match status:
-                case "started":
-                    elapsed = now - info["started_at"]
-                case "finished" | "stopped" | "failed":
-                    elapsed = now - info["ended_at"]
+            result_urls, result_format = self._result(result_id)
+            logger.debug(f"Got result URLs for ID: {result_id}, format: {result_format}")
+            match result_format:
+                case "arrow":
+                    return pl.scan_ipc(result_urls)
+                case "numpy":
+                    return self.download(result_id).lazy()
                 case _:
-                    elapsed = now - info["enqueued_at"]
-            
-            logger.debug(f"Job {job_id} status: {status}, elapsed: {elapsed:.1f}s")
-            return status, elapsed
-            
+                    return pl.scan_parquet(result_urls)
         except requests.exceptions.RequestException as e:
-            logger.error(f"Error fetching status for job {job_id}: {str(e)}")
+            logger.error(f"Error opening prediction results: {str(e)}")
             raise
 
-
     def download(self, result_id):
         """
         Download a prediction made by `predict`.
 
-        result_id is the ID returned by `predict`.
+        result_id is the ID returned by `predict`. The result is read in the
+        format the server reports for it; uncompressed Arrow IPC results are
+        loaded into polars from the downloaded buffer without decoding or
+        copying. The results of the shards of a sharded prediction are
+        concatenated, in the order of the rows.
         """
         logger.info(f"Downloading prediction results for ID: {result_id}")
         try:
-            # Get the download Presigned URL
-            result_url_response = requests.get(
-                f"{self.url}/result", params={"id": result_id}
-            )
-            result_url_response.raise_for_status()
-            result_url = result_url_response.json()["url"]
-            
-            logger.debug(f"Got result download URL for ID: {result_id}")
-            
+            # Get the download Presigned URLs
+            result_urls, result_format = self._result(result_id)
+
+            logger.debug(f"Got result URLs for ID: {result_id}, format: {result_format}")
+
             # Download the actual result
-            with requests.get(result_url, stream=True) as resp:
-                resp.raise_for_status()
-                data = pl.read_parquet(resp.raw)
-                
+            frames = [_download_result(url, result_format) for url in result_urls]
+            data = frames[0] if len(frames) == 1 else pl.concat(frames, rechunk=False)
+
             logger.info(f"Successfully downloaded prediction results. Shape: {data.shape}")
             return data
-            
+
         except requests.exceptions.RequestException as e:
             logger.error(f"Error downloading prediction results: {str(e)}")
             raise
         except Exception as e:
-            logger.error(f"Error processing downloaded prediction data: {type(e).__name__}: {str(e)}")
+            logger.error(
+                f"Error processing downloaded prediction data: {type(e).__name__}: {str(e)}"
+            )
             raise
@@ -1,10 +1,8 @@
 """
 Fit a model and later use it to make a prediction.
 """
+
 import argparse
-import os
-import sys
-from pathlib import Path
 
 from client import Client
 
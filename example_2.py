@@ -1,8 +1,6 @@
 """
 Launch 40 `fit` tasks at the same time.
 """
-import os
-from pathlib import Path
 
 from client import Client
 
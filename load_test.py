@@ -0,0 +1,298 @@
+"""
+Open-loop load generator for the API, to find the throughput at which a
+deployment saturates.
+
+Requests arrive at a given rate whether or not the previous ones have
+finished, as they do in production: a saturated deployment shows up as growing
+latencies rather than as a lower request rate. The rate can be stepped
+(`--rates 1 2 4 8` with `--step-duration` seconds per rate), and arrivals are
+either Poisson (exponential inter-arrival times) or evenly spaced.
+
+Each request is one of the operations below, drawn according to `--mix`
+(e.g. `--mix fit=1,predict=4`):
+
+- `upload`: upload the training dataset.
+- `fit`: train a model on the training dataset, and wait for it.
+- `predict`: predict on the test dataset with a model trained during the
+  setup, wait for the prediction, and download it.
+- `download`: download a prediction made during the setup.
+
+The datasets are generated by `make_data.generate_data` with the requested
+shape. Each request reports the time spent in each phase:
+
+- `enqueue`: the request that submits the job (or the upload itself),
+- `queue_wait`: from enqueued to started, according to the server,
+- `execution`: from started to ended, according to the server,
+- `download`: the download of the prediction,
+- `total`: from the time the request was due to be sent until it completed,
+  so that requests delayed by the load generator itself are not ignored.
+
+The report, printed as JSON (or written to `--output`), gives for each step
+and each operation the throughput, the errors, and the p50/p95/p99 of each
+phase in seconds. Predictions of the same dataset with the same model are
+cached by the server: start it with `PREDICT_CACHE_TTL=0` to measure actual
+predictions (the `cached` count of the report says how many were reused).
+
+Example:
+
+    python load_test.py --rates 0.5 1 2 4 --step-duration 120 --mix fit=1,predict=4
+"""
+
+import argparse
+import json
+import random
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import requests
+
+from client import Client
+from make_data import generate_data
+
+OPERATIONS = ("upload", "fit", "predict", "download")
+PHASES = ("enqueue", "queue_wait", "execution", "download", "total")
+
+
+def parse_mix(mix):
+    """Weights of the operations, from e.g. 'fit=1,predict=4'."""
+    weights = {}
+    for item in mix.split(","):
+        name, _, weight = item.partition("=")
+        if name not in OPERATIONS:
+            raise argparse.ArgumentTypeError(
+                f"Unknown operation {name!r}, expected one of {OPERATIONS}"
+            )
+        weights[name] = float(weight or 1)
+    return weights
+
+
+def positive_float(value):
+    """A float > 0, e.g. a rate (a rate of 0 would never send a request)."""
+    number = float(value)
+    if not number > 0:
+        raise argparse.ArgumentTypeError(f"must be > 0, got {value}")
+    return number
+
+
+def feature_count(value):
+    """A number of features that `make_classification` accepts: its 2
+    informative and 2 redundant features are part of them."""
+    number = int(value)
+    if number < 4:
+        raise argparse.ArgumentTypeError(f"must be >= 4, got {value}")
+    return number
+
+
+parser = argparse.ArgumentParser(
+    description=__doc__.split("\n\n")[0], formatter_class=argparse.RawDescriptionHelpFormatter
+)
+parser.add_argument("--host", help="server host (default SERVER_HOST)")
+parser.add_argument("--port", type=int, help="server port (default SERVER_PORT)")
+parser.add_argument(
+    "--rates", type=positive_float, nargs="+", default=[1.0], help="requests per second, per step"
+)
+parser.add_argument("--step-duration", type=positive_float, default=60, help="seconds per rate")
+parser.add_argument("--arrivals", choices=("poisson", "uniform"), default="poisson")
+parser.add_argument("--mix", type=parse_mix, default="fit=1,predict=4", help="operation weights")
+parser.add_argument("--samples", type=int, default=10_000, help="rows of the generated data")
+parser.add_argument(
+    "--features", type=feature_count, default=20, help="features of the generated data (>= 4)"
+)
+parser.add_argument("--format", default="parquet", help="format of the predictions")
+parser.add_argument("--timeout", type=float, default=600, help="seconds before a job is abandoned")
+parser.add_argument("--poll-interval", type=float, default=0.2, help="seconds between status polls")
+parser.add_argument("--max-in-flight", type=int, default=256, help="concurrent requests")
+parser.add_argument("--seed", type=int, default=0)
+parser.add_argument("--output", help="file where the JSON report is written (default: stdout)")
+
+
+class LoadTest:
+    """Send the requests of the load test and record their latencies."""
+
+    def __init__(self, client, args):
+        self.client = client
+        self.args = args
+        self.records = []
+        self.lock = threading.Lock()
+
+    def setup(self):
+        """Upload the datasets, and train the model and make the prediction
+        used by the requests."""
+        data_dir = tempfile.mkdtemp(prefix="neuralk-load-test-")
+        if not generate_data(data_dir, n_samples=self.args.samples, n_features=self.args.features):
+            raise RuntimeError("Could not generate the data")
+        self.train_path = f"{data_dir}/train.parquet"
+        self.train_id = self.client.upload(self.train_path)
+        self.test_id = self.client.upload(f"{data_dir}/test.parquet")
+        self.model_id = self.client.fit(self.train_id, timeout=self.args.timeout)
+        self.result_id = self.client.predict(
+            self.test_id, self.model_id, timeout=self.args.timeout, output_format=self.args.format
+        )
+
+    def submit_predict(self):
+        """Request the prediction of the test dataset, and return its job ID and
+        whether the server reused a cached prediction (shared with other
+        requests) for it."""
+        response = requests.post(
+            f"{self.client.url}/predict",
+            params={
+                "dataset_id": self.test_id,
+                "model_id": self.model_id,
+                "format": self.args.format,
+                "deadline": self.args.timeout,
+            },
+        )
+        response.raise_for_status()
+        info = response.json()
+        return info["id"], info.get("shared", False)
+
+    def wait(self, job_id, record, cancel=True):
+        """Poll job `job_id` until it ends, and record its queue and execution
+        times. On timeout, the job is canceled if `cancel` (only for the jobs
+        that this run enqueued: a cached prediction may be shared)."""
+        deadline = time.monotonic() + self.args.timeout
+        while True:
+            info = self.client.info(job_id)
+            if info["status"] in ("finished", "failed", "stopped", "canceled"):
+                break
+            if time.monotonic() > deadline:
+                if cancel:
+                    self.client.cancel(job_id)
+                raise TimeoutError(f"Timed out waiting for job {job_id}")
+            time.sleep(self.args.poll_interval)
+        if info["started_at"] is not None:
+            if info["enqueued_at"] is not None:
+                record["queue_wait"] = info["started_at"] - info["enqueued_at"]
+            if info["ended_at"] is not None:
+                record["execution"] = info["ended_at"] - info["started_at"]
+        if info["status"] != "finished":
+            raise RuntimeError(f"Job {job_id} {info['status']}")
+        return info
+
+    def run_operation(self, operation, step, due):
+        """Perform `operation`, which was due at time `due`, and record it."""
+        record = {"operation": operation, "step": step, "due": due, "late": time.time() - due}
+        try:
+            start = time.time()
+            if operation == "upload":
+                self.client.upload(self.train_path)
+                record["enqueue"] = time.time() - start
+            elif operation == "fit":
+                job_id = self.client.fit(self.train_id, deadline=self.args.timeout)
+                record["enqueue"] = time.time() - start
+                self.wait(job_id, record)
+            elif operation == "predict":
+                job_id, shared = self.submit_predict()
+                record["enqueue"] = time.time() - start
+                record["cached"] = shared
+                self.wait(job_id, record, cancel=not shared)
+                download_start = time.time()
+                self.client.download(job_id)
+                record["download"] = time.time() - download_start
+            elif operation == "download":
+                self.client.download(self.result_id)
+                record["download"] = time.time() - start
+            record["total"] = time.time() - due
+        except Exception as e:
+            record["error"] = f"{type(e).__name__}: {e}"
+        with self.lock:
+            self.records.append(record)
+
+    def arrivals(self, rate, duration, rng):
+        """Offsets in seconds of the arrivals of a step."""
+        offsets = []
+        t = 0.0
+        while True:
+            t += rng.expovariate(rate) if self.args.arrivals == "poisson" else 1 / rate
+            if t >= duration:
+                return offsets
+            offsets.append(t)
+
+    def run(self):
+        """Send the requests of all the steps, and return their start and end times."""
+        rng = random.Random(self.args.seed)
+        operations, weights = zip(*self.args.mix.items())
+        steps = []
+        with ThreadPoolExecutor(max_workers=self.args.max_in_flight) as executor:
+            for step, rate in enumerate(self.args.rates):
+                start = time.time()
+                for offset in self.arrivals(rate, self.args.step_duration, rng):
+                    due = start + offset
+                    time.sleep(max(0.0, due - time.time()))
+                    operation = rng.choices(operations, weights)[0]
+                    executor.submit(self.run_operation, operation, step, due)
+                time.sleep(max(0.0, start + self.args.step_duration - time.time()))
+                steps.append({"rate": rate, "start": start})
+        # All the requests have completed
+        return steps
+
+    def report(self, steps, end):
+        """The JSON report of the load test."""
+        steps_report = []
+        for step, info in enumerate(steps):
+            records = [r for r in self.records if r["step"] == step]
+            # The requests of a step may complete after it
+            completed = max([r["due"] + r["total"] for r in records if "total" in r] or [end])
+            elapsed = max(self.args.step_duration, completed - info["start"])
+            step_report = {
+                "offered_rate": info["rate"],
+                "requests": len(records),
+                "errors": sum("error" in r for r in records),
+                "throughput": sum("error" not in r for r in records) / elapsed,
+                "late": summarize([r["late"] for r in records]),
+                "operations": {},
+            }
+            for operation in self.args.mix:
+                op_records = [r for r in records if r["operation"] == operation]
+                ok = [r for r in op_records if "error" not in r]
+                op_report = {
+                    "requests": len(op_records),
+                    "errors": len(op_records) - len(ok),
+                    "throughput": len(ok) / elapsed,
+                }
+                if operation == "predict":
+                    op_report["cached"] = sum(r.get("cached", False) for r in ok)
+                for phase in PHASES:
+                    values = [r[phase] for r in ok if phase in r]
+                    if values:
+                        op_report[phase] = summarize(values)
+                errors = sorted({r["error"] for r in op_records if "error" in r})
+                if errors:
+                    op_report["error_samples"] = errors[:5]
+                step_report["operations"][operation] = op_report
+            steps_report.append(step_report)
+        excluded = ("output", "host", "port")
+        config = {key: value for key, value in vars(self.args).items() if key not in excluded}
+        return {"url": self.client.url, "config": config, "steps": steps_report}
+
+
+def summarize(values):
+    """Count, mean and p50/p95/p99 of `values`."""
+    if not values:
+        return {"count": 0}
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {
+        "count": len(values),
+        "mean": float(np.mean(values)),
+        "p50": float(p50),
+        "p95": float(p95),
+        "p99": float(p99),
+    }
+
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    load_test = LoadTest(Client(args.host, args.port), args)
+    load_test.setup()
+    steps = load_test.run()
+    report = load_test.report(steps, time.time())
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
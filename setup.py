@@ -5,7 +5,6 @@
 
 import io
 import os
-import re
 
 from setuptools import find_packages, setup
 
@@ -17,11 +16,13 @@ EMAIL = "team@neuralk.com"
 AUTHOR = "Neuralk Team"
 REQUIRES_PYTHON = ">=3.8.0"
 
+
 def read_requirements():
     """Read the requirements file."""
     with open("requirements.txt", encoding="utf-8") as f:
         return [line.strip() for line in f if not line.startswith("#")]
 
+
 REQUIRED = read_requirements()
 
 EXTRAS = {
@@ -5,22 +5,98 @@ It can be used like this:
 GET /upload
     Returns an ID for the dataset, and a presigned url where it can be uploaded
     as a parquet file.
-POST /fit?id=<dataset ID>
+POST /multipart_upload
+    Start uploading a dataset in parts, for clients that write it while they
+    upload it and so do not know its size. Returns an ID for the dataset and
+    the ID of the upload. Each part is uploaded to the presigned url returned
+    by `GET /upload_part?id=<dataset ID>&upload_id=<upload ID>&part=<number>`
+    (numbered from 1, all but the last of at least 5 MiB), then the dataset is
+    assembled by `POST /complete_upload?id=<dataset ID>&upload_id=<upload
+    ID>&parts=<number of parts>`, or the parts are discarded by
+    `DELETE /upload?id=<dataset ID>&upload_id=<upload ID>`.
+POST /optimize?id=<dataset ID>&float32=<0 or 1>
+    Start rewriting the dataset identified by `id`, once it is uploaded, in a
+    layout that is faster to download and read (zstd compression, tuned row
+    groups and, with `float32=1`, float32 features). Later tasks read the
+    optimized dataset. Returns an ID used to refer to the optimization task.
+POST /fit?id=<dataset ID>&out_of_core=<0 or 1>&deadline=<seconds>
     Start training a model on the dataset identified by `id` (an ID returned by
-    `/upload`). Returns an ID used to refer to the training task and resulting
-    model.
-POST /predict?dataset_id=<dataset ID>&model_id=<model ID>
+    `/upload`), which can be repeated to train on several datasets with the
+    same columns. Returns an ID used to refer to the training task and
+    resulting model. With `out_of_core=1`, the dataset is binned row group by
+    row group so that datasets larger than the memory of the workers can be
+    used. The optional `deadline` is a number of seconds after which the task
+    is abandoned: it is not started, or stopped if it is running.
+    With `base_model_id=<model ID>`, the training of that model is continued
+    instead: `iterations` (default `WARM_START_ITERATIONS`) boosting iterations
+    are added to it, trained on the datasets `id` (e.g. the rows appended since
+    it was trained) and a fraction `replay` of the rows of the datasets
+    `replay_id` (repeatable, e.g. the datasets of the base model). The base
+    model is kept. The lineage of the model (`datasets`, `base-model`,
+    `replayed-datasets`, and `generation`, the number of models before it) is
+    in the metadata of its object.
+POST /predict?dataset_id=<dataset ID>&model_id=<model ID>&format=<format>&compression=<codec>
+             &deadline=<seconds>&shards=<n>
     Start a prediction using the trained model identified by `model_id` (an ID
     returned by `/fit`) with as input the dataset identified by `dataset_id`
-    (an ID returned by `/upload`).
+    (an ID returned by `/upload`). The optional `format` of the result is
+    `parquet` (the default), `arrow` (Arrow IPC) or `numpy` (.npy), and
+    `compression` the codec of the parquet or Arrow IPC file (one of
+    `RESULT_COMPRESSIONS`, else 400). The result of
+    the same prediction (same dataset, unchanged since, model, format and
+    compression) is reused for `PREDICT_CACHE_TTL` seconds: if it is finished or still
+    running, its ID is returned instead of starting a new task, with
+    `shared: true` (the client should not cancel it, others may wait for it).
+    A task with a `deadline` (as for `/fit`) is only reused once finished, as
+    it may be abandoned before. The task is sent to a worker that has the model in its
+    cache if one is available soon enough, see `src.utils.affinity`. A
+    dataset of more than `PREDICT_SHARD_ROWS` rows (and at least
+    `PREDICT_SHARD_MIN_BYTES`) is split into shards of row groups (or into
+    `shards` shards, if given), predicted in parallel by separate tasks, see
+    `src.utils.shards`. Fails with a 404 if the dataset does not exist, and a
+    400 if its footer is read and it is not a parquet file.
+DELETE /model?id=<model ID>
+    Delete the model identified by `id`, and forget the cached predictions
+    made with it.
+POST /pipeline?train_id=<dataset ID>&test_id=<dataset ID>&deadline=<seconds>
+    Start training a model on the dataset identified by `train_id` and, once
+    it is trained, a prediction on the dataset identified by `test_id`, in a
+    single task, so the client does not have to wait for the fit before
+    submitting the predict, and the prediction uses the model from memory.
+    Returns the model ID and the ID of the task, which is that of the
+    prediction (the model ID is not a task ID). `deadline` is as for `/fit`.
+POST /fit_sweep?id=<dataset ID>&configs=<JSON list>&cv=<folds>
+    Start training one model per hyperparameter configuration (a JSON object
+    of `HistGradientBoostingClassifier` parameters) on the dataset identified
+    by `id`, in a single job that loads and bins the data once. `cv` is an
+    optional number of cross-validation folds: without it, the configurations
+    are scored on a holdout split of the rows. Returns an ID used to refer to
+    the task and its table of scores (see `/result`), and the ID of each model.
+POST /cancel?id=<task ID>
+    Cancel the task identified by `id` if it has not started, or stop it if it
+    is running, along with the tasks waiting for it and, for a sharded
+    prediction, its shards. Returns its status: `canceled`, or `started` until
+    the worker has stopped it.
 GET /status?id=<fit or predict ID>
     Status of the (`fit` or `predict`) task & timestamps for when it was
     enqueued, started, and finished.
-GET /result?id=<predict ID>
-    Returns a presigned url from which the prediction result parquet file can
-    be downloaded. `id` is an ID returned by `/predict`.
+GET /result?id=<predict or fit_sweep ID>
+    Returns a presigned url from which the prediction result file can be
+    downloaded, and the format of that file. `id` is an ID returned by
+    `/predict` (or by `/fit_sweep`, for the parquet table of scores). For a
+    sharded prediction, returns instead the `urls` of the files of the
+    shards, in the order of the rows.
 GET /health
-    Returns a health check status with Redis and MinIO connection status.
+    Liveness: returns the status of Redis, MinIO and the queue as last checked
+    in the background (every `HEALTH_CHECK_INTERVAL` seconds), and when. Fails
+    (503) only if this status is stale, not when Redis or MinIO is down.
+GET /ready
+    Readiness: same as `/health`, but also fails (503) while Redis or MinIO
+    is unavailable, or before the first check. See `src.utils.health`.
+
+Datasets, models and results that are not used for longer than their
+retention (`DATASET_RETENTION`, ...) are removed in the background, unless a
+pending task needs them; see `src.utils.retention`.
 
 NOTE: currently the server binds to localhost and uses the default connection
 options for Redis (localhost:6379) and MinIO (localhost:9000), which you may
@@ -29,35 +105,187 @@ need to modify (see the end of the file).
 
 import argparse
 import json
+import threading
 from http import HTTPStatus
 from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from urllib.parse import urlparse, parse_qs
 import uuid
 
+from minio.commonconfig import ENABLED, Filter
+from minio.error import S3Error
+from minio.lifecycleconfig import Expiration, LifecycleConfig, NoncurrentVersionExpiration, Rule
+from minio.versioningconfig import VersioningConfig
 from rq import Queue, Retry
-from rq.job import Job
+from rq.command import send_stop_job_command
+from rq.exceptions import NoSuchJobError
+from rq.job import Job, JobStatus
 
+import src.utils.affinity as affinity
 import src.utils.config as config
-from src.utils.logger import get_logger
+import src.utils.multipart as multipart
+from src.utils.health import Prober
+from src.utils.jobs import cancel, cancel_dependents, deadline_meta
+import src.utils.retention as retention
+import src.utils.shards as sharding
+from src.utils.formats import RESULT_COMPRESSIONS, RESULT_FORMATS
+from src.utils.logger import get_access_logger, get_logger
 
 from opentelemetry import trace
 
 tracer = trace.get_tracer("neuralk.tracer")
 
+# Redis keys of the predict result cache. A prediction's key holds the ID of
+# its predict job; a model's key holds the set of its predictions' keys.
+PREDICT_CACHE_KEY = (
+    "neuralk:predict:{data_id}:{data_version}:{model_id}:{output_format}:{compression}"
+)
+MODEL_PREDICTIONS_KEY = "neuralk:model:{model_id}:predictions"
+
+# Parameters of `HistGradientBoostingClassifier` that a sweep can set: its
+# models share the bins of the data, which have no categorical features
+SWEEP_PARAMS = frozenset(
+    {
+        "class_weight",
+        "early_stopping",
+        "interaction_cst",
+        "l2_regularization",
+        "learning_rate",
+        "loss",
+        "max_depth",
+        "max_features",
+        "max_iter",
+        "max_leaf_nodes",
+        "min_samples_leaf",
+        "monotonic_cst",
+        "n_iter_no_change",
+        "random_state",
+        "scoring",
+        "tol",
+        "validation_fraction",
+        "verbose",
+    }
+)
+
 logger = get_logger(__name__)
+access_logger = get_access_logger()
+
+
+class _BadRequest(Exception):
+    """Invalid query parameter, answered with a 400."""
+
+
+def _param(query, name, convert, default=None):
+    """
+    Query parameter `name` converted by `convert` (e.g. `int`), or `default`
+    if it is missing. Raises `_BadRequest` if `convert` raises a ValueError.
+    """
+    values = query.get(name)
+    if not values:
+        return default
+    try:
+        return convert(values[0])
+    except ValueError as e:
+        raise _BadRequest(f"Invalid {name}: {e}") from None
+
+
+def _sweep_configs(text):
+    """The configurations of a sweep, from their JSON list `text`."""
+    configs = json.loads(text)
+    if not isinstance(configs, list) or not configs:
+        raise ValueError("expected a non-empty JSON list of objects")
+    for params in configs:
+        if not isinstance(params, dict):
+            raise ValueError("expected a non-empty JSON list of objects")
+        if unknown := set(params) - SWEEP_PARAMS:
+            raise ValueError(f"unsupported parameters {sorted(unknown)}")
+    return configs
+
+
+def _retry():
+    """Retry policy of the jobs: up to `MAX_RETRIES`, with exponential backoff."""
+    return Retry(
+        max=config.MAX_RETRIES,
+        interval=[config.RETRY_BACKOFF * 2**i for i in range(config.MAX_RETRIES)],
+    )
+
+
+def _model_put_url(model_id, data_ids, base_model_id=None, base=None, replay_ids=()):
+    """
+    Presigned url where the model `model_id` is uploaded, with its lineage in
+    the object metadata: the datasets it was trained on, and the model whose
+    training it continued (`base_model_id`, whose `stat_object` is `base`) and
+    how many models precede it, if any. MinIO takes the object metadata from
+    the query string of the url, which is signed.
+    """
+    lineage = {"x-amz-meta-datasets": ",".join(data_ids), "x-amz-meta-generation": "0"}
+    if base_model_id is not None:
+        generation = int(base.metadata.get("x-amz-meta-generation", "0")) + 1
+        lineage["x-amz-meta-base-model"] = base_model_id
+        lineage["x-amz-meta-generation"] = str(generation)
+    if replay_ids:
+        lineage["x-amz-meta-replayed-datasets"] = ",".join(replay_ids)
+    return MINIO.get_presigned_url("PUT", "models", model_id, extra_query_params=lineage)
+
+
+def _cached_prediction(cache_key):
+    """
+    ID of the predict job cached under `cache_key`, if it finished or is still
+    running. Entries of failed jobs, and of jobs that do not exist (e.g. the
+    server stopped before enqueueing it), are dropped.
+
+    A job with a deadline is only reused once finished: it may be stopped at
+    its deadline, or canceled by its client when it stops waiting, which would
+    fail the requests that share it.
+    """
+    entry = REDIS.get(cache_key)
+    if entry is None:
+        return None
+    # The ID of the job, followed by " deadline" if it has one
+    result_id, _, deadline = entry.decode().partition(" ")
+    try:
+        status = Job.fetch(result_id, connection=REDIS).get_status()
+    except NoSuchJobError:
+        # Finished jobs are kept longer than the cache entries (see
+        # `_do_POST_predict`), so the job was never enqueued, or the request
+        # that cached its ID is about to enqueue it: at worst, the prediction
+        # is made twice.
+        status = None
+    if status in (None, JobStatus.FAILED, JobStatus.STOPPED, JobStatus.CANCELED):
+        REDIS.delete(cache_key)
+        return None
+    if deadline and status != JobStatus.FINISHED:
+        return None
+    return result_id
+
+
+def _cancel_or_stop(job):
+    """Cancel `job` if it has not started, or stop it if it is running.
+
+    Returns False if it has already ended."""
+    if job.get_status() in (JobStatus.QUEUED, JobStatus.DEFERRED, JobStatus.SCHEDULED):
+        cancel(job)
+    elif job.get_status() == JobStatus.STARTED:
+        # RQ would enqueue the jobs waiting for it once it is stopped, and
+        # they cannot succeed. The worker kills the work-horse and marks the
+        # job as stopped.
+        cancel_dependents(job)
+        send_stop_job_command(REDIS, job.id)
+    else:
+        return False
+    return True
 
 
 class Handler(BaseHTTPRequestHandler):
 
     error_message_format = "%(code)d %(message)s\n"
-    
+
     def log_message(self, format, *args):
-        """Override the default log_message to use our logger"""
-        logger.info("%s - %s" % (self.address_string(), format % args))
+        """Override the default log_message to use our (sampled) access logger"""
+        access_logger.info("%s - " + format, self.address_string(), *args)
 
-    def __send_response(self, msg):
+    def __send_response(self, msg, status=HTTPStatus.OK):
         msg = msg.encode("utf-8")
-        self.send_response(HTTPStatus.OK)
+        self.send_response(status)
         self.send_header("Content-type", "text/plain")
         self.send_header("Content-Length", str(len(msg)))
         self.end_headers()
@@ -69,6 +297,9 @@ class Handler(BaseHTTPRequestHandler):
     def do_POST(self):
         self.__handle()
 
+    def do_DELETE(self):
+        self.__handle()
+
     def __handle(self):
         parsed = urlparse(self.path)
         query = parse_qs(parsed.query)
@@ -80,8 +311,10 @@ class Handler(BaseHTTPRequestHandler):
             return
         try:
             method(query)
+        except _BadRequest as e:
+            self.send_error(HTTPStatus.BAD_REQUEST, str(e))
         except Exception as e:
-            logger.error(f"Error processing request: {type(e).__name__}: {e}", exc_info=True)
+            logger.error("Error processing request: %s: %s", type(e).__name__, e, exc_info=True)
             self.send_error(HTTPStatus.INTERNAL_SERVER_ERROR, "Error")
 
     @tracer.start_as_current_span("do_GET_upload")
@@ -89,9 +322,53 @@ class Handler(BaseHTTPRequestHandler):
         del query
         id = str(uuid.uuid4())
         url = MINIO.get_presigned_url("PUT", "datasets", id)
-        logger.info(f"Dataset upload requested. Generated ID: {id}")
+        logger.info("Dataset upload requested. Generated ID: %s", id)
         self.__send_response(json.dumps({"url": url, "id": id}))
 
+    @tracer.start_as_current_span("do_POST_multipart_upload")
+    def _do_POST_multipart_upload(self, query):
+        del query
+        id = str(uuid.uuid4())
+        # MinIO removes the parts of the uploads that are never completed
+        upload_id = multipart.create(MINIO, "datasets", id)
+        logger.info("Multipart dataset upload requested. Generated ID: %s", id)
+        self.__send_response(json.dumps({"id": id, "upload_id": upload_id}))
+
+    @tracer.start_as_current_span("do_GET_upload_part")
+    def _do_GET_upload_part(self, query):
+        id, upload_id, part = query["id"][0], query["upload_id"][0], query["part"][0]
+        url = MINIO.get_presigned_url(
+            "PUT",
+            "datasets",
+            id,
+            extra_query_params={"uploadId": upload_id, "partNumber": part},
+        )
+        self.__send_response(json.dumps({"url": url}))
+
+    @tracer.start_as_current_span("do_POST_complete_upload")
+    def _do_POST_complete_upload(self, query):
+        id, upload_id = query["id"][0], query["upload_id"][0]
+        n_parts = _param(query, "parts", int)
+        if n_parts is None:
+            self.send_error(HTTPStatus.BAD_REQUEST, "Missing parts")
+            return
+        parts = multipart.list_parts(MINIO, "datasets", id, upload_id)
+        if len(parts) != n_parts:
+            self.send_error(
+                HTTPStatus.BAD_REQUEST, f"Expected {n_parts} parts, {len(parts)} were uploaded"
+            )
+            return
+        multipart.complete(MINIO, "datasets", id, upload_id, parts)
+        logger.info("Dataset uploaded in %s parts. ID: %s", n_parts, id)
+        self.__send_response(json.dumps({"id": id}))
+
+    @tracer.start_as_current_span("do_DELETE_upload")
+    def _do_DELETE_upload(self, query):
+        id, upload_id = query["id"][0], query["upload_id"][0]
+        multipart.abort(MINIO, "datasets", id, upload_id)
+        logger.info("Multipart dataset upload aborted. ID: %s", id)
+        self.__send_response(json.dumps({"id": id}))
+
     @tracer.start_as_current_span("do_GET_status")
     def _do_GET_status(self, query):
         id = query["id"][0]
@@ -104,6 +381,7 @@ class Handler(BaseHTTPRequestHandler):
             json.dumps(
                 {
                     "status": job.get_status(),
+                    "created_at": ts(job.created_at),
                     "enqueued_at": ts(job.enqueued_at),
                     "started_at": ts(job.started_at),
                     "ended_at": ts(job.ended_at),
@@ -121,97 +399,353 @@ class Handler(BaseHTTPRequestHandler):
                 f"Cannot get result of job with status {status}",
             )
             return
+        output_format = job.kwargs.get("output_format", "parquet")
+        if shard_ids := job.meta.get("shards"):
+            # A sharded prediction, see `src.utils.shards`
+            urls = [MINIO.get_presigned_url("GET", "results", id) for id in shard_ids]
+            self.__send_response(json.dumps({"urls": urls, "format": output_format}))
+            return
         url = MINIO.get_presigned_url("GET", "results", predict_id)
-        self.__send_response(json.dumps({"url": url}))
+        self.__send_response(json.dumps({"url": url, "format": output_format}))
 
     @tracer.start_as_current_span("do_GET_health")
     def _do_GET_health(self, query):
         del query
-        status = {"status": "ok", "services": {}}
-        
-        # Check Redis connection
-        try:
-            redis_info = REDIS.info()
-            status["services"]["redis"] = {
-                "status": "ok",
-                "version": redis_info.get("redis_version", "unknown")
-            }
-        except Exception as e:
-            logger.warning(f"Health check - Redis connection error: {str(e)}")
-            status["services"]["redis"] = {
-                "status": "error",
-                "error": str(e)
-            }
-            status["status"] = "degraded"
-            
-        # Check MinIO connection
-        try:
-            minio_buckets = [bucket.name for bucket in MINIO.list_buckets()]
-            status["services"]["minio"] = {
-                "status": "ok",
-                "buckets": minio_buckets
-            }
-        except Exception as e:
-            logger.warning(f"Health check - MinIO connection error: {str(e)}")
-            status["services"]["minio"] = {
-                "status": "error",
-                "error": str(e)
-            }
-            status["status"] = "degraded"
-            
-        # Check Queue status
-        try:
-            queue_length = QUEUE.count
-            status["services"]["queue"] = {
-                "status": "ok",
-                "jobs": queue_length
-            }
-        except Exception as e:
-            logger.warning(f"Health check - Queue error: {str(e)}")
-            status["services"]["queue"] = {
-                "status": "error",
-                "error": str(e)
-            }
-            status["status"] = "degraded"
-            
-        logger.debug(f"Health check - Status: {status['status']}")
-        self.__send_response(json.dumps(status))
-    
+        snapshot = PROBER.snapshot()
+        # Liveness: only the server itself, see `src.utils.health`
+        alive = not snapshot["stale"]
+        self.__send_response(
+            json.dumps(snapshot),
+            HTTPStatus.OK if alive else HTTPStatus.SERVICE_UNAVAILABLE,
+        )
+
+    @tracer.start_as_current_span("do_GET_ready")
+    def _do_GET_ready(self, query):
+        del query
+        snapshot = PROBER.snapshot()
+        ready = snapshot["status"] == "ok" and not snapshot["stale"]
+        self.__send_response(
+            json.dumps(snapshot),
+            HTTPStatus.OK if ready else HTTPStatus.SERVICE_UNAVAILABLE,
+        )
+
+    @tracer.start_as_current_span("do_POST_optimize")
+    def _do_POST_optimize(self, query):
+        data_id = query["id"][0]
+        float32 = query.get("float32", ["0"])[0] == "1"
+        job_id = str(uuid.uuid4())
+        logger.info("Dataset optimization requested. Dataset ID: %s, float32: %s", data_id, float32)
+        QUEUE.enqueue(
+            "ml.optimize_dataset",
+            args=(data_id,),
+            kwargs={"float32": float32},
+            job_timeout=config.JOB_TIMEOUT,
+            job_id=job_id,
+            retry=_retry(),
+            result_ttl=config.PREDICT_JOB_RETENTION,
+            failure_ttl=config.FAILED_JOB_RETENTION,
+            meta=retention.track(REDIS, datasets=[data_id]),
+        )
+        logger.debug("Optimization job enqueued with ID: %s", job_id)
+        self.__send_response(json.dumps({"id": job_id}))
+
     @tracer.start_as_current_span("do_POST_fit")
     def _do_POST_fit(self, query):
-        data_id = query["id"][0]
-        data_url = MINIO.get_presigned_url("GET", "datasets", data_id)
+        data_ids = query["id"]
+        out_of_core = query.get("out_of_core", ["0"])[0] == "1"
+        deadline = _param(query, "deadline", float)
+        base_model_id = query.get("base_model_id", [None])[0]
+        replay_ids = query.get("replay_id", []) if base_model_id is not None else []
+        replay = _param(query, "replay", float, 0.0) if replay_ids else 0.0
+        iterations = _param(query, "iterations", int)
+        if out_of_core and (len(data_ids) > 1 or base_model_id is not None):
+            self.send_error(
+                HTTPStatus.BAD_REQUEST, "out_of_core needs a single dataset and no base model"
+            )
+            return
+        if not 0 <= replay <= 1:
+            self.send_error(HTTPStatus.BAD_REQUEST, "replay must be between 0 and 1")
+            return
+        if iterations is not None and iterations < 1:
+            self.send_error(HTTPStatus.BAD_REQUEST, "iterations must be positive")
+            return
+        data_urls = [MINIO.get_presigned_url("GET", "datasets", id) for id in data_ids]
         model_id = str(uuid.uuid4())
-        model_url = MINIO.get_presigned_url("PUT", "models", model_id)
-        logger.info(f"Model training requested. Dataset ID: {data_id}, Model ID: {model_id}")
-        QUEUE.enqueue(
+        kwargs = {"out_of_core": out_of_core, "model_id": model_id}
+        queue = QUEUE
+        base = None
+        if base_model_id is not None:
+            try:
+                base = MINIO.stat_object("models", base_model_id)
+            except S3Error:
+                self.send_error(HTTPStatus.NOT_FOUND, f"Unknown base model: {base_model_id}")
+                return
+            kwargs.update(
+                base_model_url=MINIO.get_presigned_url("GET", "models", base_model_id),
+                base_model_id=base_model_id,
+                iterations=iterations,
+                replay_urls=[MINIO.get_presigned_url("GET", "datasets", id) for id in replay_ids],
+                replay=replay,
+            )
+            # Preferably to a worker that has the base model in its cache
+            queue = affinity.route(QUEUE, base_model_id)
+        model_url = _model_put_url(model_id, data_ids, base_model_id, base, replay_ids)
+        logger.info(
+            "Model training requested. Dataset IDs: %s, Model ID: %s, out-of-core: %s, "
+            "base model ID: %s",
+            ", ".join(data_ids),
+            model_id,
+            out_of_core,
+            base_model_id,
+        )
+        queue.enqueue(
             "ml.fit",
-            args=(data_url, model_url),
+            args=(data_urls[0] if len(data_urls) == 1 else data_urls, model_url),
+            kwargs=kwargs,
             job_timeout=config.JOB_TIMEOUT,
             job_id=model_id,
-            retry=Retry(max=config.MAX_RETRIES),
+            retry=_retry(),
+            result_ttl=config.FIT_JOB_RETENTION,
+            failure_ttl=config.FAILED_JOB_RETENTION,
+            meta={
+                **deadline_meta(deadline),
+                **retention.track(
+                    REDIS,
+                    datasets=[*data_ids, *replay_ids],
+                    models=[] if base_model_id is None else [base_model_id],
+                ),
+            },
         )
-        logger.debug(f"Fit job enqueued with ID: {model_id}")
+        logger.debug("Fit job enqueued with ID: %s in queue %s", model_id, queue.name)
         self.__send_response(json.dumps({"id": model_id}))
 
+    @tracer.start_as_current_span("do_POST_fit_sweep")
+    def _do_POST_fit_sweep(self, query):
+        data_id = query["id"][0]
+        configs = _param(query, "configs", _sweep_configs)
+        if configs is None:
+            self.send_error(HTTPStatus.BAD_REQUEST, "Missing configs")
+            return
+        cv = _param(query, "cv", int, 0)
+        data_url = MINIO.get_presigned_url("GET", "datasets", data_id)
+        model_ids = [str(uuid.uuid4()) for _ in configs]
+        model_urls = [MINIO.get_presigned_url("PUT", "models", id) for id in model_ids]
+        sweep_id = str(uuid.uuid4())
+        scores_url = MINIO.get_presigned_url("PUT", "results", sweep_id)
+        logger.info(
+            "Sweep requested. Dataset ID: %s, Sweep ID: %s, %s configurations, %s folds",
+            data_id,
+            sweep_id,
+            len(configs),
+            cv,
+        )
+        QUEUE.enqueue(
+            "ml.fit_sweep",
+            args=(data_url, model_urls, configs, scores_url),
+            kwargs={"cv": cv},
+            job_timeout=config.JOB_TIMEOUT,
+            job_id=sweep_id,
+            retry=_retry(),
+            result_ttl=config.FIT_JOB_RETENTION,
+            failure_ttl=config.FAILED_JOB_RETENTION,
+            meta=retention.track(REDIS, datasets=[data_id]),
+        )
+        logger.debug("Sweep job enqueued with ID: %s", sweep_id)
+        self.__send_response(json.dumps({"id": sweep_id, "model_ids": model_ids}))
+
     @tracer.start_as_current_span("do_POST_predict")
     def _do_POST_predict(self, query):
+        output_format = query.get("format", ["parquet"])[0]
+        if output_format not in RESULT_FORMATS:
+            self.send_error(HTTPStatus.BAD_REQUEST, f"Unknown result format: {output_format}")
+            return
+        compression = query.get("compression", [None])[0]
+        if compression is not None and compression not in RESULT_COMPRESSIONS[output_format]:
+            self.send_error(
+                HTTPStatus.BAD_REQUEST,
+                f"Unsupported compression for {output_format} results: {compression}",
+            )
+            return
+        deadline = _param(query, "deadline", float)
+        n_shards = _param(query, "shards", int)
+        if n_shards is not None and n_shards < 1:
+            self.send_error(HTTPStatus.BAD_REQUEST, "shards must be positive")
+            return
         data_id = query["dataset_id"][0]
-        data_url = MINIO.get_presigned_url("GET", "datasets", data_id)
         model_id = query["model_id"][0]
+        result_id = str(uuid.uuid4())
+
+        try:
+            data_info = MINIO.stat_object("datasets", data_id)
+        except S3Error:
+            self.send_error(HTTPStatus.NOT_FOUND, f"Unknown dataset: {data_id}")
+            return
+        shards = [(0, None)]
+        if sharding.should_read(data_info.size, n_shards):
+            try:
+                metadata = sharding.read_metadata(
+                    MINIO, "datasets", data_id, data_info.size, data_info.version_id
+                )
+            except ValueError as e:
+                self.send_error(HTTPStatus.BAD_REQUEST, str(e))
+                return
+            shards = sharding.plan(metadata, n_shards)
+
+        if config.PREDICT_CACHE_TTL > 0:
+            # The version of the object (or its ETag, without versioning)
+            # changes when the dataset is rewritten, e.g. by `/optimize`
+            cache_key = PREDICT_CACHE_KEY.format(
+                data_id=data_id,
+                data_version=data_info.version_id or data_info.etag,
+                model_id=model_id,
+                output_format=output_format,
+                compression=compression,
+            )
+            entry = result_id if deadline is None else f"{result_id} deadline"
+            cached_id = _cached_prediction(cache_key)
+            if cached_id is None and not REDIS.set(
+                cache_key, entry, nx=True, ex=config.PREDICT_CACHE_TTL
+            ):
+                # A concurrent request for the same prediction got there first
+                # (or a request with a deadline whose job is not finished: this
+                # prediction is not cached)
+                cached_id = _cached_prediction(cache_key)
+            if cached_id is not None:
+                logger.info(
+                    "Prediction requested. Dataset ID: %s, Model ID: %s, reusing Result ID: %s",
+                    data_id,
+                    model_id,
+                    cached_id,
+                )
+                self.__send_response(json.dumps({"id": cached_id, "shared": True}))
+                return
+            model_key = MODEL_PREDICTIONS_KEY.format(model_id=model_id)
+            with REDIS.pipeline() as pipeline:
+                pipeline.sadd(model_key, cache_key)
+                pipeline.expire(model_key, config.PREDICT_CACHE_TTL)
+                pipeline.execute()
+
+        # The shards are planned with the footer of this version of the dataset:
+        # it must not change under them if the dataset is rewritten meanwhile
+        data_url = MINIO.get_presigned_url(
+            "GET", "datasets", data_id, version_id=data_info.version_id
+        )
         model_url = MINIO.get_presigned_url("GET", "models", model_id)
+        result_url = MINIO.get_presigned_url("PUT", "results", result_id)
+        logger.info(
+            "Prediction requested. Dataset ID: %s, Model ID: %s, Result ID: %s",
+            data_id,
+            model_id,
+            result_id,
+        )
+        kwargs = {"model_id": model_id, "output_format": output_format, "compression": compression}
+        options = {
+            "job_timeout": config.JOB_TIMEOUT,
+            "retry": _retry(),
+            # Keep the finished job as long as it can be returned from the cache
+            "result_ttl": max(config.PREDICT_CACHE_TTL, config.PREDICT_JOB_RETENTION),
+            "failure_ttl": config.FAILED_JOB_RETENTION,
+        }
+        meta = deadline_meta(deadline)
+
+        def enqueue_predict(job_id, url, **extra_kwargs):
+            # Preferably to a worker that has the model in its cache
+            return affinity.route(QUEUE, model_id).enqueue(
+                "ml.predict",
+                args=(data_url, model_url, url),
+                kwargs={**kwargs, **extra_kwargs},
+                job_id=job_id,
+                meta={**meta, **retention.track(REDIS, datasets=[data_id], models=[model_id])},
+                **options,
+            )
+
+        try:
+            if len(shards) == 1:
+                enqueue_predict(result_id, result_url)
+            else:
+                shard_ids = [f"{result_id}-{i}" for i in range(len(shards))]
+                shard_jobs = [
+                    enqueue_predict(id, MINIO.get_presigned_url("PUT", "results", id), rows=rows)
+                    for id, rows in zip(shard_ids, shards)
+                ]
+                QUEUE.enqueue(
+                    "ml.gather_shards",
+                    kwargs={"output_format": output_format},
+                    depends_on=shard_jobs,
+                    job_id=result_id,
+                    meta={**meta, "shards": shard_ids},
+                    **options,
+                )
+        except Exception:
+            if config.PREDICT_CACHE_TTL > 0:
+                REDIS.delete(cache_key)
+            raise
+        logger.debug("Predict job enqueued with ID: %s, in %s shards", result_id, len(shards))
+        self.__send_response(json.dumps({"id": result_id}))
+
+    @tracer.start_as_current_span("do_DELETE_model")
+    def _do_DELETE_model(self, query):
+        model_id = query["id"][0]
+        logger.info("Model deletion requested. Model ID: %s", model_id)
+        MINIO.remove_object("models", model_id)
+        model_key = MODEL_PREDICTIONS_KEY.format(model_id=model_id)
+        cache_keys = REDIS.smembers(model_key)
+        REDIS.delete(model_key, *cache_keys)
+        affinity.forget_model(QUEUE, model_id)
+        logger.debug("Forgot %s cached predictions of model %s", len(cache_keys), model_id)
+        self.__send_response(json.dumps({"id": model_id}))
+
+    @tracer.start_as_current_span("do_POST_cancel")
+    def _do_POST_cancel(self, query):
+        job_id = query["id"][0]
+        job = Job.fetch(job_id, connection=REDIS)
+        status = job.get_status()
+        logger.info("Cancellation requested. Job ID: %s, status: %s", job_id, status)
+        if not _cancel_or_stop(job):
+            self.send_error(HTTPStatus.BAD_REQUEST, f"Cannot cancel job with status {status}")
+            return
+        # The shards of a sharded prediction, which its job waits for
+        for shard in Job.fetch_many(job.meta.get("shards", []), connection=REDIS):
+            if shard is not None:
+                _cancel_or_stop(shard)
+        self.__send_response(json.dumps({"id": job_id, "status": job.get_status()}))
+
+    @tracer.start_as_current_span("do_POST_pipeline")
+    def _do_POST_pipeline(self, query):
+        train_id = query["train_id"][0]
+        test_id = query["test_id"][0]
+        deadline = _param(query, "deadline", float)
+        train_url = MINIO.get_presigned_url("GET", "datasets", train_id)
+        test_url = MINIO.get_presigned_url("GET", "datasets", test_id)
+        model_id = str(uuid.uuid4())
+        model_put_url = _model_put_url(model_id, [train_id])
+        model_get_url = MINIO.get_presigned_url("GET", "models", model_id)
         result_id = str(uuid.uuid4())
         result_url = MINIO.get_presigned_url("PUT", "results", result_id)
-        logger.info(f"Prediction requested. Dataset ID: {data_id}, Model ID: {model_id}, Result ID: {result_id}")
+        logger.info(
+            "Pipeline requested. Train dataset ID: %s, Test dataset ID: %s, "
+            "Model ID: %s, Result ID: %s",
+            train_id,
+            test_id,
+            model_id,
+            result_id,
+        )
+        # A single job, so that the prediction gets the model from memory
         QUEUE.enqueue(
-            "ml.predict",
-            args=(data_url, model_url, result_url),
+            "ml.pipeline",
+            args=(train_url, model_put_url, test_url, model_get_url, result_url, model_id),
             job_timeout=config.JOB_TIMEOUT,
             job_id=result_id,
-            retry=Retry(max=config.MAX_RETRIES),
+            retry=_retry(),
+            result_ttl=config.PREDICT_JOB_RETENTION,
+            failure_ttl=config.FAILED_JOB_RETENTION,
+            meta={
+                **deadline_meta(deadline),
+                **retention.track(REDIS, datasets=[train_id, test_id]),
+            },
         )
-        logger.debug(f"Predict job enqueued with ID: {result_id}")
-        self.__send_response(json.dumps({"id": result_id}))
+        logger.debug("Pipeline job enqueued with ID: %s, Model ID: %s", result_id, model_id)
+        self.__send_response(json.dumps({"model_id": model_id, "id": result_id}))
 
 
 if __name__ == "__main__":
@@ -220,20 +754,47 @@ if __name__ == "__main__":
     args = parser.parse_args()
 
     HOST, PORT = config.SERVER_HOST, config.SERVER_PORT or args.port
-    
+
     # Get MinIO client from config
     MINIO = config.get_minio_client()
-    
+
     all_buckets = [bucket.name for bucket in MINIO.list_buckets()]
     for bucket in ["datasets", "models", "results"]:
         if bucket not in all_buckets:
-            logger.info(f"Creating bucket: {bucket}")
+            logger.info("Creating bucket: %s", bucket)
             MINIO.make_bucket(bucket)
+    # A rewritten dataset (see `ml.optimize_dataset`) is a new version of its
+    # object: the jobs given a URL to the previous one keep reading it until
+    # it expires
+    MINIO.set_bucket_versioning("datasets", VersioningConfig(ENABLED))
+    MINIO.set_bucket_lifecycle(
+        "datasets",
+        LifecycleConfig(
+            [
+                Rule(
+                    ENABLED,
+                    rule_filter=Filter(prefix=""),
+                    rule_id="expire-previous-versions",
+                    noncurrent_version_expiration=NoncurrentVersionExpiration(
+                        noncurrent_days=config.DATASET_VERSION_DAYS
+                    ),
+                    expiration=Expiration(expired_object_delete_marker=True),
+                )
+            ]
+        ),
+    )
 
     REDIS = config.get_redis_connection()
     QUEUE = Queue(config.QUEUE_NAME, connection=REDIS)
 
-    logger.info(f"Server starting at {HOST}:{PORT}")
+    # Remove the objects and jobs whose retention has expired
+    threading.Thread(target=retention.run, args=(MINIO, QUEUE), daemon=True).start()
+
+    # Check Redis and MinIO in the background for `/health` and `/ready`
+    PROBER = Prober(MINIO, QUEUE)
+    threading.Thread(target=PROBER.run, daemon=True).start()
+
+    logger.info("Server starting at %s:%s", HOST, PORT)
 
     with ThreadingHTTPServer((HOST, PORT), Handler) as server:
         try:
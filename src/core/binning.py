@@ -0,0 +1,386 @@
+"""
+Feature binning done ahead of `HistGradientBoostingClassifier`.
+
+`HistGradientBoostingClassifier` bins its input into at most 255 quantile
+bins per feature before growing any tree, and keeps a float64 copy of the
+input while doing so. Binning the data beforehand with `Binner` allows:
+
+- training several models on the same data while binning it only once,
+- training on a uint8 matrix built row group by row group from a parquet file
+  (`bin_parquet`), with bin thresholds computed in one streaming pass with
+  `QuantileSketch`, so that the float64 matrix is never materialized.
+
+`PreBinnedHistGradientBoostingClassifier` is trained on the binned data and
+predicts on raw data like a regular `HistGradientBoostingClassifier`. It can
+also continue the training of a fitted model on new data (`warm_start_from`),
+which `HistGradientBoostingClassifier` only supports on the data of its first
+fit: it bins the new data with new thresholds, which the existing trees do not
+use.
+
+`PreBinnedHistGradientBoostingClassifier` overrides private methods of
+`HistGradientBoostingClassifier`, which may change in any release of
+scikit-learn: it refuses to fit with another version than the one it was
+tested with (`SKLEARN_VERSION`, pinned in requirements.txt).
+"""
+
+import copy
+
+import numpy as np
+import polars as pl
+import pyarrow.parquet as pq
+import sklearn
+from sklearn.base import BaseEstimator, TransformerMixin
+from sklearn.ensemble import HistGradientBoostingClassifier
+from sklearn.utils.multiclass import check_classification_targets
+from sklearn.utils.validation import validate_data
+
+
+# Minor version of scikit-learn whose private methods
+# `PreBinnedHistGradientBoostingClassifier` overrides
+SKLEARN_VERSION = "1.7"
+
+# The largest threshold, as in scikit-learn: +inf thresholds would send the
+# missing values with the infinite ones
+_ALMOST_INF = 1e300
+
+
+def _check_sklearn_version():
+    # Not a RuntimeError, which the workers retry (see `src.core.worker`)
+    version = ".".join(sklearn.__version__.split(".")[:2])
+    if version != SKLEARN_VERSION:
+        raise ImportError(
+            f"PreBinnedHistGradientBoostingClassifier requires scikit-learn {SKLEARN_VERSION}.x, "
+            f"not {sklearn.__version__}: it overrides private methods of "
+            "HistGradientBoostingClassifier"
+        )
+
+
+def _thresholds(distinct, quantiles, max_bins):
+    """Bin thresholds given the distinct values of a feature (or None if there
+    are more than `max_bins` of them) and a function returning its quantiles."""
+    if distinct is not None:
+        thresholds = (distinct[:-1] + distinct[1:]) / 2
+    else:
+        thresholds = quantiles(np.linspace(0, 100, max_bins + 1)[1:-1])
+    return np.unique(np.minimum(thresholds, _ALMOST_INF))
+
+
+class Binner(TransformerMixin, BaseEstimator):
+    """
+    Map each feature to uint8 quantile bin indices.
+
+    Parameters
+    ----------
+    max_bins : int
+        Maximum number of bins for the non-missing values of a feature, at
+        most 255. Missing values are mapped to the extra bin `max_bins`.
+    subsample : int
+        Number of rows used to compute the quantiles in `fit`.
+    random_state : int
+        Seed of the subsampling.
+
+    Attributes
+    ----------
+    bin_thresholds_ : list of ndarray
+        For each feature, the upper (inclusive) bound of each bin but the last.
+    columns_ : list of str or None
+        Column names seen in `fit` when it was given a polars DataFrame. They
+        are used to select and order the columns in `transform`.
+    """
+
+    def __init__(self, max_bins=255, subsample=200_000, random_state=0):
+        self.max_bins = max_bins
+        self.subsample = subsample
+        self.random_state = random_state
+
+    def fit(self, X, y=None):
+        del y
+        X = self._to_numpy(X, reset=True)
+        if X.shape[0] > self.subsample:
+            rng = np.random.default_rng(self.random_state)
+            X = X[rng.choice(X.shape[0], self.subsample, replace=False)]
+        self.bin_thresholds_ = []
+        for col in X.T:
+            col = col[~np.isnan(col)]
+            distinct = np.unique(col)
+            if len(distinct) > self.max_bins:
+                distinct = None
+            thresholds = _thresholds(
+                distinct,
+                lambda q, col=col: np.percentile(col, q, method="midpoint"),
+                self.max_bins,
+            )
+            self.bin_thresholds_.append(thresholds)
+        return self
+
+    @classmethod
+    def from_thresholds(cls, bin_thresholds, columns=None, max_bins=255):
+        """Build a fitted `Binner` from precomputed bin thresholds."""
+        binner = cls(max_bins=max_bins)
+        binner.bin_thresholds_ = [np.asarray(t, dtype=np.float64) for t in bin_thresholds]
+        binner.columns_ = None if columns is None else list(columns)
+        return binner
+
+    def transform(self, X):
+        X = self._to_numpy(X)
+        binned = np.empty(X.shape, dtype=np.uint8, order="F")
+        for i, thresholds in enumerate(self.bin_thresholds_):
+            col = X[:, i]
+            binned[:, i] = np.searchsorted(thresholds, col, side="left")
+            binned[np.isnan(col), i] = self.max_bins
+        return binned
+
+    def _to_numpy(self, X, reset=False):
+        if isinstance(X, pl.DataFrame):
+            if reset:
+                self.columns_ = X.columns
+            elif self.columns_ is not None:
+                X = X.select(self.columns_)
+            return X.to_numpy().astype(np.float64, copy=False)
+        if reset:
+            self.columns_ = None
+        return np.asarray(X, dtype=np.float64)
+
+    def __sklearn_is_fitted__(self):
+        return hasattr(self, "bin_thresholds_")
+
+    @classmethod
+    def from_model(cls, model):
+        """The `Binner` that bins data like the fitted `HistGradientBoostingClassifier`
+        `model` did during its training."""
+        if model.is_categorical_ is not None and model.is_categorical_.any():
+            raise ValueError("Models with categorical features are not supported")
+        columns = getattr(model, "feature_names_in_", None)
+        return cls.from_thresholds(
+            model._bin_mapper.bin_thresholds_,
+            None if columns is None else list(columns),
+            max_bins=model.max_bins,
+        )
+
+
+class QuantileSketch:
+    """
+    Mergeable summary of the values of a feature, to compute approximate
+    quantiles in one pass over data that does not fit in memory.
+
+    The summary is a stack of levels of sorted values, where each value of
+    level `h` stands for `2 ** h` values of the data (a deterministic variant
+    of the KLL sketch). When a level holds more than `size` values, every
+    other value is promoted to the next level. Each compaction of level `h`
+    shifts the ranks by at most `2 ** h`, so the rank error of the quantiles
+    is of the order of `log2(n / size) / size` for `n` values, however many
+    sketches were merged.
+
+    Parameters
+    ----------
+    size : int
+        Maximum number of values kept per level.
+    max_distinct : int
+        The distinct values are tracked exactly as long as there are at most
+        that many of them.
+    """
+
+    def __init__(self, size=4096, max_distinct=255):
+        self.size = size
+        self.max_distinct = max_distinct
+        self.levels = []
+        self.distinct = np.empty(0, dtype=np.float64)
+        # Alternates the values promoted by compactions, which cancels out
+        # their errors instead of always favoring the smallest values
+        self._offset = 0
+
+    def update(self, values):
+        """Add the (non-missing) `values` to the summary."""
+        values = np.asarray(values, dtype=np.float64)
+        values = values[~np.isnan(values)]
+        other = QuantileSketch(self.size, self.max_distinct)
+        other.levels = [values]
+        other.distinct = np.unique(values) if self.distinct is not None else None
+        return self.merge(other)
+
+    def merge(self, other):
+        """Merge the summary `other` into this one."""
+        if self.distinct is None or other.distinct is None:
+            self.distinct = None
+        else:
+            self.distinct = np.union1d(self.distinct, other.distinct)
+            if len(self.distinct) > self.max_distinct:
+                self.distinct = None
+        for h, values in enumerate(other.levels):
+            if h == len(self.levels):
+                self.levels.append(np.empty(0, dtype=np.float64))
+            self.levels[h] = np.concatenate([self.levels[h], values])
+        self._compress()
+        return self
+
+    def _compress(self):
+        h = 0
+        while h < len(self.levels):
+            level = self.levels[h]
+            if len(level) > self.size:
+                level = np.sort(level)
+                # An odd value out stays at this level
+                kept, level = level[len(level) % 2 :], level[: len(level) % 2]
+                if h + 1 == len(self.levels):
+                    self.levels.append(np.empty(0, dtype=np.float64))
+                self.levels[h + 1] = np.concatenate([self.levels[h + 1], kept[self._offset :: 2]])
+                self.levels[h] = level
+                self._offset ^= 1
+            h += 1
+
+    def quantiles(self, percentiles):
+        """Approximate quantiles, for `percentiles` in [0, 100]."""
+        if not any(len(level) for level in self.levels):
+            return np.empty(0)
+        values = np.concatenate(self.levels)
+        weights = np.concatenate(
+            [np.full(len(level), 2.0**h) for h, level in enumerate(self.levels)]
+        )
+        order = np.argsort(values, kind="stable")
+        values, weights = values[order], weights[order]
+        cum = np.cumsum(weights) - weights / 2
+        return np.interp(np.asarray(percentiles) / 100 * weights.sum(), cum, values)
+
+    def thresholds(self, max_bins=255):
+        """Bin thresholds of the feature, as computed by `Binner.fit`."""
+        return _thresholds(self.distinct, self.quantiles, max_bins)
+
+
+def bin_parquet(path, target="y", max_bins=255):
+    """
+    Bin the features of a parquet file without loading it all in memory.
+
+    A first pass over the row groups computes the bin thresholds of each
+    feature with a `QuantileSketch`; a second pass bins each row group into
+    the preallocated uint8 matrix. Only one row group is decoded at a time.
+
+    Parameters
+    ----------
+    path : str or Path
+        The parquet file.
+    target : str
+        Name of the column that contains the targets.
+    max_bins : int
+        Maximum number of bins per feature, see `Binner`.
+
+    Returns
+    -------
+    binner : Binner
+        The fitted binner, e.g. for `PreBinnedHistGradientBoostingClassifier`.
+    X_binned : ndarray of shape (n_samples, n_features), dtype uint8
+        The binned features.
+    y : ndarray of shape (n_samples,)
+        The targets.
+    """
+    file = pq.ParquetFile(path)
+    columns = [name for name in file.schema_arrow.names if name != target]
+    if len(columns) == len(file.schema_arrow.names):
+        raise ValueError(f"Training data must contain a '{target}' column with target values")
+
+    sketches = [QuantileSketch(max_distinct=max_bins) for _ in columns]
+    for i in range(file.num_row_groups):
+        group = pl.from_arrow(file.read_row_group(i, columns=columns))
+        for sketch, name in zip(sketches, columns):
+            sketch.update(group[name].to_numpy())
+    binner = Binner.from_thresholds(
+        [sketch.thresholds(max_bins) for sketch in sketches], columns, max_bins=max_bins
+    )
+
+    n_samples = file.metadata.num_rows
+    X_binned = np.empty((n_samples, len(columns)), dtype=np.uint8, order="F")
+    y = None
+    start = 0
+    for i in range(file.num_row_groups):
+        group = pl.from_arrow(file.read_row_group(i))
+        stop = start + len(group)
+        X_binned[start:stop] = binner.transform(group.drop(target))
+        target_values = group[target].to_numpy()
+        if y is None:
+            y = np.empty(n_samples, dtype=target_values.dtype)
+        y[start:stop] = target_values
+        start = stop
+    if y is None:
+        y = np.empty(0)
+    return binner, X_binned, y
+
+
+class PreBinnedHistGradientBoostingClassifier(HistGradientBoostingClassifier):
+    """
+    `HistGradientBoostingClassifier` trained on data binned by a `Binner`.
+
+    `fit` takes the uint8 bin indices produced by `binner` and uses them as
+    they are, instead of converting them to float64 and binning them again.
+    The fitted model predicts on raw (unbinned) data, exactly like a
+    `HistGradientBoostingClassifier`. Categorical features are not supported.
+    """
+
+    def fit(self, X, y, binner, sample_weight=None):
+        """
+        Fit the model on the bin indices `X`, as returned by `binner`.
+
+        `binner.max_bins` must be equal to `max_bins`.
+        """
+        _check_sklearn_version()
+        if binner.max_bins != self.max_bins:
+            raise ValueError(
+                f"The binner has max_bins={binner.max_bins} but the model {self.max_bins}"
+            )
+        self._binner = binner
+        try:
+            return super().fit(X, y, sample_weight=sample_weight)
+        finally:
+            del self._binner
+
+    @classmethod
+    def warm_start_from(cls, model, n_iter):
+        """
+        A copy of the fitted `model` whose `fit` adds `n_iter` boosting
+        iterations to its trees, trained on data binned by `Binner.from_model(model)`.
+
+        The new data must only have classes that `model` knows.
+        """
+        warm = cls(**model.get_params())
+        warm.__dict__.update(copy.deepcopy(model.__dict__))
+        warm.set_params(warm_start=True, max_iter=model.n_iter_ + n_iter)
+        return warm
+
+    def _encode_y(self, y):
+        if not (self.warm_start and self._is_fitted()):
+            return super()._encode_y(y)
+        # The trees already grown are for the classes of the first fit, which
+        # the new targets may not all have
+        check_classification_targets(y)
+        return self._label_encoder.transform(y).astype(np.float64, copy=False)
+
+    def predict_binned(self, X_binned):
+        """Predict the classes of data already binned by the `Binner` used in `fit`."""
+        _check_sklearn_version()
+        # `_raw_predict` skips the validation and binning of X during `fit`
+        self._in_fit = True
+        try:
+            return self.predict(np.ascontiguousarray(X_binned, dtype=np.uint8))
+        finally:
+            del self._in_fit
+
+    def _preprocess_X(self, X, *, reset):
+        if not reset:
+            return super()._preprocess_X(X, reset=False)
+        self.is_categorical_ = None
+        self._preprocessor = None
+        self._is_categorical_remapped = None
+        X = validate_data(self, X, dtype=np.uint8, order="F")
+        if self._binner.columns_ is not None:
+            self.feature_names_in_ = np.asarray(self._binner.columns_, dtype=object)
+        return X, None
+
+    def _bin_data(self, X, is_training_data):
+        if not is_training_data:
+            return np.ascontiguousarray(X, dtype=np.uint8)
+        mapper = self._bin_mapper
+        mapper.bin_thresholds_ = self._binner.bin_thresholds_
+        mapper.n_bins_non_missing_ = np.array(
+            [len(t) + 1 for t in mapper.bin_thresholds_], dtype=np.uint32
+        )
+        mapper.missing_values_bin_idx_ = mapper.n_bins - 1
+        mapper.is_categorical_ = np.zeros(X.shape[1], dtype=np.uint8)
+        return np.asfortranarray(X, dtype=np.uint8)
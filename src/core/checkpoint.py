@@ -0,0 +1,114 @@
+"""
+Checkpoints for the stages (download, train/predict, upload) of a job, so
+that a retried job resumes at the stage that failed instead of starting over.
+
+The artifacts produced by a stage are kept in `config.CACHE_DIR/<job ID>/`,
+which may be local to the worker or shared between workers. The stages that
+completed are recorded in `job.meta["stages"]`. A stage is only skipped if its
+artifacts can be found, so a retry that lands on a worker which cannot see
+them simply runs the stage again.
+
+A job that is retried on another worker leaves its artifacts on the first one,
+where nothing clears them: the workers remove the artifacts of the jobs that
+no longer need them with `sweep`.
+"""
+
+import shutil
+import tempfile
+import time
+from pathlib import Path
+
+from rq import get_current_job
+from rq.job import Job, JobStatus
+from rq.utils import parse_timeout
+
+import src.utils.config as config
+from src.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+class Checkpoint:
+    """
+    Stage checkpoints of an RQ job.
+
+    Parameters
+    ----------
+    job : rq.job.Job, optional
+        The job whose stages are checkpointed. Defaults to the job currently
+        being performed. Outside of a job, artifacts go to a temporary
+        directory and nothing is resumed.
+    """
+
+    def __init__(self, job=None):
+        self.job = job if job is not None else get_current_job()
+        if self.job is None:
+            self.dir = Path(tempfile.mkdtemp(prefix="neuralk-"))
+        else:
+            self.dir = Path(config.CACHE_DIR) / self.job.id
+            self.dir.mkdir(parents=True, exist_ok=True)
+
+    def path(self, name):
+        """Path of the artifact `name` in the cache."""
+        return self.dir / name
+
+    def done(self, stage, *artifacts):
+        """Whether `stage` completed and all of its `artifacts` are available."""
+        if self.job is None or stage not in self.job.meta.get("stages", []):
+            return False
+        if not all(self.path(name).exists() for name in artifacts):
+            logger.info(
+                "Job %s: artifacts of stage '%s' not found, running it again", self.job.id, stage
+            )
+            return False
+        logger.info("Job %s: resuming after completed stage '%s'", self.job.id, stage)
+        return True
+
+    def complete(self, stage):
+        """Record that `stage` completed."""
+        if self.job is None:
+            return
+        stages = self.job.meta.setdefault("stages", [])
+        if stage not in stages:
+            stages.append(stage)
+        self.job.save_meta()
+        logger.debug("Job %s: stage '%s' completed", self.job.id, stage)
+
+    def clear(self):
+        """Remove the artifacts, once the job no longer needs them."""
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+
+# Statuses of the jobs that may still use their artifacts
+_ACTIVE = (JobStatus.QUEUED, JobStatus.STARTED, JobStatus.SCHEDULED, JobStatus.DEFERRED)
+
+
+def sweep(connection):
+    """
+    Remove the artifacts in `CACHE_DIR` of the jobs that are no longer queued
+    or started (or waiting for a retry or for the jobs they depend on), and of
+    those older than `JOB_TIMEOUT` x (`MAX_RETRIES` + 1), whatever their job.
+
+    Returns the IDs of the jobs whose artifacts were removed.
+    """
+    root = Path(config.CACHE_DIR)
+    if not root.is_dir():
+        return []
+    paths = [path for path in root.iterdir() if path.is_dir()]
+    if not paths:
+        return []
+    max_age = parse_timeout(config.JOB_TIMEOUT) * (config.MAX_RETRIES + 1)
+    jobs = Job.fetch_many([path.name for path in paths], connection=connection)
+    removed = []
+    for path, job in zip(paths, jobs):
+        try:
+            age = time.time() - path.stat().st_mtime
+        except FileNotFoundError:
+            continue  # Cleared meanwhile
+        if job is not None and job.get_status(refresh=False) in _ACTIVE and age < max_age:
+            continue
+        shutil.rmtree(path, ignore_errors=True)
+        removed.append(path.name)
+    if removed:
+        logger.info("Removed the artifacts of %s finished or abandoned jobs", len(removed))
+    return removed
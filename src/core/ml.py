@@ -1,21 +1,32 @@
 """
-The 2 functions that perform the toy Machine-Learning (ML) tasks:
+The functions that perform the toy Machine-Learning (ML) tasks:
 
 - `fit` fits a model and stores it.
 - `predict` uses a fitted model to perform a prediction.
+- `pipeline` fits a model and performs a prediction with it, in one job.
+- `fit_sweep` fits one model per hyperparameter configuration on the same data
+  and stores them with a table of their scores.
+- `optimize_dataset` rewrites an uploaded dataset in a layout that is faster
+  to download and read.
+
+The heavy dependencies of the tasks (scikit-learn, polars, ...) are imported
+by the functions that use them, so that importing this module is fast. Workers
+import them once with `warm_up` before taking jobs (see `WORKER_PRELOAD`).
 """
 
+import importlib
+import json
 import os
-import io
+import shutil
 import time
 
 import numpy as np
-from sklearn.ensemble import HistGradientBoostingClassifier
-import polars as pl
-import cloudpickle
-import requests
 
+import src.core.model_cache as model_cache
 import src.utils.config as config
+import src.utils.shards as sharding
+from src.core.checkpoint import Checkpoint
+from src.utils.formats import RESULT_COMPRESSIONS, RESULT_FORMATS
 from src.utils.logger import get_logger
 from opentelemetry import trace
 
@@ -26,6 +37,153 @@ logger = get_logger(__name__)
 _TIMEOUT = float(os.environ.get("REQUEST_TIMEOUT", "3.05"))
 os.environ["no_proxy"] = "*"
 
+# Models fitted by this process, by model ID. The `predict` of a `pipeline`,
+# which runs in the same work-horse as its `fit`, takes the model from here
+# instead of downloading and unpickling it.
+_FITTED = {}
+
+# Modules imported lazily by the tasks
+_LAZY_IMPORTS = (
+    "cloudpickle",
+    "joblib",
+    "polars",
+    "pyarrow.compute",
+    "pyarrow.parquet",
+    "requests",
+    "sklearn.ensemble",
+    "sklearn.model_selection",
+    "src.core.binning",
+)
+
+
+def warm_up():
+    """
+    Import the modules that the tasks import lazily.
+
+    Workers call it before taking jobs, so that the work-horses forked for the
+    jobs inherit the modules instead of importing them for every job. It only
+    imports: running e.g. a fit would start OpenMP threads, which do not
+    survive the fork.
+    """
+    for name in _LAZY_IMPORTS:
+        importlib.import_module(name)
+
+
+def _download(url, path, what):
+    """Stream the object at `url` (described by `what` in errors) to `path`,
+    and return its ETag."""
+    import requests
+
+    with requests.get(url, stream=True, timeout=_TIMEOUT) as resp:
+        if resp.status_code != 200:
+            logger.error("Failed to download %s. Status code: %s", what, resp.status_code)
+            raise RuntimeError(f"Failed to download {what}: {resp.status_code}")
+        with open(path, "wb") as f:
+            shutil.copyfileobj(resp.raw, f)
+        return resp.headers.get("ETag")
+
+
+def _upload(url, data, what):
+    """Upload the bytes `data` (described by `what` in errors) to `url`, and
+    return the ETag of the object."""
+    import requests
+
+    response = requests.put(url, data=data, timeout=_TIMEOUT)
+    if response.status_code != 200:
+        logger.error("Failed to upload %s. Status code: %s", what, response.status_code)
+        raise RuntimeError(f"Failed to upload {what}: {response.status_code}")
+    return response.headers.get("ETag")
+
+
+def _read_range(url, offset, length, what):
+    """`length` bytes of the object at `url` (described by `what` in errors)
+    from byte `offset`, and the size of the object."""
+    import requests
+
+    headers = {"Range": f"bytes={offset}-{offset + length - 1}"}
+    with requests.get(url, headers=headers, timeout=_TIMEOUT) as resp:
+        if resp.status_code != 206:
+            logger.error("Failed to download %s. Status code: %s", what, resp.status_code)
+            raise RuntimeError(f"Failed to download {what}: {resp.status_code}")
+        # e.g. "bytes 0-7/1234"
+        size = int(resp.headers["Content-Range"].rpartition("/")[2])
+        return resp.content, size
+
+
+def _download_rows(url, path, offset, length):
+    """Write `length` rows of the parquet file at `url`, from row `offset`, to
+    `path`. Only the footer and the row groups that hold them are downloaded,
+    with range requests (see `src.utils.shards`)."""
+    import pyarrow.parquet as pq
+
+    def read_range(start, size):
+        return _read_range(url, start, size, "test data")[0]
+
+    _, size = _read_range(url, 0, 1, "test data")
+    try:
+        footer = sharding.read_footer(read_range, size, "test data")
+        metadata = sharding.parse_footer(footer)
+    except ValueError as e:
+        raise RuntimeError(f"Failed to download test data: {e}") from e
+    row_groups, first_row, start, end = sharding.byte_range(metadata, offset, length)
+    logger.debug("Downloading row groups %s (bytes %s to %s of %s)", row_groups, start, end, size)
+    # A sparse file of the size of the dataset, in which only the row groups
+    # and the footer are written, reads as the dataset itself
+    sparse_path = path.with_name(path.name + ".sparse")
+    with open(sparse_path, "wb") as f:
+        f.write(b"PAR1")
+        if end > start:
+            f.seek(start)
+            f.write(read_range(start, end - start))
+        f.seek(size - len(footer))
+        f.write(footer)
+    table = pq.ParquetFile(sparse_path).read_row_groups(row_groups)
+    pq.write_table(table.slice(offset - first_row, length), path)
+    sparse_path.unlink()
+
+
+def _cached_model_data(model_id, model_url):
+    """The serialized model `model_id` from the model cache of the worker, if
+    it is there and still the object at `model_url`, else None."""
+    import requests
+
+    cached = model_cache.get(model_id)
+    if cached is None:
+        return None
+    path, etag = cached
+    # Only the first byte: the ETag tells whether the object (which may have
+    # been deleted) is the cached one
+    headers = {"Range": "bytes=0-0"}
+    with requests.get(model_url, headers=headers, stream=True, timeout=_TIMEOUT) as resp:
+        if resp.status_code not in (200, 206) or resp.headers.get("ETag") != etag:
+            return None
+    try:
+        return path.read_bytes()
+    except FileNotFoundError:
+        return None  # Evicted by another work-horse
+
+
+def _write_result(pred, path, output_format, compression=None):
+    """Write the DataFrame of predictions `pred` to `path` in `output_format`."""
+    if output_format not in RESULT_FORMATS:
+        raise ValueError(
+            f"Unknown result format {output_format!r}, expected one of {RESULT_FORMATS}"
+        )
+    if compression is not None and compression not in RESULT_COMPRESSIONS[output_format]:
+        raise ValueError(f"Unsupported compression for {output_format} results: {compression!r}")
+    if output_format == "parquet":
+        pred.write_parquet(path, compression=compression or "zstd")
+    elif output_format == "arrow":
+        pred.write_ipc(path, compression=compression or "uncompressed")
+    elif output_format == "numpy":
+        values = pred["y"].to_numpy()
+        if values.dtype == object:
+            # e.g. string labels: `np.save` would pickle them, and the client
+            # could not read the array without unpickling it
+            values = values.astype(str)
+        with open(path, "wb") as f:
+            np.save(f, values.astype(values.dtype.newbyteorder("<"), copy=False))
+
 
 def _error_maybe():
     """Simulate random errors in the system."""
@@ -34,62 +192,194 @@ def _error_maybe():
         logger.warning("Simulating a random error in the system")
         raise RuntimeError("Something unexpected went wrong")
 
+
+def _load_model(model_id, model_url, checkpoint, name):
+    """The model `model_id` from the model cache of the worker if it is there,
+    else downloaded from `model_url` to the artifact `name` of `checkpoint` and
+    added to the cache, and where it came from ("cache" or "download")."""
+    import cloudpickle
+
+    if (model_data := _cached_model_data(model_id, model_url)) is not None:
+        logger.debug("Using model %s from the model cache", model_id)
+        return cloudpickle.loads(model_data), "cache"
+    model_path = checkpoint.path(name)
+    stage = "download_" + name.removesuffix(".pkl")
+    if not checkpoint.done(stage, name):
+        logger.debug("Downloading model")
+        model_start = time.time()
+        etag = _download(model_url, model_path, "model")
+        model_cache.put(model_id, model_path, etag)
+        checkpoint.complete(stage)
+        model_time = time.time() - model_start
+        logger.debug("Downloaded model in %.2fs", model_time)
+    return cloudpickle.loads(model_path.read_bytes()), "download"
+
+
 @tracer.start_as_current_span("fit")
-def fit(data_url, model_url):
+def fit(
+    data_url,
+    model_url,
+    model_id=None,
+    out_of_core=False,
+    base_model_url=None,
+    base_model_id=None,
+    iterations=None,
+    replay_urls=(),
+    replay=0.0,
+):
     """
     Fit a gradient boosting model.
 
     Parameters
     ----------
-    data_url : str
-        url from which the training data can be downloaded as a parquet file.
-        It must have a column named 'y' that contains the targets.
+    data_url : str or list of str
+        url from which the training data can be downloaded as a parquet file,
+        or urls of several parquet files with the same columns. It must have a
+        column named 'y' that contains the targets.
     model_url : str
         url where the serialized model can be uploaded (as a cloudpickle file).
+    model_id : str, optional
+        If given, the fitted model is also kept in memory under this ID so
+        that a dependent `predict` running in the same process can use it,
+        and in the model cache of the worker for the later predictions.
+    out_of_core : bool
+        If True, the training data is binned row group by row group into a
+        uint8 matrix (see `binning.bin_parquet`) and the model trained on it,
+        so that the full float64 matrix is never held in memory. Only for a
+        single file and no base model.
+    base_model_url : str, optional
+        url from which a fitted model can be downloaded. If given, the model
+        is not trained from scratch: `iterations` boosting iterations are added
+        to the base model, trained on the training data only (see
+        `PreBinnedHistGradientBoostingClassifier.warm_start_from`), so that
+        the training takes time in proportion to the new data.
+    base_model_id : str, optional
+        ID of the base model, to look it up in the model cache of the worker.
+    iterations : int, optional
+        Boosting iterations added to the base model (default
+        `WARM_START_ITERATIONS`). Early stopping may add fewer.
+    replay_urls : list of str
+        urls of parquet files (e.g. the data the base model was trained on)
+        of which a fraction `replay` of the rows, drawn at random, is added to
+        the training data.
+    replay : float
+        Fraction of the rows of `replay_urls` added to the training data.
     """
-    logger.info(f"Starting model training. Data URL: {data_url}")
+    import cloudpickle
+    import polars as pl
+    from sklearn.ensemble import HistGradientBoostingClassifier
+
+    from src.core.binning import Binner, PreBinnedHistGradientBoostingClassifier, bin_parquet
+
+    logger.info("Starting model training. Data URL: %s", data_url)
     start_time = time.time()
-    
+    checkpoint = Checkpoint()
+    data_urls = [data_url] if isinstance(data_url, str) else list(data_url)
+    data_files = [f"data_{i}.parquet" for i in range(len(data_urls))]
+    replay_files = [f"replay_{i}.parquet" for i in range(len(replay_urls))] if replay > 0 else []
+
     try:
         _error_maybe()
-        
-        logger.debug("Downloading training data")
-        download_start = time.time()
-        with requests.get(data_url, stream=True, timeout=_TIMEOUT) as resp:
-            if resp.status_code != 200:
-                logger.error(f"Failed to download training data. Status code: {resp.status_code}")
-                raise RuntimeError(f"Failed to download training data: {resp.status_code}")
-            df = pl.read_parquet(resp.raw)
-        download_time = time.time() - download_start
-        logger.debug(f"Downloaded training data in {download_time:.2f}s. Shape: {df.shape}")
-        
-        if "y" not in df.columns:
-            logger.error("Training data missing required 'y' column")
-            raise ValueError("Training data must contain a 'y' column with target values")
-            
-        logger.debug("Starting model training")
-        train_start = time.time()
-        X, y = df.drop("y"), df["y"]
-        model = HistGradientBoostingClassifier().fit(X, y)
-        train_time = time.time() - train_start
-        logger.debug(f"Model training completed in {train_time:.2f}s")
-        
+        if out_of_core and (len(data_files) > 1 or base_model_url is not None):
+            raise ValueError("Out-of-core training needs a single dataset and no base model")
+
+        if not checkpoint.done("download", *data_files, *replay_files):
+            logger.debug("Downloading training data")
+            download_start = time.time()
+            for url, name in zip([*data_urls, *replay_urls], [*data_files, *replay_files]):
+                _download(url, checkpoint.path(name), "training data")
+            checkpoint.complete("download")
+            download_time = time.time() - download_start
+            logger.debug("Downloaded training data in %.2fs", download_time)
+
+        model_path = checkpoint.path("model.pkl")
+        if checkpoint.done("train", "model.pkl"):
+            model_data = model_path.read_bytes()
+            model = cloudpickle.loads(model_data) if model_id is not None else None
+        elif out_of_core:
+            logger.debug("Binning training data")
+            train_start = time.time()
+            binner, X, y = bin_parquet(checkpoint.path(data_files[0]))
+            logger.debug(
+                "Binned training data in %.2fs. Shape: %s", time.time() - train_start, X.shape
+            )
+            model = PreBinnedHistGradientBoostingClassifier().fit(X, y, binner)
+            del X, y
+            model_data = cloudpickle.dumps(model)
+            model_path.write_bytes(model_data)
+            checkpoint.complete("train")
+            train_time = time.time() - train_start
+            logger.debug("Out-of-core model training completed in %.2fs", train_time)
+        else:
+            df = pl.read_parquet([checkpoint.path(name) for name in data_files])
+            if replay_files:
+                old = pl.read_parquet([checkpoint.path(name) for name in replay_files])
+                logger.debug("Adding %.0f%% of %s replayed rows", replay * 100, len(old))
+                df = pl.concat([df, old.sample(fraction=replay, seed=0)], how="vertical_relaxed")
+                del old
+            logger.debug("Training data shape: %s", df.shape)
+            if "y" not in df.columns:
+                logger.error("Training data missing required 'y' column")
+                raise ValueError("Training data must contain a 'y' column with target values")
+
+            X, y = df.drop("y"), df["y"]
+            if base_model_url is not None:
+                base_model, _ = _load_model(
+                    base_model_id, base_model_url, checkpoint, "base_model.pkl"
+                )
+                iterations = config.WARM_START_ITERATIONS if iterations is None else iterations
+                logger.debug(
+                    "Adding %s iterations to model %s (%s iterations)",
+                    iterations,
+                    base_model_id,
+                    base_model.n_iter_,
+                )
+                train_start = time.time()
+                # The new data is binned like the data of the base model
+                binner = Binner.from_model(base_model)
+                model = PreBinnedHistGradientBoostingClassifier.warm_start_from(
+                    base_model, iterations
+                ).fit(binner.transform(X), y.to_numpy(), binner)
+            else:
+                logger.debug("Starting model training")
+                train_start = time.time()
+                model = HistGradientBoostingClassifier().fit(X, y)
+            model_data = cloudpickle.dumps(model)
+            model_path.write_bytes(model_data)
+            checkpoint.complete("train")
+            train_time = time.time() - train_start
+            logger.debug("Model training completed in %.2fs", train_time)
+
         logger.debug("Uploading trained model")
         upload_start = time.time()
-        model_data = cloudpickle.dumps(model)
-        requests.put(model_url, data=model_data, timeout=_TIMEOUT)
+        etag = _upload(model_url, model_data, "model")
         upload_time = time.time() - upload_start
-        logger.debug(f"Model uploaded in {upload_time:.2f}s. Size: {len(model_data)} bytes")
-        
+        logger.debug("Model uploaded in %.2fs. Size: %s bytes", upload_time, len(model_data))
+        # Predictions with this model may be sent to this worker
+        model_cache.put(model_id, model_path, etag)
+
+        if model_id is not None:
+            _FITTED[model_id] = model
+        checkpoint.clear()
+
         total_time = time.time() - start_time
-        logger.info(f"Model training completed successfully in {total_time:.2f}s")
-    
+        logger.info("Model training completed successfully in %.2fs", total_time)
+
     except Exception as e:
-        logger.error(f"Model training failed: {type(e).__name__}: {e}", exc_info=True)
+        logger.error("Model training failed: %s: %s", type(e).__name__, e, exc_info=True)
         raise
 
+
 @tracer.start_as_current_span("predict")
-def predict(data_url, model_url, result_url):
+def predict(
+    data_url,
+    model_url,
+    result_url,
+    model_id=None,
+    output_format="parquet",
+    compression=None,
+    rows=None,
+):
     """
     Make a prediction with a fitted model.
 
@@ -102,66 +392,443 @@ def predict(data_url, model_url, result_url):
         url where the serialized model can be downloaded (as a cloudpickle
         file).
     result_url : str
-        url where the predictions can be uploaded. It will be a parquet file
-        with a single column named 'y'.
+        url where the predictions can be uploaded. It will be a file in
+        `output_format` with a single column named 'y'.
+    model_id : str, optional
+        ID of the model. If it was fitted by this process (see `fit`), the
+        in-memory model is used and `model_url` is not downloaded. Otherwise
+        it is looked up in the model cache of the worker (see
+        `src.core.model_cache`), where it is added once downloaded.
+    output_format : str
+        Format of the predictions, one of `RESULT_FORMATS`:
+
+        - 'parquet': parquet file.
+        - 'arrow': Arrow IPC (Feather v2) file, which can be read without
+          decoding or copying when it is not compressed.
+        - 'numpy': .npy file holding the little-endian array of predictions,
+          of fixed-width unicode strings for string labels.
+    compression : str, optional
+        Compression of the 'parquet' (default 'zstd') or 'arrow' (default
+        'uncompressed') file.
+    rows : tuple of (int, int), optional
+        Offset and number of the rows to predict, for a shard of a prediction
+        (see `src.utils.shards`). Only the row groups of these rows are
+        downloaded, with range requests. All the rows by default.
     """
-    logger.info(f"Starting prediction. Data URL: {data_url}, Model URL: {model_url}")
+    import polars as pl
+
+    logger.info("Starting prediction. Data URL: %s, Model URL: %s", data_url, model_url)
     start_time = time.time()
-    
+    checkpoint = Checkpoint()
+
     try:
         _error_maybe()
-        
-        logger.debug("Downloading test data")
-        data_start = time.time()
-        with requests.get(data_url, stream=True, timeout=_TIMEOUT) as resp:
-            if resp.status_code != 200:
-                logger.error(f"Failed to download test data. Status code: {resp.status_code}")
-                raise RuntimeError(f"Failed to download test data: {resp.status_code}")
-            df = pl.read_parquet(resp.raw)
-        data_time = time.time() - data_start
-        logger.debug(f"Downloaded test data in {data_time:.2f}s. Shape: {df.shape}")
-        
-        logger.debug("Downloading model")
-        model_start = time.time()
-        with requests.get(model_url, stream=True, timeout=_TIMEOUT) as resp:
-            if resp.status_code != 200:
-                logger.error(f"Failed to download model. Status code: {resp.status_code}")
-                raise RuntimeError(f"Failed to download model: {resp.status_code}")
-            model = cloudpickle.load(resp.raw)
-        model_time = time.time() - model_start
-        logger.debug(f"Downloaded model in {model_time:.2f}s")
-        
-        logger.debug("Making predictions")
-        predict_start = time.time()
-        
-        # Handle the case where 'y' might be in the test data (validation case)
-        # but not required for prediction
-        try:
-            input_data = df.drop("y", strict=False)
-        except Exception as e:
-            logger.error(f"Error preparing test data: {e}")
-            raise
-            
-        pred = model.predict(input_data)
-        pred = pl.DataFrame({"y": pred})
-        predict_time = time.time() - predict_start
-        logger.debug(f"Made predictions in {predict_time:.2f}s for {len(pred)} samples")
-        
+
+        data_path = checkpoint.path("data.parquet")
+        if not checkpoint.done("download", "data.parquet"):
+            logger.debug("Downloading test data")
+            data_start = time.time()
+            if rows is None:
+                _download(data_url, data_path, "test data")
+            else:
+                _download_rows(data_url, data_path, *rows)
+            checkpoint.complete("download")
+            data_time = time.time() - data_start
+            logger.debug("Downloaded test data in %.2fs", data_time)
+
+        result_path = checkpoint.path("result")
+        if not checkpoint.done("predict", "result"):
+            model = _FITTED.pop(model_id, None)
+            if model is not None:
+                logger.debug("Using in-memory model %s", model_id)
+                source = "memory"
+            else:
+                model, source = _load_model(model_id, model_url, checkpoint, "model.pkl")
+            if checkpoint.job is not None:
+                # Where the model came from: "memory", "cache" or "download"
+                checkpoint.job.meta["model_source"] = source
+                checkpoint.job.save_meta()
+
+            logger.debug("Making predictions")
+            predict_start = time.time()
+            df = pl.read_parquet(data_path)
+
+            # Handle the case where 'y' might be in the test data (validation case)
+            # but not required for prediction
+            try:
+                input_data = df.drop("y", strict=False)
+            except Exception as e:
+                logger.error("Error preparing test data: %s", e)
+                raise
+
+            pred = model.predict(input_data)
+            pred = pl.DataFrame({"y": pred})
+            _write_result(pred, result_path, output_format, compression)
+            checkpoint.complete("predict")
+            predict_time = time.time() - predict_start
+            logger.debug("Made predictions in %.2fs for %s samples", predict_time, len(pred))
+
         logger.debug("Uploading prediction results")
         upload_start = time.time()
-        buf = io.BytesIO()
-        pred.write_parquet(buf)
-        result_data = buf.getvalue()
-        response = requests.put(result_url, data=result_data, timeout=_TIMEOUT)
-        if response.status_code != 200:
-            logger.error(f"Failed to upload results. Status code: {response.status_code}")
-            raise RuntimeError(f"Failed to upload results: {response.status_code}")
+        result_data = result_path.read_bytes()
+        _upload(result_url, result_data, "results")
+        upload_time = time.time() - upload_start
+        logger.debug("Uploaded results in %.2fs. Size: %s bytes", upload_time, len(result_data))
+        checkpoint.clear()
+
+        total_time = time.time() - start_time
+        logger.info("Prediction completed successfully in %.2fs", total_time)
+
+    except Exception as e:
+        logger.error("Prediction failed: %s: %s", type(e).__name__, e, exc_info=True)
+        raise
+
+
+@tracer.start_as_current_span("pipeline")
+def pipeline(train_url, model_put_url, test_url, model_get_url, result_url, model_id):
+    """
+    Fit a model, then make a prediction with it, in the same process.
+
+    The prediction uses the fitted model from memory, so that it is neither
+    downloaded nor unpickled (the model is still uploaded, for later
+    predictions). A retry after a failed prediction does not fit the model
+    again: the prediction then loads it as `predict` does.
+
+    Parameters
+    ----------
+    train_url : str
+        url from which the training data can be downloaded, see `fit`.
+    model_put_url : str
+        url where the serialized model can be uploaded.
+    test_url : str
+        url from which the test data can be downloaded, see `predict`.
+    model_get_url : str
+        url where the serialized model can be downloaded.
+    result_url : str
+        url where the predictions can be uploaded, as a parquet file.
+    model_id : str
+        ID of the model.
+    """
+    checkpoint = Checkpoint()
+    if not checkpoint.done("fit"):
+        fit(train_url, model_put_url, model_id=model_id)
+        checkpoint.complete("fit")
+    predict(test_url, model_get_url, result_url, model_id=model_id)
+
+
+@tracer.start_as_current_span("gather_shards")
+def gather_shards(output_format="parquet"):
+    """
+    Fan-in job of a sharded prediction (see `src.utils.shards`).
+
+    It only runs once all the shards, on which it depends, have finished, so
+    that its status is that of the whole prediction. The shards upload their
+    results themselves.
+
+    Parameters
+    ----------
+    output_format : str
+        Format of the results of the shards, reported by `/result`.
+    """
+    logger.info("All shards of the prediction finished, in format %s", output_format)
+
+
+def _fit_config(params, binner, X_train, y_train, X_test=None, y_test=None):
+    """Fit a model with `params` on `X_train` binned by `binner`, score it on
+    `X_test` binned by the same binner."""
+    from src.core.binning import PreBinnedHistGradientBoostingClassifier
+
+    start = time.time()
+    model = PreBinnedHistGradientBoostingClassifier(**params).fit(X_train, y_train, binner)
+    fit_time = time.time() - start
+    if X_test is None:
+        return model, None, fit_time
+    # Only the score is needed: the model is not sent back to the job
+    return None, float(np.mean(model.predict_binned(X_test) == y_test)), fit_time
+
+
+@tracer.start_as_current_span("fit_sweep")
+def fit_sweep(data_url, model_urls, configs, scores_url, cv=0, holdout=0.2):
+    """
+    Fit one gradient boosting model per hyperparameter configuration.
+
+    The training data is downloaded once, and binned once for the models
+    that are stored and once per fold (with bins computed from the training
+    rows of the fold only) for the scores. The models are trained on the
+    binned data in parallel, sharing the `JOB_CPUS` CPUs of the job.
+
+    Parameters
+    ----------
+    data_url : str
+        url from which the training data can be downloaded as a parquet file.
+        It must have a column named 'y' that contains the targets.
+    model_urls : list of str
+        urls where the serialized models can be uploaded (as cloudpickle
+        files), one per configuration.
+    configs : list of dict
+        Parameters of `HistGradientBoostingClassifier` for each model. They
+        cannot change `max_bins`, which is shared by all the models.
+    scores_url : str
+        url where the table of scores can be uploaded. It will be a parquet
+        file with one row per configuration and the columns 'config' (the
+        parameters, as JSON), 'fit_time' and, if `cv` > 1, 'cv_mean' and
+        'cv_std' (cross-validated accuracy), else 'holdout_score' (accuracy on
+        a stratified `holdout` fraction of the rows, of a model trained on the
+        others).
+    cv : int
+        Number of cross-validation folds. No cross-validation if < 2.
+    holdout : float
+        Fraction of the rows held out to score the models without
+        cross-validation. The models that are stored are still trained on all
+        the rows.
+    """
+    import cloudpickle
+    import polars as pl
+    from joblib import Parallel, delayed, parallel_config
+    from sklearn.model_selection import StratifiedKFold, StratifiedShuffleSplit
+
+    from src.core.binning import Binner
+
+    logger.info("Starting sweep over %s configurations. Data URL: %s", len(configs), data_url)
+    start_time = time.time()
+    checkpoint = Checkpoint()
+    model_files = [f"model_{i}.pkl" for i in range(len(configs))]
+
+    try:
+        _error_maybe()
+
+        data_path = checkpoint.path("data.parquet")
+        if not checkpoint.done("download", "data.parquet"):
+            logger.debug("Downloading training data")
+            download_start = time.time()
+            _download(data_url, data_path, "training data")
+            checkpoint.complete("download")
+            download_time = time.time() - download_start
+            logger.debug("Downloaded training data in %.2fs", download_time)
+
+        if not checkpoint.done("train", "scores.parquet", *model_files):
+            df = pl.read_parquet(data_path)
+            logger.debug("Training data shape: %s", df.shape)
+            if "y" not in df.columns:
+                logger.error("Training data missing required 'y' column")
+                raise ValueError("Training data must contain a 'y' column with target values")
+
+            logger.debug("Binning training data")
+            bin_start = time.time()
+            y = df["y"].to_numpy()
+            # Fitted on the data frame, for the column names of the stored models
+            binner = Binner().fit(df.drop("y"))
+            X = df.drop("y").to_numpy().astype(np.float64, copy=False)
+            del df
+            if cv > 1:
+                folds = list(StratifiedKFold(n_splits=cv).split(X, y))
+            else:
+                splitter = StratifiedShuffleSplit(n_splits=1, test_size=holdout, random_state=0)
+                folds = list(splitter.split(X, y))
+            # The first split trains the models that are stored on all the
+            # rows. The bins of the others must not be computed from the rows
+            # they are scored on.
+            splits = [(binner, binner.transform(X), y)]
+            for train, test in folds:
+                fold_binner = Binner().fit(X[train])
+                splits.append(
+                    (
+                        fold_binner,
+                        fold_binner.transform(X[train]),
+                        y[train],
+                        fold_binner.transform(X[test]),
+                        y[test],
+                    )
+                )
+            del X
+            bin_time = time.time() - bin_start
+            logger.debug("Binned training data in %.2fs", bin_time)
+
+            tasks = [(i, j) for j in range(len(splits)) for i in range(len(configs))]
+            n_jobs = max(1, min(len(tasks), config.JOB_CPUS))
+            logger.debug("Training %s models on %s processes", len(tasks), n_jobs)
+            train_start = time.time()
+            threads = max(1, config.JOB_CPUS // n_jobs)
+            with parallel_config(backend="loky", inner_max_num_threads=threads):
+                fitted = Parallel(n_jobs=n_jobs)(
+                    delayed(_fit_config)(configs[i], *splits[j]) for i, j in tasks
+                )
+
+            cv_scores = [[] for _ in configs]
+            for (i, j), (_, score, _) in zip(tasks, fitted):
+                if j > 0:
+                    cv_scores[i].append(score)
+            rows = []
+            for i, params in enumerate(configs):
+                model, _, fit_time = fitted[i]
+                checkpoint.path(model_files[i]).write_bytes(cloudpickle.dumps(model))
+                row = {"config": json.dumps(params), "fit_time": fit_time}
+                if cv > 1:
+                    scores = cv_scores[i]
+                    row.update(cv_mean=float(np.mean(scores)), cv_std=float(np.std(scores)))
+                else:
+                    row.update(holdout_score=cv_scores[i][0])
+                rows.append(row)
+            pl.DataFrame(rows).write_parquet(checkpoint.path("scores.parquet"))
+            checkpoint.complete("train")
+            train_time = time.time() - train_start
+            logger.debug("Sweep training completed in %.2fs", train_time)
+
+        logger.debug("Uploading trained models and scores")
+        upload_start = time.time()
+        for model_url, name in zip(model_urls, model_files):
+            _upload(model_url, checkpoint.path(name).read_bytes(), "model")
+        _upload(scores_url, checkpoint.path("scores.parquet").read_bytes(), "scores")
         upload_time = time.time() - upload_start
-        logger.debug(f"Uploaded results in {upload_time:.2f}s. Size: {len(result_data)} bytes")
-        
+        logger.debug("Models and scores uploaded in %.2fs", upload_time)
+        checkpoint.clear()
+
         total_time = time.time() - start_time
-        logger.info(f"Prediction completed successfully in {total_time:.2f}s")
-        
+        logger.info("Sweep completed successfully in %.2fs", total_time)
+
+    except Exception as e:
+        logger.error("Sweep failed: %s: %s", type(e).__name__, e, exc_info=True)
+        raise
+
+
+def _column_stats(stats, batch):
+    """Update the per-column `stats` (dtype, null count, min, max) with `batch`."""
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    for name, column in zip(batch.schema.names, batch.columns):
+        col_stats = stats.setdefault(name, {"dtype": str(column.type), "null_count": 0})
+        col_stats["null_count"] += column.null_count
+        if not (pa.types.is_integer(column.type) or pa.types.is_floating(column.type)):
+            continue
+        min_max = pc.min_max(column).as_py()
+        for key, pick in (("min", min), ("max", max)):
+            if min_max[key] is not None:
+                current = col_stats.get(key)
+                col_stats[key] = min_max[key] if current is None else pick(current, min_max[key])
+
+
+@tracer.start_as_current_span("optimize_dataset")
+def optimize_dataset(dataset_id, float32=False):
+    """
+    Rewrite a dataset of the `datasets` bucket in a layout that is fast to read.
+
+    The parquet file is rewritten, one batch at a time, with zstd compression
+    and row groups of about `DATASET_ROW_GROUP_BYTES` (uncompressed), merging
+    the small row groups of the original file. The
+    statistics (dtype, null count, min and max) and schema of the columns are
+    stored in the parquet key-value metadata (`neuralk:stats`), and a summary
+    in the object metadata, which is also used to skip datasets that are
+    already optimized. Unlike the other tasks, this one needs the MinIO
+    credentials, to read and write the object metadata.
+
+    The optimized file is uploaded as a new version of the object: the jobs
+    given a URL to the previous version (e.g. the shards of a prediction,
+    planned with its footer) keep reading it until it expires, see
+    `DATASET_VERSION_DAYS`.
+
+    Parameters
+    ----------
+    dataset_id : str
+        ID of the dataset (an ID returned by `/upload`).
+    float32 : bool
+        If True, the float64 feature columns are downcast to float32. The
+        column 'y' is left untouched.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    logger.info("Starting dataset optimization. Dataset ID: %s", dataset_id)
+    start_time = time.time()
+    minio = config.get_minio_client()
+    checkpoint = Checkpoint()
+
+    try:
+        info = minio.stat_object("datasets", dataset_id)
+        if info.metadata.get("x-amz-meta-optimized") == "1":
+            logger.info("Dataset %s is already optimized", dataset_id)
+            checkpoint.clear()
+            return
+
+        data_path = checkpoint.path("data.parquet")
+        if not checkpoint.done("download", "data.parquet"):
+            logger.debug("Downloading dataset")
+            minio.fget_object("datasets", dataset_id, str(data_path))
+            checkpoint.complete("download")
+
+        optimized_path = checkpoint.path("optimized.parquet")
+        metadata_path = checkpoint.path("metadata.json")
+        if not checkpoint.done("optimize", "optimized.parquet", "metadata.json"):
+            logger.debug("Rewriting dataset")
+            rewrite_start = time.time()
+            source = pq.ParquetFile(data_path)
+            schema = source.schema_arrow
+            if float32:
+                schema = pa.schema(
+                    [
+                        (
+                            field.with_type(pa.float32())
+                            if field.name != "y" and pa.types.is_float64(field.type)
+                            else field
+                        )
+                        for field in schema
+                    ]
+                )
+            num_rows = source.metadata.num_rows
+            uncompressed = sum(
+                source.metadata.row_group(i).total_byte_size for i in range(source.num_row_groups)
+            )
+            row_bytes = max(1, uncompressed // max(1, num_rows) // (2 if float32 else 1))
+            row_group_rows = max(1, config.DATASET_ROW_GROUP_BYTES // row_bytes)
+
+            stats = {}
+            with pq.ParquetWriter(optimized_path, schema, compression="zstd") as writer:
+
+                def write(table):
+                    _column_stats(stats, table)
+                    writer.write_table(table, row_group_size=row_group_rows)
+
+                # The batches stop at the end of each row group of the source:
+                # they are buffered up to full row groups
+                pending = pa.Table.from_batches([], schema=schema)
+                for batch in source.iter_batches(batch_size=row_group_rows):
+                    table = pa.Table.from_batches([batch]).cast(schema)
+                    pending = pa.concat_tables([pending, table])
+                    full = pending.num_rows // row_group_rows * row_group_rows
+                    if full:
+                        write(pending.slice(0, full))
+                        pending = pending.slice(full)
+                if pending.num_rows:
+                    write(pending)
+                writer.add_key_value_metadata({"neuralk:stats": json.dumps(stats)})
+            summary = {
+                "optimized": "1",
+                "num-rows": str(num_rows),
+                "num-columns": str(len(schema)),
+                "row-group-rows": str(row_group_rows),
+                "compression": "zstd",
+                "float32": str(int(float32)),
+            }
+            metadata_path.write_text(json.dumps(summary))
+            checkpoint.complete("optimize")
+            rewrite_time = time.time() - rewrite_start
+            logger.debug(
+                "Rewrote dataset in %.2fs: %s rows in row groups of %s, %s -> %s bytes",
+                rewrite_time,
+                num_rows,
+                row_group_rows,
+                data_path.stat().st_size,
+                optimized_path.stat().st_size,
+            )
+
+        logger.debug("Uploading optimized dataset")
+        summary = json.loads(metadata_path.read_text())
+        minio.fput_object("datasets", dataset_id, str(optimized_path), metadata=summary)
+        checkpoint.clear()
+
+        total_time = time.time() - start_time
+        logger.info("Dataset optimization completed successfully in %.2fs", total_time)
+
     except Exception as e:
-        logger.error(f"Prediction failed: {type(e).__name__}: {e}", exc_info=True)
+        logger.error("Dataset optimization failed: %s: %s", type(e).__name__, e, exc_info=True)
         raise
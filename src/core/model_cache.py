@@ -0,0 +1,81 @@
+"""
+Cache of the models used by the jobs of a worker, on its local disk.
+
+Each work-horse is a new process, so the models it loads do not survive the
+job. Models downloaded by `ml.predict` (and trained by `ml.fit`) are kept in
+`config.MODEL_CACHE_DIR`, along with the ETag of their object in MinIO, so
+that the next jobs of the worker that use them only have to check that the
+object did not change. At most `config.MODEL_CACHE_SIZE` models are kept, the
+least recently used ones being removed first.
+
+The workers advertise the models of their cache, so that the server sends the
+predictions that use them to these workers (see `src.utils.affinity`).
+"""
+
+import os
+import shutil
+from pathlib import Path
+
+import src.utils.config as config
+from src.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+def _path(model_id):
+    return Path(config.MODEL_CACHE_DIR) / f"{model_id}.pkl"
+
+
+def _last_use(path):
+    try:
+        return path.stat().st_mtime
+    except OSError:
+        return 0  # Evicted by another process
+
+
+def get(model_id):
+    """
+    Path and ETag of the model `model_id` in the cache.
+
+    Returns
+    -------
+    tuple of (pathlib.Path, str), or None
+        None if the model is not in the cache.
+    """
+    if model_id is None or config.MODEL_CACHE_SIZE <= 0:
+        return None
+    path = _path(model_id)
+    try:
+        etag = path.with_suffix(".etag").read_text()
+        # The modification time orders the models for eviction
+        os.utime(path)
+    except OSError:
+        return None
+    return path, etag
+
+
+def put(model_id, source, etag):
+    """Add a copy of the model file `source`, whose object has `etag`, to the
+    cache, and evict the least recently used models beyond the cache size."""
+    if model_id is None or etag is None or config.MODEL_CACHE_SIZE <= 0:
+        return
+    path = _path(model_id)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # Written aside then renamed, so that other processes never read a partial file
+    tmp = path.with_suffix(f".{os.getpid()}.tmp")
+    shutil.copyfile(source, tmp)
+    path.with_suffix(".etag").write_text(etag)
+    os.replace(tmp, path)
+    logger.debug("Model %s added to the model cache", model_id)
+    by_use = sorted(path.parent.glob("*.pkl"), key=_last_use, reverse=True)
+    for old in by_use[config.MODEL_CACHE_SIZE :]:
+        old.unlink(missing_ok=True)
+        old.with_suffix(".etag").unlink(missing_ok=True)
+        logger.debug("Model %s evicted from the model cache", old.stem)
+
+
+def model_ids():
+    """IDs of the models in the cache."""
+    if config.MODEL_CACHE_SIZE <= 0:
+        return []
+    return [path.stem for path in Path(config.MODEL_CACHE_DIR).glob("*.pkl")]
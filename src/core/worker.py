@@ -2,14 +2,39 @@
 RQ worker to allow adding exception handlers. To use it, start the worker with
 `rq worker -w worker.Worker` (or `python worker.py`)
 
+Before taking jobs, the worker imports the modules of `WORKER_PRELOAD` (the
+modules of the job functions, e.g. `ml`), so that the work-horse forked for
+each job inherits them instead of importing them again. It then creates
+`WORKER_READY_FILE`, which the readiness probe of the deployment checks.
+
+Unless `AFFINITY_MAX_QUEUED` is 0, the worker also takes jobs from its own
+queue, before the shared one, and advertises the models of its model cache
+after each job, so that the predictions using them are sent to it (see
+`src.utils.affinity`). The jobs left in its queue are moved to the shared
+queue when it stops.
+
 See details in the RQ documentation:
 https://python-rq.org/docs/workers/
 """
+
+import importlib
+import os
+import time
+from pathlib import Path
+
 import rq
 import setproctitle
+from rq.command import send_stop_job_command
+from rq.exceptions import InvalidJobOperation
+from rq.job import JobStatus
 
+import src.core.model_cache as model_cache
+import src.utils.affinity as affinity
 import src.utils.config as config
-from src.utils.logger import get_logger
+import src.core.checkpoint as checkpoint
+from src.core.checkpoint import Checkpoint
+from src.utils.jobs import cancel, cancel_dependents, deadline_passed
+from src.utils.logger import flush, get_logger
 
 from opentelemetry import trace
 
@@ -20,11 +45,19 @@ logger = get_logger(__name__)
 
 def handle_exception(job, exc_type, exc_value, traceback):
     del traceback
-    if issubclass(exc_type, RuntimeError):
-        logger.warning(f"Job {job.id} encountered a RuntimeError: {exc_value}. Will retry.")
+    if issubclass(exc_type, RuntimeError) and job.retries_left:
+        logger.warning(
+            "Job %s encountered a RuntimeError: %s. Will resume after stages %s.",
+            job.id,
+            exc_value,
+            job.meta.get("stages", []),
+        )
         return True
-    logger.error(f"Job {job.id} failed with {exc_type.__name__}: {exc_value}. No more retries.")
+    logger.error(
+        "Job %s failed with %s: %s. No more retries.", job.id, exc_type.__name__, exc_value
+    )
     job.retries_left = 0
+    Checkpoint(job).clear()
     return False
 
 
@@ -33,28 +66,122 @@ class Worker(rq.Worker):
     def __init__(self, *args, exception_handlers=None, **kwargs):
         if exception_handlers is None:
             exception_handlers = [handle_exception]
+        # Deadlines are checked every `job_monitoring_interval` seconds
+        kwargs.setdefault("job_monitoring_interval", config.JOB_MONITORING_INTERVAL)
         super().__init__(*args, exception_handlers=exception_handlers, **kwargs)
+        self.shared_queue = self.queues[0]
+        if config.AFFINITY_MAX_QUEUED > 0:
+            # Listed first so that the jobs routed to this worker are taken first
+            self.queues.insert(0, affinity.worker_queue(self.shared_queue, self.name))
+            self._ordered_queues = self.queues[:]
+
+    def work(self, *args, **kwargs):
+        """Override to warm up before taking jobs"""
+        self.warm_up()
+        return super().work(*args, **kwargs)
+
+    @tracer.start_as_current_span("warm_up")
+    def warm_up(self):
+        """Import the modules of `WORKER_PRELOAD`, and call their `warm_up`
+        function if they have one"""
+        start = time.time()
+        for name in config.WORKER_PRELOAD:
+            module = importlib.import_module(name)
+            if hasattr(module, "warm_up"):
+                module.warm_up()
+        logger.info("Preloaded %s in %.2fs", ", ".join(config.WORKER_PRELOAD), time.time() - start)
+
+    def bootstrap(self, *args, **kwargs):
+        """Override to signal that the worker is ready once it is registered,
+        to advertise the models it already has, and to remove the artifacts
+        left by the jobs of a previous run"""
+        super().bootstrap(*args, **kwargs)
+        checkpoint.sweep(self.connection)
+        self.advertise_models()
+        Path(config.WORKER_READY_FILE).touch()
+
+    def teardown(self):
+        """Override to withdraw the readiness signal, and to hand the jobs
+        routed to this worker over to the other workers"""
+        if not self.is_horse:
+            try:
+                os.remove(config.WORKER_READY_FILE)
+            except FileNotFoundError:
+                pass
+        super().teardown()
+        if not self.is_horse and config.AFFINITY_MAX_QUEUED > 0:
+            affinity.release(self.shared_queue, self.name)
+
+    def advertise_models(self):
+        """Advertise the models of the model cache, for the routing of predictions"""
+        if config.AFFINITY_MAX_QUEUED > 0:
+            affinity.advertise(self.shared_queue, self.name, model_cache.model_ids())
 
     @tracer.start_as_current_span("execute_job")
-    def execute_job(self, job, *args, **kwargs):
-        """Override to add logging before and after job execution"""
-        logger.info(f"Starting job {job.id} of type {job.func_name}")
-        result = super().execute_job(job, *args, **kwargs)
-        logger.info(f"Completed job {job.id} with status: {job.get_status()}")
-        return result
+    def execute_job(self, job, queue):
+        """Override to add logging before and after job execution, to skip
+        jobs whose deadline has passed, and to remove the artifacts of the jobs
+        that no longer need them afterwards (see `checkpoint.sweep`)"""
+        if deadline_passed(job):
+            logger.info(
+                "Skipping job %s of type %s: its deadline has passed", job.id, job.func_name
+            )
+            self.connection.lrem(queue.intermediate_queue_key, 1, job.id)
+            cancel(job)
+            return
+        logger.info("Starting job %s of type %s", job.id, job.func_name)
+        super().execute_job(job, queue)
+        try:
+            status = job.get_status()
+        except InvalidJobOperation:
+            status = None  # Finished, and its result already expired
+        logger.info("Completed job %s with status: %s", job.id, status)
+        self.advertise_models()
+        # e.g. of the jobs that failed here and were retried by other workers
+        checkpoint.sweep(self.connection)
+
+    def maintain_heartbeats(self, job):
+        """Override to stop the job once its deadline has passed"""
+        super().maintain_heartbeats(job)
+        if deadline_passed(job):
+            logger.warning("Stopping job %s: its deadline has passed", job.id)
+            # RQ would enqueue the dependents of the stopped job, which cannot succeed
+            cancel_dependents(job)
+            send_stop_job_command(self.connection, job.id, serializer=self.serializer)
+
+    def handle_job_failure(self, job, queue, started_job_registry=None, exc_string=""):
+        """Override to clean up after stopped jobs, and after jobs that failed
+        for good (not retried). Their artifacts are removed here, in the worker
+        rather than the work-horse, which may have been killed (e.g. out of
+        memory). The dependents of the latter, e.g. the fan-in job of a sharded
+        prediction, would stay deferred forever: they are canceled. Those of
+        stopped jobs are canceled before they are stopped, see
+        `maintain_heartbeats` and `/cancel`."""
+        super().handle_job_failure(job, queue, started_job_registry, exc_string)
+        if job.get_status() in (JobStatus.STOPPED, JobStatus.FAILED):
+            Checkpoint(job).clear()
+            cancel_dependents(job)
+
+    def perform_job(self, job, queue):
+        """Override to flush the logs of the job"""
+        success = super().perform_job(job, queue)
+        # The work-horse exits with `os._exit`, which skips the `atexit` hooks
+        flush()
+        return success
 
 
 if __name__ == "__main__":
     setproctitle.setproctitle("neuralk-worker")
     logger.info("Starting RQ worker")
-    
-    redis_conn = config.get_redis_connection()    
+
+    redis_conn = config.get_redis_connection()
     w = Worker([config.QUEUE_NAME], connection=redis_conn)
-    
+
     try:
-        logger.info(f"Worker listening to queue: {config.QUEUE_NAME}")
-        w.work()
+        logger.info("Worker listening to queues: %s", ", ".join(w.queue_names()))
+        # The scheduler enqueues the retries delayed by `RETRY_BACKOFF`
+        w.work(with_scheduler=True)
     except KeyboardInterrupt:
         logger.info("Worker stopped by user")
     except Exception as e:
-        logger.error(f"Worker stopped due to error: {type(e).__name__}: {e}", exc_info=True)
+        logger.error("Worker stopped due to error: %s: %s", type(e).__name__, e, exc_info=True)
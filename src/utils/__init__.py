@@ -1,2 +1,2 @@
 from .config import *
-from .logger import get_logger
\ No newline at end of file
+from .logger import get_logger
@@ -0,0 +1,174 @@
+"""
+Routing of the predict jobs to the workers that have their model.
+
+Each worker also takes jobs from its own queue (`worker_queue`), before those
+of the shared queue. After each job, a worker advertises in Redis the models
+of its model cache (see `src.core.model_cache`) with `advertise`, and the
+server sends a prediction to the queue of a worker that has its model, with
+`route`: the worker then loads the model from its disk instead of downloading
+it. If every such worker is busy, i.e. it would have to wait for
+`AFFINITY_MAX_QUEUED` jobs or more, or if no worker has the model, the job
+goes to the shared queue as usual.
+
+A worker that stops moves the jobs left in its queue to the shared queue
+(`release`). The jobs of workers that died are moved by the retention sweeper
+of the server (see `src.utils.retention`).
+
+The workers and models are recorded per shared queue, so that the queues
+sharing a Redis instance do not route their jobs to each other's workers.
+"""
+
+from rq import Queue
+from rq.job import Job
+from rq.worker import Worker
+
+import src.utils.config as config
+from src.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Redis keys of the workers of a shared queue that have their own queue, of the
+# models advertised by a worker, and of the workers that advertise a model
+WORKERS_KEY = "neuralk:affinity:{queue}:workers"
+WORKER_MODELS_KEY = "neuralk:affinity:{queue}:worker:{worker}:models"
+MODEL_WORKERS_KEY = "neuralk:affinity:{queue}:model:{model_id}:workers"
+
+
+def _alive(state, death):
+    """Whether a worker with this `state` and `death` (fields of its RQ key)
+    takes jobs. RQ keeps the key of a worker for a minute after its death."""
+    return death is None and state in (b"idle", b"busy")
+
+
+def worker_queue(queue, worker_name):
+    """The own queue of worker `worker_name`, for jobs of the shared `queue`."""
+    return Queue(
+        f"{queue.name}.worker.{worker_name}",
+        connection=queue.connection,
+        serializer=queue.serializer,
+    )
+
+
+def worker_queues(queue):
+    """The own queues of the workers of the shared `queue`."""
+    workers_key = WORKERS_KEY.format(queue=queue.name)
+    names = sorted(name.decode() for name in queue.connection.smembers(workers_key))
+    return [worker_queue(queue, name) for name in names]
+
+
+def advertise(queue, worker_name, model_ids):
+    """Record that worker `worker_name` of the shared `queue` has the models
+    `model_ids` (and no others)."""
+    connection = queue.connection
+    worker_key = WORKER_MODELS_KEY.format(queue=queue.name, worker=worker_name)
+    old = {model_id.decode() for model_id in connection.smembers(worker_key)}
+    new = set(model_ids)
+    with connection.pipeline() as pipeline:
+        for model_id in old - new:
+            model_key = MODEL_WORKERS_KEY.format(queue=queue.name, model_id=model_id)
+            pipeline.srem(model_key, worker_name)
+        for model_id in new - old:
+            model_key = MODEL_WORKERS_KEY.format(queue=queue.name, model_id=model_id)
+            pipeline.sadd(model_key, worker_name)
+        pipeline.delete(worker_key)
+        if new:
+            pipeline.sadd(worker_key, *new)
+        pipeline.sadd(WORKERS_KEY.format(queue=queue.name), worker_name)
+        pipeline.execute()
+
+
+def forget_model(queue, model_id):
+    """Stop routing the predictions of the (deleted) model `model_id` in the
+    shared `queue`."""
+    queue.connection.delete(MODEL_WORKERS_KEY.format(queue=queue.name, model_id=model_id))
+
+
+def route(queue, model_id):
+    """
+    Queue in which to enqueue a prediction with the model `model_id`.
+
+    Parameters
+    ----------
+    queue : rq.Queue
+        The shared queue.
+    model_id : str
+        ID of the model used by the prediction.
+
+    Returns
+    -------
+    rq.Queue
+        The queue of the least busy worker that has the model, if it has fewer
+        than `AFFINITY_MAX_QUEUED` jobs to run before, else `queue`.
+    """
+    if config.AFFINITY_MAX_QUEUED <= 0:
+        return queue
+    connection = queue.connection
+    model_key = MODEL_WORKERS_KEY.format(queue=queue.name, model_id=model_id)
+    names = [name.decode() for name in connection.smembers(model_key)]
+    if not names:
+        return queue
+    with connection.pipeline() as pipeline:
+        for name in names:
+            pipeline.hmget(Worker.redis_worker_namespace_prefix + name, "state", "death")
+            pipeline.llen(worker_queue(queue, name).key)
+        replies = pipeline.execute()
+    candidates = []
+    for name, (state, death), queued in zip(names, replies[::2], replies[1::2]):
+        # Dead, starting and suspended workers take no jobs
+        if not _alive(state, death):
+            continue
+        load = queued + (state == b"busy")
+        if load < config.AFFINITY_MAX_QUEUED:
+            candidates.append((load, name))
+    if not candidates:
+        return queue
+    return worker_queue(queue, min(candidates)[1])
+
+
+def release(queue, worker_name):
+    """
+    Move the jobs waiting in the queue of worker `worker_name`, including
+    the retries it scheduled, to the shared `queue`, and forget its models.
+
+    Returns the number of jobs moved.
+    """
+    connection = queue.connection
+    own_queue = worker_queue(queue, worker_name)
+    registry = own_queue.scheduled_job_registry
+    job_ids = own_queue.get_job_ids() + registry.get_job_ids()
+    moved = 0
+    for job in Job.fetch_many(job_ids, connection=connection, serializer=queue.serializer):
+        if job is None:
+            continue
+        with connection.pipeline() as pipeline:
+            # First, as it starts the transaction of the pipeline
+            queue.enqueue_job(job, pipeline=pipeline)
+            own_queue.remove(job, pipeline=pipeline)
+            registry.remove(job, pipeline=pipeline)
+            pipeline.execute()
+        moved += 1
+    advertise(queue, worker_name, ())
+    if moved:
+        logger.info("Moved %s jobs of worker %s to queue %s", moved, worker_name, queue.name)
+    return moved
+
+
+def release_dead_workers(queue):
+    """Release the queues of the workers of `queue` that died, see `release`.
+
+    Returns the number of jobs moved."""
+    connection = queue.connection
+    workers_key = WORKERS_KEY.format(queue=queue.name)
+    moved = 0
+    for name in connection.smembers(workers_key):
+        name = name.decode()
+        key = Worker.redis_worker_namespace_prefix + name
+        # RQ keeps the key of a worker for a minute after its death
+        if connection.hget(key, "death") is None and connection.exists(key):
+            continue
+        moved += release(queue, name)
+        with connection.pipeline() as pipeline:
+            pipeline.srem(workers_key, name)
+            pipeline.delete(WORKER_MODELS_KEY.format(queue=queue.name, worker=name))
+            pipeline.execute()
+    return moved
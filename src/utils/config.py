@@ -4,15 +4,18 @@ Loads configuration from .env files and provides access to environment variables
 """
 
 import os
+import tempfile
 from pathlib import Path
 from dotenv import load_dotenv
 
 # Get the base directory of the project
 BASE_DIR = Path(__file__).resolve().parent.parent.parent
 
-# Load environment variables from .env file
-load_dotenv(os.path.join(BASE_DIR, ".env"))
-load_dotenv(os.path.join(BASE_DIR, ".env.local"), override=True)
+# Load environment variables from the .env file, then the .env.local file
+# (which overrides them), if they exist
+for name, override in ((".env", False), (".env.local", True)):
+    if (BASE_DIR / name).is_file():
+        load_dotenv(BASE_DIR / name, override=override)
 
 # Server configuration
 SERVER_HOST = os.environ.get("SERVER_HOST", "localhost")
@@ -32,10 +35,82 @@ MINIO_SECURE = os.environ.get("MINIO_SECURE", "False").lower() == "true"
 
 # Logging configuration
 LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO")
+# "text", or "json" for one JSON object per line
+LOG_FORMAT = os.environ.get("LOG_FORMAT", "text")
+# Fraction of the requests logged by the server's access log
+ACCESS_LOG_SAMPLE_RATE = float(os.environ.get("ACCESS_LOG_SAMPLE_RATE", "1"))
 
 # Job configuration
 JOB_TIMEOUT = os.environ.get("JOB_TIMEOUT", "600s")
 MAX_RETRIES = int(os.environ.get("MAX_RETRIES", "4"))
+# Number of CPUs a job may use (e.g. to train the models of a sweep in parallel)
+JOB_CPUS = int(os.environ.get("JOB_CPUS", os.cpu_count() or 1))
+# Seconds before the first retry of a failed job, doubled at each retry
+RETRY_BACKOFF = float(os.environ.get("RETRY_BACKOFF", "1"))
+# Target uncompressed size of the row groups of optimized datasets
+DATASET_ROW_GROUP_BYTES = int(os.environ.get("DATASET_ROW_GROUP_BYTES", str(64 * 1024 * 1024)))
+# Days during which the previous versions of a rewritten (e.g. optimized)
+# dataset stay readable by the jobs that were given a URL to them
+DATASET_VERSION_DAYS = int(os.environ.get("DATASET_VERSION_DAYS", "1"))
+# Boosting iterations added by a fit that continues the training of a model
+WARM_START_ITERATIONS = int(os.environ.get("WARM_START_ITERATIONS", "20"))
+# Directory (local or shared between workers) for job stage checkpoints
+CACHE_DIR = os.environ.get("CACHE_DIR", os.path.join(tempfile.gettempdir(), "neuralk-cache"))
+
+# Seconds during which the result of a prediction is reused for the same
+# dataset (unchanged since) and model (0 disables the cache)
+PREDICT_CACHE_TTL = int(os.environ.get("PREDICT_CACHE_TTL", "3600"))
+# Predictions on datasets of more than this number of rows are split into
+# shards predicted in parallel (0 disables it), in at most this number of shards.
+# The rows of datasets smaller than this number of bytes are not even counted
+PREDICT_SHARD_ROWS = int(os.environ.get("PREDICT_SHARD_ROWS", "5000000"))
+PREDICT_MAX_SHARDS = int(os.environ.get("PREDICT_MAX_SHARDS", "16"))
+PREDICT_SHARD_MIN_BYTES = int(os.environ.get("PREDICT_SHARD_MIN_BYTES", str(64 * 2**20)))
+# Modules that a worker imports (and warms up, see `ml.warm_up`) before taking
+# jobs, so that the work-horses forked for the jobs inherit them
+WORKER_PRELOAD = [name for name in os.environ.get("WORKER_PRELOAD", "ml").split(",") if name]
+# File that a worker creates once it is ready to take jobs, for readiness probes
+WORKER_READY_FILE = os.environ.get(
+    "WORKER_READY_FILE", os.path.join(tempfile.gettempdir(), "neuralk-worker.ready")
+)
+# Directory local to a worker where it keeps the models used by its jobs, and
+# number of models kept (0 disables the cache)
+MODEL_CACHE_DIR = os.environ.get(
+    "MODEL_CACHE_DIR", os.path.join(tempfile.gettempdir(), "neuralk-models")
+)
+MODEL_CACHE_SIZE = int(os.environ.get("MODEL_CACHE_SIZE", "16"))
+# A prediction is sent to a worker that has its model if fewer than this number
+# of jobs would run there before it (0 disables the routing)
+AFFINITY_MAX_QUEUED = int(os.environ.get("AFFINITY_MAX_QUEUED", "1"))
+# Seconds between two checks by a worker of the deadline of its running job
+JOB_MONITORING_INTERVAL = int(os.environ.get("JOB_MONITORING_INTERVAL", "5"))
+
+# Retention: seconds during which the objects of each bucket are kept after
+# their last write or use (0 keeps them forever). Datasets and models are kept
+# forever by default, as they were before the sweeper existed
+DATASET_RETENTION = int(os.environ.get("DATASET_RETENTION", "0"))
+MODEL_RETENTION = int(os.environ.get("MODEL_RETENTION", "0"))
+RESULT_RETENTION = int(os.environ.get("RESULT_RETENTION", str(24 * 3600)))
+if 0 < RESULT_RETENTION < PREDICT_CACHE_TTL:
+    # The predict cache would return the IDs of results that the sweeper removed
+    raise ValueError(
+        f"RESULT_RETENTION ({RESULT_RETENTION}) must be 0 or at least "
+        f"PREDICT_CACHE_TTL ({PREDICT_CACHE_TTL})"
+    )
+# Seconds during which finished fit (and sweep) jobs, other finished jobs, and
+# failed, stopped or canceled jobs are kept in Redis
+FIT_JOB_RETENTION = int(os.environ.get("FIT_JOB_RETENTION", "500"))
+PREDICT_JOB_RETENTION = int(os.environ.get("PREDICT_JOB_RETENTION", "500"))
+FAILED_JOB_RETENTION = int(os.environ.get("FAILED_JOB_RETENTION", str(24 * 3600)))
+# Seconds between two runs of the retention sweeper
+SWEEP_INTERVAL = int(os.environ.get("SWEEP_INTERVAL", "600"))
+
+# Seconds between two checks of Redis and MinIO by the server, seconds after
+# which a service that has not answered a check is unavailable, and age in
+# seconds of the last check after which the server is no longer alive
+HEALTH_CHECK_INTERVAL = float(os.environ.get("HEALTH_CHECK_INTERVAL", "5"))
+HEALTH_CHECK_TIMEOUT = float(os.environ.get("HEALTH_CHECK_TIMEOUT", "2"))
+HEALTH_STALE_AFTER = float(os.environ.get("HEALTH_STALE_AFTER", "30"))
 
 # Queue name
 QUEUE_NAME = os.environ.get("QUEUE_NAME", "default")
@@ -44,25 +119,24 @@ QUEUE_NAME = os.environ.get("QUEUE_NAME", "default")
 MINIO_PROXY_ADDRESS = os.environ.get("MINIO_PROXY_ADDRESS", "localhost")
 MINIO_PROXY_PORT = int(os.environ.get("MINIO_PROXY_PORT", "9002"))
 
+
 def get_redis_connection():
     """Returns a configured Redis connection"""
     from redis import Redis
-    
+
     return Redis(
         host=REDIS_HOST,
         port=REDIS_PORT,
         db=REDIS_DB,
         password=REDIS_PASSWORD,
-        decode_responses=False
+        decode_responses=False,
     )
 
+
 def get_minio_client():
     """Returns a configured MinIO client"""
     import minio
-    
+
     return minio.Minio(
-        MINIO_HOST,
-        access_key=MINIO_ACCESS_KEY,
-        secret_key=MINIO_SECRET_KEY,
-        secure=MINIO_SECURE
+        MINIO_HOST, access_key=MINIO_ACCESS_KEY, secret_key=MINIO_SECRET_KEY, secure=MINIO_SECURE
     )
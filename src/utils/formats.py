@@ -0,0 +1,17 @@
+"""
+Formats of the prediction results.
+
+Shared by the server, which validates the `format` and `compression` of
+`/predict`, and `ml.predict`, which writes the results, without the heavy
+imports of the latter.
+"""
+
+RESULT_FORMATS = ("parquet", "arrow", "numpy")
+
+# Compression codecs of each format that polars writes (it reads but does not
+# write LZO parquet files), the .npy files are not compressed
+RESULT_COMPRESSIONS = {
+    "parquet": ("uncompressed", "snappy", "gzip", "brotli", "lz4", "zstd"),
+    "arrow": ("uncompressed", "lz4", "zstd"),
+    "numpy": (),
+}
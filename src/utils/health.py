@@ -0,0 +1,146 @@
+"""
+Health of the server and of the services it depends on.
+
+The server runs `Prober.run` in a background thread, which checks Redis, MinIO
+and the queue every `HEALTH_CHECK_INTERVAL` seconds and keeps the result in
+memory. `/health` and `/ready` only read this snapshot, so that the probes of
+Kubernetes and Envoy neither call the services nor wait for a slow one:
+
+- `/health` (liveness) fails only if the snapshot is stale, i.e. the prober is
+  stuck or dead. Restarting the server does not fix an outage of Redis or
+  MinIO, and restarting every server at once because of one would only make
+  it worse.
+- `/ready` (readiness) also fails while a service is unavailable, so that
+  requests are routed to the servers that can handle them.
+
+Each service is checked in its own thread, with a timeout of
+`HEALTH_CHECK_TIMEOUT` seconds: a service that does not answer is reported as
+unavailable without delaying the checks of the others.
+"""
+
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+import src.utils.config as config
+from src.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+class Prober:
+    """
+    Check the services periodically and keep their status in memory.
+
+    Parameters
+    ----------
+    minio : minio.Minio
+        MinIO client.
+    queue : rq.Queue
+        The queue of the jobs, whose connection is the Redis connection.
+    interval : float, optional
+        Seconds between two checks (default `HEALTH_CHECK_INTERVAL`).
+    timeout : float, optional
+        Seconds after which a service that has not answered is reported as
+        unavailable (default `HEALTH_CHECK_TIMEOUT`).
+    stale_after : float, optional
+        Age in seconds after which the snapshot is stale (default
+        `HEALTH_STALE_AFTER`).
+    """
+
+    def __init__(self, minio, queue, interval=None, timeout=None, stale_after=None):
+        self.minio = minio
+        self.queue = queue
+        self.interval = config.HEALTH_CHECK_INTERVAL if interval is None else interval
+        self.timeout = config.HEALTH_CHECK_TIMEOUT if timeout is None else timeout
+        self.stale_after = config.HEALTH_STALE_AFTER if stale_after is None else stale_after
+        self.checks = {
+            "redis": self.check_redis,
+            "minio": self.check_minio,
+            "queue": self.check_queue,
+        }
+        # One thread per service, so that one that hangs only delays its own checks
+        self.executors = {
+            name: ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"health-{name}")
+            for name in self.checks
+        }
+        # The last check of each service, which may still be running
+        self.futures = {}
+        self.started_at = time.time()
+        # Replaced as a whole by each check, so readers need no lock
+        self.services = None
+        self.checked_at = None
+
+    def check_redis(self):
+        info = self.queue.connection.info("server")
+        return {"version": info.get("redis_version", "unknown")}
+
+    def check_minio(self):
+        return {"buckets": [bucket.name for bucket in self.minio.list_buckets()]}
+
+    def check_queue(self):
+        return {"jobs": self.queue.count}
+
+    def check(self):
+        """Check all the services and update the snapshot."""
+        start = time.time()
+        for name, check in self.checks.items():
+            future = self.futures.get(name)
+            # A check that has not answered yet is awaited again rather than
+            # queued behind
+            if future is None or future.done():
+                self.futures[name] = self.executors[name].submit(check)
+        services = {}
+        for name, future in self.futures.items():
+            try:
+                remaining = max(0, self.timeout - (time.time() - start))
+                services[name] = {"status": "ok", **future.result(timeout=remaining)}
+            except TimeoutError:
+                logger.warning("Health check - %s did not answer in %ss", name, self.timeout)
+                services[name] = {"status": "error", "error": "timed out"}
+            except Exception as e:
+                logger.warning("Health check - %s error: %s", name, e)
+                services[name] = {"status": "error", "error": str(e)}
+        self.services = services
+        self.checked_at = time.time()
+        logger.debug("Health check completed in %.3fs", self.checked_at - start)
+
+    def run(self):
+        """Check the services every `interval` seconds, forever."""
+        while True:
+            try:
+                self.check()
+            except Exception as e:
+                logger.error("Health check failed: %s: %s", type(e).__name__, e, exc_info=True)
+            time.sleep(self.interval)
+
+    def snapshot(self):
+        """
+        The last status of the services.
+
+        Returns
+        -------
+        dict
+            With the keys:
+
+            - 'status': 'ok', 'degraded' if a service is unavailable, or
+              'starting' before the first check.
+            - 'services': the status of each service.
+            - 'checked_at': UNIX time of the last check (None before the first).
+            - 'age': seconds since the last check (or since the start).
+            - 'stale': whether the age exceeds `stale_after`.
+        """
+        services, checked_at = self.services, self.checked_at
+        age = time.time() - (self.started_at if checked_at is None else checked_at)
+        if services is None:
+            status = "starting"
+        elif all(service["status"] == "ok" for service in services.values()):
+            status = "ok"
+        else:
+            status = "degraded"
+        return {
+            "status": status,
+            "services": services or {},
+            "checked_at": checked_at,
+            "age": age,
+            "stale": age > self.stale_after,
+        }
@@ -0,0 +1,52 @@
+"""
+Deadlines and cancellation of the RQ jobs.
+
+A job submitted with a deadline carries it in `job.meta["deadline"]`, as a
+UNIX timestamp. Workers do not start a job whose deadline has passed, and stop
+it with RQ's stop-job command if it is still running when the deadline passes
+(see `src.core.worker.Worker`).
+"""
+
+import time
+
+from rq.job import Job, JobStatus
+
+from src.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+def deadline_meta(seconds):
+    """Job meta for a deadline `seconds` from now (None for no deadline)."""
+    if seconds is None:
+        return {}
+    return {"deadline": time.time() + float(seconds)}
+
+
+def deadline_passed(job):
+    """Whether the deadline of `job`, if it has one, has passed."""
+    deadline = job.meta.get("deadline")
+    return deadline is not None and time.time() > deadline
+
+
+def cancel(job):
+    """
+    Cancel `job`, which has not started, and the jobs waiting for it.
+
+    The dependents of a canceled (or stopped) job can never run, so they are
+    canceled as well instead of staying deferred forever.
+    """
+    if job.get_status() not in (JobStatus.CANCELED, JobStatus.STOPPED):
+        job.cancel()
+        logger.info("Job %s canceled", job.id)
+    cancel_dependents(job)
+
+
+def cancel_dependents(job):
+    """Cancel the deferred jobs that depend on `job`, recursively."""
+    dependents = Job.fetch_many(
+        job.dependent_ids, connection=job.connection, serializer=job.serializer
+    )
+    for dependent in dependents:
+        if dependent is not None and dependent.get_status() == JobStatus.DEFERRED:
+            cancel(dependent)
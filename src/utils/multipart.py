@@ -0,0 +1,36 @@
+"""
+Multipart uploads of MinIO objects whose parts are uploaded with presigned
+urls, by the client (see `/multipart_upload` in `src.api.server`).
+
+minio-py only implements the multipart upload requests as protected methods
+of `Minio`, which may change in any release: this module is the only one that
+calls them, minio is pinned in requirements.txt, and
+tests/integration/test_006_multipart.py checks them against MinIO.
+"""
+
+
+def create(minio, bucket, name):
+    """Start a multipart upload of the object `name` of `bucket`, and return its ID."""
+    return minio._create_multipart_upload(bucket, name, {})
+
+
+def list_parts(minio, bucket, name, upload_id):
+    """The parts (`minio.datatypes.Part`) uploaded so far by the upload `upload_id`."""
+    parts = []
+    marker = None
+    while True:
+        listing = minio._list_parts(bucket, name, upload_id, part_number_marker=marker)
+        parts.extend(listing.parts)
+        if not listing.is_truncated:
+            return parts
+        marker = str(listing.next_part_number_marker)
+
+
+def complete(minio, bucket, name, upload_id, parts):
+    """Complete the upload `upload_id` with `parts`, see `list_parts`."""
+    minio._complete_multipart_upload(bucket, name, upload_id, parts)
+
+
+def abort(minio, bucket, name, upload_id):
+    """Abort the upload `upload_id` and remove its parts."""
+    minio._abort_multipart_upload(bucket, name, upload_id)
@@ -0,0 +1,210 @@
+"""
+Retention of the objects stored in MinIO and of the jobs kept in Redis.
+
+The server runs `run` in a background thread. Every `SWEEP_INTERVAL` seconds,
+`sweep` removes:
+
+- the datasets, models and results that were neither written nor used for
+  longer than the retention of their bucket, with batched `remove_objects`
+  calls,
+- the canceled jobs older than `FAILED_JOB_RETENTION`, which RQ never removes,
+  along with the expired entries of the other RQ registries.
+
+It also moves the jobs left in the queues of the workers that died to the
+shared queue (see `src.utils.affinity`).
+
+The jobs reference the datasets and models they read in `job.meta["refs"]`
+(see `track`), and an object referenced by a job that is still pending (queued,
+deferred, scheduled or started) is never removed, however old it is. `track`
+also records when each object was last used, so that e.g. a model used for
+predictions every day is kept even if it was trained long ago. The last uses
+are only recorded for the buckets that have a retention, so that they do not
+grow forever.
+"""
+
+import datetime
+import time
+
+from minio.deleteobjects import DeleteObject
+from rq.job import Job
+from rq.registry import CanceledJobRegistry, clean_registries
+
+import src.utils.affinity as affinity
+import src.utils.config as config
+from src.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Redis key of the sorted set of the objects of a bucket, scored by last use
+LAST_USED_KEY = "neuralk:last_used:{bucket}"
+# Redis key that a server holds while sweeping, so that only one server sweeps
+SWEEP_LOCK_KEY = "neuralk:sweeper:lock"
+
+
+def retention(bucket):
+    """Retention in seconds of the objects of `bucket` (0 for forever)."""
+    return {
+        "datasets": config.DATASET_RETENTION,
+        "models": config.MODEL_RETENTION,
+        "results": config.RESULT_RETENTION,
+    }[bucket]
+
+
+def track(connection, datasets=(), models=()):
+    """
+    Record that a job uses the given datasets and models, and return the job
+    meta that references them.
+
+    Parameters
+    ----------
+    connection : redis.Redis
+        Redis connection.
+    datasets : sequence of str
+        IDs of the datasets read by the job.
+    models : sequence of str
+        IDs of the models read by the job.
+
+    Returns
+    -------
+    dict
+        Meta of the job, to keep the objects while the job is pending.
+    """
+    refs = {"datasets": list(datasets), "models": list(models)}
+    now = time.time()
+    with connection.pipeline() as pipeline:
+        for bucket, ids in refs.items():
+            if ids and retention(bucket) > 0:
+                pipeline.zadd(LAST_USED_KEY.format(bucket=bucket), {id: now for id in ids})
+        pipeline.execute()
+    return {"refs": refs}
+
+
+def pending_refs(queue):
+    """IDs of the objects of each bucket referenced by the pending jobs of `queue`,
+    including those in the queues of its workers."""
+    job_ids = set()
+    for q in [queue, *affinity.worker_queues(queue)]:
+        job_ids.update(q.get_job_ids())
+        for registry in (
+            q.deferred_job_registry,
+            q.scheduled_job_registry,
+            q.started_job_registry,
+        ):
+            job_ids.update(registry.get_job_ids())
+    refs = {"datasets": set(), "models": set()}
+    for job in Job.fetch_many(
+        list(job_ids), connection=queue.connection, serializer=queue.serializer
+    ):
+        if job is None:
+            continue
+        for bucket, ids in job.meta.get("refs", {}).items():
+            refs.setdefault(bucket, set()).update(ids)
+    return refs
+
+
+def sweep_bucket(minio, connection, bucket, keep=()):
+    """
+    Remove the objects of `bucket` unused for longer than its retention.
+
+    Parameters
+    ----------
+    minio : minio.Minio
+        MinIO client.
+    connection : redis.Redis
+        Redis connection.
+    bucket : str
+        The bucket to sweep.
+    keep : collection of str
+        Objects that are kept regardless of their age.
+
+    Returns
+    -------
+    int
+        Number of objects removed.
+    """
+    ttl = retention(bucket)
+    last_used_key = LAST_USED_KEY.format(bucket=bucket)
+    if ttl <= 0:
+        # Last uses recorded while the bucket had a retention
+        connection.delete(last_used_key)
+        return 0
+    cutoff = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(seconds=ttl)
+    expired = [
+        obj.object_name
+        for obj in minio.list_objects(bucket, recursive=True)
+        if obj.last_modified < cutoff and obj.object_name not in keep
+    ]
+    if expired:
+        # Read the last uses only now, so that an object used since the
+        # listing is kept
+        last_used = connection.zmscore(last_used_key, expired)
+        expired = [
+            name
+            for name, used in zip(expired, last_used)
+            if used is None or used < cutoff.timestamp()
+        ]
+    removed = 0
+    for start in range(0, len(expired), 1000):
+        batch = expired[start : start + 1000]
+        # `remove_objects` is lazy: errors are only reported while iterating
+        errors = list(minio.remove_objects(bucket, [DeleteObject(name) for name in batch]))
+        for error in errors:
+            logger.warning("Could not remove %s/%s: %s", bucket, error.name, error.message)
+        failed = {error.name for error in errors}
+        done = [name for name in batch if name not in failed]
+        if done:
+            connection.zrem(last_used_key, *done)
+        removed += len(done)
+    connection.zremrangebyscore(last_used_key, "-inf", cutoff.timestamp())
+    return removed
+
+
+def sweep_jobs(queue):
+    """Clean up the registries of `queue` and remove its old canceled jobs.
+
+    Returns the number of canceled jobs removed."""
+    clean_registries(queue)
+    registry = CanceledJobRegistry(queue.name, queue.connection, serializer=queue.serializer)
+    # Canceled jobs are scored by the time when they were canceled
+    cutoff = time.time() - config.FAILED_JOB_RETENTION
+    job_ids = [
+        job_id.decode() for job_id in queue.connection.zrangebyscore(registry.key, "-inf", cutoff)
+    ]
+    for job in Job.fetch_many(job_ids, connection=queue.connection, serializer=queue.serializer):
+        if job is not None:
+            job.delete(remove_from_queue=False)
+    if job_ids:
+        queue.connection.zrem(registry.key, *job_ids)
+    return len(job_ids)
+
+
+def sweep(minio, queue):
+    """Remove the objects and jobs whose retention has expired, see the module
+    documentation."""
+    connection = queue.connection
+    # The abandoned jobs of a worker that died may be retried in its queue, so
+    # its queue is released after its registries are cleaned up
+    canceled = sum(sweep_jobs(q) for q in [queue, *affinity.worker_queues(queue)])
+    released = affinity.release_dead_workers(queue)
+    refs = pending_refs(queue)
+    removed = {
+        bucket: sweep_bucket(minio, connection, bucket, keep=refs.get(bucket, ()))
+        for bucket in ("datasets", "models", "results")
+    }
+    removed["canceled jobs"] = canceled
+    removed["released jobs"] = released
+    logger.info("Retention sweep removed %s", removed)
+    return removed
+
+
+def run(minio, queue, interval=None):
+    """Sweep every `interval` seconds (default `SWEEP_INTERVAL`), forever.
+    Only one of the servers sharing a Redis instance sweeps in each interval."""
+    interval = config.SWEEP_INTERVAL if interval is None else interval
+    while True:
+        try:
+            if queue.connection.set(SWEEP_LOCK_KEY, 1, nx=True, ex=interval):
+                sweep(minio, queue)
+        except Exception as e:
+            logger.error("Retention sweep failed: %s: %s", type(e).__name__, e, exc_info=True)
+        time.sleep(interval)
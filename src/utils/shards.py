@@ -0,0 +1,164 @@
+"""
+Sharding of the predictions on large datasets.
+
+`/predict` splits a dataset of more than `PREDICT_SHARD_ROWS` rows into shards
+of whole row groups (`plan`), found in the footer of its parquet file, which is
+read without the rest of the file (`read_metadata`). The footer of datasets
+smaller than `PREDICT_SHARD_MIN_BYTES` is not read: they are not sharded.
+Each shard is predicted by its own `ml.predict` job, which downloads only the
+footer and the row groups of the shard (`read_footer`, `byte_range`) with
+range requests, and uploads its own result, so that the shards are predicted
+in parallel by the workers. A fan-in job, `ml.gather_shards`, which depends on all of them, has
+the ID of the prediction: it finishes once all the shards have. `/result` then
+returns the urls of the results of the shards, in the order of the rows, and
+`Client.download` concatenates them.
+"""
+
+import math
+import struct
+
+import src.utils.config as config
+
+
+def _read_range(minio, bucket, name, version_id, offset, length):
+    response = minio.get_object(bucket, name, offset=offset, length=length, version_id=version_id)
+    try:
+        return response.read()
+    finally:
+        response.close()
+        response.release_conn()
+
+
+def read_footer(read_range, size, what):
+    """
+    Footer of a parquet file of `size` bytes (described by `what` in errors),
+    followed by its length and magic number, i.e. the end of the file.
+
+    Parameters
+    ----------
+    read_range : callable
+        `read_range(offset, length)` returns `length` bytes of the file, from
+        byte `offset`.
+    size : int
+        Size of the file.
+    what : str
+        Description of the file in errors.
+
+    Raises a ValueError if the file is not a parquet file.
+    """
+    # A parquet file starts with "PAR1", and ends with its footer, the length
+    # of the footer (4 bytes, little-endian) and "PAR1"
+    if size < 12:
+        raise ValueError(f"{what} is not a parquet file")
+    end = read_range(size - 8, 8)
+    if end[4:] != b"PAR1":
+        raise ValueError(f"{what} is not a parquet file")
+    (footer_length,) = struct.unpack("<I", end[:4])
+    if footer_length > size - 12:
+        raise ValueError(f"{what} is not a parquet file")
+    return read_range(size - 8 - footer_length, footer_length) + end
+
+
+def parse_footer(footer):
+    """Parquet metadata of the `footer` returned by `read_footer`."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    # Reading the metadata does not read the row groups, so a file without
+    # them will do
+    return pq.read_metadata(pa.BufferReader(b"PAR1" + footer))
+
+
+def read_metadata(minio, bucket, name, size=None, version_id=None):
+    """
+    Parquet metadata of the object `name` of `bucket` (of its version
+    `version_id`, if given), read from its footer only. `size` is the size of
+    the object, if known.
+
+    Raises a ValueError if the object is not a parquet file.
+    """
+    if size is None:
+        size = minio.stat_object(bucket, name, version_id=version_id).size
+
+    def read_range(offset, length):
+        return _read_range(minio, bucket, name, version_id, offset, length)
+
+    return parse_footer(read_footer(read_range, size, f"{bucket}/{name}"))
+
+
+def byte_range(metadata, offset, length):
+    """
+    Row groups that hold `length` rows from row `offset`, for the shard of a
+    prediction.
+
+    Returns
+    -------
+    row_groups : list of int
+        Indices of the row groups.
+    first_row : int
+        Index of the first row of the first of them.
+    start, end : int
+        Byte range of the file in which their column chunks are.
+    """
+    row_groups, first_row, start, end = [], 0, math.inf, 0
+    row = 0
+    for i in range(metadata.num_row_groups):
+        row_group = metadata.row_group(i)
+        if row < offset + length and row + row_group.num_rows > offset:
+            if not row_groups:
+                first_row = row
+            row_groups.append(i)
+            for j in range(row_group.num_columns):
+                column = row_group.column(j)
+                column_start = column.data_page_offset
+                if column.has_dictionary_page and column.dictionary_page_offset is not None:
+                    column_start = min(column_start, column.dictionary_page_offset)
+                start = min(start, column_start)
+                end = max(end, column_start + column.total_compressed_size)
+        row += row_group.num_rows
+    return row_groups, first_row, (0 if start == math.inf else start), end
+
+
+def should_read(size, n_shards=None):
+    """Whether to read the footer of a dataset of `size` bytes to `plan` its shards."""
+    if n_shards is not None:
+        return n_shards > 1
+    return config.PREDICT_SHARD_ROWS > 0 and size >= config.PREDICT_SHARD_MIN_BYTES
+
+
+def plan(metadata, n_shards=None):
+    """
+    Rows of each shard of a prediction.
+
+    Parameters
+    ----------
+    metadata : pyarrow.parquet.FileMetaData
+        Metadata of the dataset.
+    n_shards : int, optional
+        Number of shards. By default, enough for shards of at most
+        `PREDICT_SHARD_ROWS` rows (no sharding if it is 0), and at most
+        `PREDICT_MAX_SHARDS`.
+
+    Returns
+    -------
+    list of (int, int)
+        The offset and number of rows of each shard, in order. The shards are
+        made of whole row groups, with about the same number of rows: there
+        are fewer than `n_shards` if there are not enough row groups.
+    """
+    num_rows = metadata.num_rows
+    if n_shards is None:
+        if config.PREDICT_SHARD_ROWS <= 0:
+            return [(0, num_rows)]
+        n_shards = min(math.ceil(num_rows / config.PREDICT_SHARD_ROWS), config.PREDICT_MAX_SHARDS)
+    if n_shards <= 1 or num_rows == 0:
+        return [(0, num_rows)]
+    shards = []
+    start = end = 0
+    for i in range(metadata.num_row_groups):
+        end += metadata.row_group(i).num_rows
+        # Cut after the row group that reaches the next 1 / n_shards of the rows
+        if end > start and end >= num_rows * (len(shards) + 1) / n_shards:
+            shards.append((start, end - start))
+            start = end
+    return shards
@@ -1,7 +1,27 @@
+import uuid
+
 from client import Client
 import pytest
 
+import src.utils.config as config
+
+
 @pytest.fixture(scope="session")
 def client():
     """Create a client instance for the test class."""
-    return Client()
\ No newline at end of file
+    return Client()
+
+
+@pytest.fixture
+def queue(monkeypatch, tmp_path):
+    """A queue of its own, to be worked on by a worker of the test process
+    (`src.core.worker.Worker(...).work(burst=True)`)."""
+    from rq import Queue
+
+    monkeypatch.setattr(config, "WORKER_PRELOAD", [])
+    monkeypatch.setattr(config, "WORKER_READY_FILE", str(tmp_path / "ready"))
+    monkeypatch.setattr(config, "AFFINITY_MAX_QUEUED", 0)
+    monkeypatch.setattr(config, "CACHE_DIR", str(tmp_path / "cache"))
+    queue = Queue(f"test-{uuid.uuid4()}", connection=config.get_redis_connection())
+    yield queue
+    queue.delete(delete_jobs=True)
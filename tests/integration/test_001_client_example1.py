@@ -27,4 +27,4 @@ class TestClientExample1:
         assert prediction_id is not None, "Prediction ID should not be None after prediction"
 
         prediction = client.download(prediction_id)
-        assert prediction is not None, "Prediction should not be None after prediction"
\ No newline at end of file
+        assert prediction is not None, "Prediction should not be None after prediction"
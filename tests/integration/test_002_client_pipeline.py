@@ -0,0 +1,29 @@
+import pytest
+from make_data import generate_data
+from rq.job import Job
+
+import src.utils.config as config
+
+
+class TestClientPipeline:
+    @pytest.fixture(scope="session", autouse=True)
+    def generate_test_data(self):
+        """Generate test data once per session, automatically."""
+        generate_data(output_dir="tests/integration/data")
+
+    @pytest.mark.integration
+    def test_client_pipeline(self, client):
+        train_id = client.upload("tests/integration/data/train.parquet")
+        test_id = client.upload("tests/integration/data/test.parquet")
+
+        model_id, prediction_id = client.pipeline(train_id, test_id, timeout=240)
+        assert model_id is not None, "Model ID should not be None after the pipeline"
+        assert prediction_id is not None, "Prediction ID should not be None after the pipeline"
+
+        prediction = client.download(prediction_id)
+        assert prediction.columns == ["y"], "Prediction should have a single 'y' column"
+
+        job = Job.fetch(prediction_id, connection=config.get_redis_connection())
+        # After a (simulated) error, the retry loads the model instead
+        if not job.number_of_retries:
+            assert job.meta["model_source"] == "memory", "The model should be handed over"
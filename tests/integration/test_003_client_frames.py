@@ -0,0 +1,25 @@
+import polars as pl
+import pytest
+from make_data import generate_data
+
+
+class TestClientFrames:
+    @pytest.fixture(scope="session", autouse=True)
+    def generate_test_data(self):
+        """Generate test data once per session, automatically."""
+        generate_data(output_dir="tests/integration/data")
+
+    @pytest.mark.integration
+    def test_client_frames(self, client):
+        train = pl.read_parquet("tests/integration/data/train.parquet")
+        test = pl.read_parquet("tests/integration/data/test.parquet")
+        train_id = client.upload_frame(train)
+        # In parts of the smallest size allowed
+        test_id = client.upload_frame(test.to_arrow(), row_group_size=1000, part_size=5 * 2**20)
+
+        model_id, prediction_id = client.pipeline(train_id, test_id, timeout=240)
+
+        prediction = client.download_lazy(prediction_id)
+        assert isinstance(prediction, pl.LazyFrame), "download_lazy should return a LazyFrame"
+        assert prediction.select(pl.len()).collect().item() == len(test)
+        assert prediction.collect().equals(client.download(prediction_id))
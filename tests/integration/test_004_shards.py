@@ -0,0 +1,90 @@
+import io
+
+import polars as pl
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+import requests
+from make_data import generate_data
+
+import src.core.ml as ml
+import src.utils.config as config
+import src.utils.shards as sharding
+
+
+def _metadata(num_rows, row_group_size):
+    buf = io.BytesIO()
+    pq.write_table(pa.table({"x": range(num_rows)}), buf, row_group_size=row_group_size)
+    return pq.read_metadata(pa.BufferReader(buf.getvalue()))
+
+
+class TestShards:
+    @pytest.fixture(scope="session", autouse=True)
+    def generate_test_data(self):
+        """Generate test data once per session, automatically."""
+        generate_data(output_dir="tests/integration/data")
+
+    def test_plan(self):
+        # 7 row groups: 6 of 3000 rows and one of 2000
+        metadata = _metadata(20_000, 3000)
+        assert sharding.plan(metadata, 3) == [(0, 9000), (9000, 6000), (15000, 5000)]
+        assert sharding.plan(metadata, 1) == [(0, 20_000)]
+        # No more shards than row groups
+        assert len(sharding.plan(metadata, 100)) == 7
+        assert sharding.plan(_metadata(0, 3000), 3) == [(0, 0)]
+
+    @pytest.mark.integration
+    def test_download_rows(self, monkeypatch, tmp_path):
+        test = pl.read_parquet("tests/integration/data/test.parquet")
+        buf = io.BytesIO()
+        pq.write_table(test.to_arrow(), buf, row_group_size=len(test) // 7 + 1)
+        data = buf.getvalue()
+        minio = config.get_minio_client()
+        name = "test-shards.parquet"
+        minio.put_object("datasets", name, io.BytesIO(data), len(data))
+        url = minio.get_presigned_url("GET", "datasets", name)
+
+        downloaded = []
+
+        def get(*args, **kwargs):
+            response = requests.Session().get(*args, **kwargs)
+            downloaded.append(len(response.content))
+            return response
+
+        monkeypatch.setattr(requests, "get", get)
+        metadata = pq.read_metadata(pa.BufferReader(data))
+        path = tmp_path / "shard.parquet"
+        try:
+            for offset, length in sharding.plan(metadata, 3):
+                downloaded.clear()
+                ml._download_rows(url, path, offset, length)
+                assert pl.read_parquet(path).equals(test.slice(offset, length))
+                row_groups, _, start, end = sharding.byte_range(metadata, offset, length)
+                chunks = sum(
+                    metadata.row_group(i).column(j).total_compressed_size
+                    for i in row_groups
+                    for j in range(metadata.num_columns)
+                )
+                assert end - start == chunks
+                # The size, the end of the file and its footer, and the row groups
+                footer = metadata.serialized_size + 8
+                assert sum(downloaded) <= 1 + footer + chunks, "Only the shard should be downloaded"
+        finally:
+            minio.remove_object("datasets", name)
+
+    @pytest.mark.integration
+    def test_sharded_prediction(self, client):
+        train_id = client.upload("tests/integration/data/train.parquet")
+        test = pl.read_parquet("tests/integration/data/test.parquet")
+        test_id = client.upload_frame(test, row_group_size=len(test) // 7 + 1)
+        model_id = client.fit(train_id, timeout=240)
+
+        prediction_id = client.predict(test_id, model_id, timeout=240, shards=3)
+        # Another compression, so that the cached prediction is not reused
+        whole_id = client.predict(test_id, model_id, timeout=240, compression="snappy", shards=1)
+        prediction = client.download(prediction_id)
+        assert len(prediction) == len(test)
+        assert prediction.equals(
+            client.download(whole_id)
+        ), "Shards should be in the order of the rows"
+        assert client.download_lazy(prediction_id).collect().equals(prediction)
@@ -0,0 +1,48 @@
+import polars as pl
+import pytest
+import requests
+from make_data import generate_data
+
+
+class TestResultFormats:
+    @pytest.fixture(scope="session", autouse=True)
+    def generate_test_data(self):
+        """Generate test data once per session, automatically."""
+        generate_data(output_dir="tests/integration/data")
+
+    @pytest.mark.integration
+    @pytest.mark.parametrize("labels", ["int", "str"])
+    def test_result_formats(self, client, labels):
+        train = pl.read_parquet("tests/integration/data/train.parquet")
+        test = pl.read_parquet("tests/integration/data/test.parquet")
+        if labels == "str":
+            train = train.with_columns(pl.format("class_{}", "y").alias("y"))
+        train_id = client.upload_frame(train)
+        test_id = client.upload_frame(test)
+        model_id = client.fit(train_id, timeout=240)
+
+        expected = client.download(client.predict(test_id, model_id, timeout=240))
+        assert expected["y"].dtype == (pl.String if labels == "str" else train["y"].dtype)
+        for output_format in ("arrow", "numpy"):
+            prediction_id = client.predict(
+                test_id, model_id, timeout=240, output_format=output_format
+            )
+            prediction = client.download(prediction_id)
+            assert prediction.equals(expected), f"{output_format} result differs from parquet"
+
+    @pytest.mark.integration
+    @pytest.mark.parametrize(
+        "output_format,compression", [("arrow", "snappy"), ("parquet", "nope"), ("numpy", "zstd")]
+    )
+    def test_bad_compression(self, client, output_format, compression):
+        # Rejected by the server, before any job is started
+        response = requests.post(
+            f"{client.url}/predict",
+            params={
+                "dataset_id": "any",
+                "model_id": "any",
+                "format": output_format,
+                "compression": compression,
+            },
+        )
+        assert response.status_code == 400
@@ -0,0 +1,51 @@
+import uuid
+
+import pytest
+import requests
+
+import src.utils.config as config
+import src.utils.multipart as multipart
+
+PART_SIZE = 5 * 2**20
+
+
+class TestMultipart:
+    @pytest.fixture(scope="class")
+    def minio(self):
+        return config.get_minio_client()
+
+    def _upload_part(self, minio, name, upload_id, number, data):
+        url = minio.get_presigned_url(
+            "PUT",
+            "datasets",
+            name,
+            extra_query_params={"uploadId": upload_id, "partNumber": str(number)},
+        )
+        requests.put(url, data=data).raise_for_status()
+
+    @pytest.mark.integration
+    def test_complete(self, minio):
+        name = str(uuid.uuid4())
+        upload_id = multipart.create(minio, "datasets", name)
+        chunks = [b"a" * PART_SIZE, b"b" * PART_SIZE, b"c"]
+        for number, chunk in enumerate(chunks, 1):
+            self._upload_part(minio, name, upload_id, number, chunk)
+
+        parts = multipart.list_parts(minio, "datasets", name, upload_id)
+        assert [part.part_number for part in parts] == [1, 2, 3]
+        multipart.complete(minio, "datasets", name, upload_id, parts)
+        response = minio.get_object("datasets", name)
+        try:
+            assert response.read() == b"".join(chunks)
+        finally:
+            response.close()
+            response.release_conn()
+        minio.remove_object("datasets", name)
+
+    @pytest.mark.integration
+    def test_abort(self, minio):
+        name = str(uuid.uuid4())
+        upload_id = multipart.create(minio, "datasets", name)
+        self._upload_part(minio, name, upload_id, 1, b"a")
+        multipart.abort(minio, "datasets", name, upload_id)
+        assert not list(minio.list_objects("datasets", prefix=name))
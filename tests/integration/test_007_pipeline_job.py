@@ -0,0 +1,70 @@
+import pytest
+from make_data import generate_data
+from rq import Retry
+
+import src.core.ml as ml
+import src.utils.config as config
+from src.core.worker import Worker
+
+
+class TestPipelineJob:
+    @pytest.fixture(scope="session", autouse=True)
+    def generate_test_data(self):
+        """Generate test data once per session, automatically."""
+        generate_data(output_dir="tests/integration/data")
+
+    @pytest.fixture
+    def errors(self, monkeypatch, tmp_path):
+        """Replace the simulated errors by those of the returned list, one per
+        call (None for no error), and count the calls in the file `calls`. The
+        work-horses inherit the replacement."""
+        calls_path = tmp_path / "calls"
+        calls_path.write_text("")
+        planned = []
+
+        def error_maybe():
+            calls = len(calls_path.read_text())
+            calls_path.write_text("." * (calls + 1))
+            if calls < len(planned) and planned[calls] is not None:
+                raise planned[calls]
+
+        monkeypatch.setattr(ml, "_error_maybe", error_maybe)
+        monkeypatch.setattr(config, "MODEL_CACHE_DIR", str(tmp_path / "models"))
+        return planned
+
+    def _pipeline(self, client, queue):
+        """Run a pipeline job in a worker of the test process."""
+        minio = config.get_minio_client()
+        train_id = client.upload("tests/integration/data/train.parquet")
+        test_id = client.upload("tests/integration/data/test.parquet")
+        model_id = f"test-{train_id}"
+        job = queue.enqueue(
+            ml.pipeline,
+            args=(
+                minio.get_presigned_url("GET", "datasets", train_id),
+                minio.get_presigned_url("PUT", "models", model_id),
+                minio.get_presigned_url("GET", "datasets", test_id),
+                minio.get_presigned_url("GET", "models", model_id),
+                minio.get_presigned_url("PUT", "results", f"test-{test_id}"),
+                model_id,
+            ),
+            retry=Retry(max=1),
+        )
+        Worker([queue], connection=queue.connection).work(burst=True)
+        return job
+
+    @pytest.mark.integration
+    def test_model_from_memory(self, client, queue, errors):
+        job = self._pipeline(client, queue)
+        assert job.get_status() == "finished"
+        assert job.meta["model_source"] == "memory", "The prediction should use the fitted model"
+
+    @pytest.mark.integration
+    def test_retry_from_model_cache(self, client, queue, errors, tmp_path):
+        # The fit succeeds, the prediction fails once
+        errors.extend([None, RuntimeError("transient")])
+        job = self._pipeline(client, queue)
+        assert job.get_status() == "finished"
+        assert job.number_of_retries == 1
+        assert len((tmp_path / "calls").read_text()) == 3, "The model should be fitted once"
+        assert job.meta["model_source"] == "cache", "The retry should not fit the model again"
@@ -0,0 +1,91 @@
+import os
+import signal
+
+import pytest
+from rq import Retry
+
+import src.utils.config as config
+from src.core.checkpoint import Checkpoint
+from src.core.worker import Worker
+
+
+def _staged(log_path, error):
+    """A job in two stages, whose second stage fails with `error` the first time."""
+    checkpoint = Checkpoint()
+    if not checkpoint.done("download", "data.txt"):
+        with open(log_path, "a") as f:
+            f.write("download\n")
+        checkpoint.path("data.txt").write_text("data")
+        checkpoint.complete("download")
+    with open(log_path, "a") as f:
+        f.write("train\n")
+    if open(log_path).read().count("train") == 1:
+        raise error
+    checkpoint.clear()
+
+
+def _killed():
+    """A job whose work-horse is killed after its first stage."""
+    checkpoint = Checkpoint()
+    checkpoint.path("data.txt").write_text("data")
+    checkpoint.complete("download")
+    os.kill(os.getpid(), signal.SIGKILL)
+
+
+class TestCheckpoint:
+    @pytest.mark.integration
+    def test_resume_after_retry(self, queue, tmp_path):
+        log_path = tmp_path / "stages.log"
+        job = queue.enqueue(
+            _staged, args=(str(log_path), RuntimeError("transient")), retry=Retry(max=1)
+        )
+        Worker([queue], connection=queue.connection).work(burst=True)
+
+        assert job.get_status() == "finished"
+        assert log_path.read_text().split() == [
+            "download",
+            "train",
+            "train",
+        ], "The retry should resume after the completed download stage"
+        assert not (tmp_path / "cache" / job.id).exists(), "The artifacts should be removed"
+
+    @pytest.mark.integration
+    def test_no_resume_after_failure(self, queue, tmp_path):
+        log_path = tmp_path / "stages.log"
+        job = queue.enqueue(_staged, args=(str(log_path), ValueError("bug")), retry=Retry(max=1))
+        Worker([queue], connection=queue.connection).work(burst=True)
+
+        # Only RuntimeErrors are retried
+        assert job.get_status() == "failed"
+        assert log_path.read_text().split() == ["download", "train"]
+        assert not (tmp_path / "cache" / job.id).exists(), "The artifacts should be removed"
+
+    @pytest.mark.integration
+    def test_clear_after_killed(self, queue, tmp_path):
+        job = queue.enqueue(_killed)
+        Worker([queue], connection=queue.connection).work(burst=True)
+
+        # The work-horse could not clean up after itself
+        assert job.get_status() == "failed"
+        assert not (tmp_path / "cache" / job.id).exists(), "The artifacts should be removed"
+
+    @pytest.mark.integration
+    def test_sweep_after_retry_elsewhere(self, queue, tmp_path, monkeypatch):
+        log_path = tmp_path / "stages.log"
+        job = queue.enqueue(
+            _staged, args=(str(log_path), RuntimeError("transient")), retry=Retry(max=1)
+        )
+        first, second = tmp_path / "first", tmp_path / "second"
+        monkeypatch.setattr(config, "CACHE_DIR", str(first))
+        Worker([queue], connection=queue.connection).work(burst=True, max_jobs=1)
+        assert (first / job.id).exists(), "The artifacts should be kept for the retry"
+
+        # The retry runs on another worker, which cannot see the artifacts
+        monkeypatch.setattr(config, "CACHE_DIR", str(second))
+        Worker([queue], connection=queue.connection).work(burst=True)
+        assert job.get_status() == "finished"
+        assert log_path.read_text().split() == ["download", "train", "download", "train"]
+
+        monkeypatch.setattr(config, "CACHE_DIR", str(first))
+        Worker([queue], connection=queue.connection).work(burst=True)
+        assert not (first / job.id).exists(), "The first worker should remove the artifacts"
@@ -0,0 +1,94 @@
+import numpy as np
+import polars as pl
+import pytest
+import sklearn
+from sklearn.datasets import make_classification
+from sklearn.ensemble import HistGradientBoostingClassifier
+
+from src.core.binning import (
+    Binner,
+    PreBinnedHistGradientBoostingClassifier,
+    QuantileSketch,
+    bin_parquet,
+)
+
+
+def _data(n_samples=5000):
+    X, y = make_classification(n_samples=n_samples, n_features=8, random_state=0)
+    X[::17, 2] = np.nan
+    # Fewer distinct values than bins
+    X[:, 3] = np.round(X[:, 3])
+    return X, y
+
+
+class TestBinning:
+    def test_sketch_quantiles(self):
+        X, _ = _data()
+        sketch = QuantileSketch(size=512)
+        for chunk in np.array_split(X[:, 0], 10):
+            sketch.update(chunk)
+        expected = np.percentile(X[:, 0], [10, 50, 90])
+        np.testing.assert_allclose(sketch.quantiles([10, 50, 90]), expected, atol=0.05)
+
+    def test_sketch_many_merges(self):
+        values = np.random.default_rng(0).normal(size=200_000)
+        sketch = QuantileSketch(size=256)
+        for chunk in np.array_split(values, 2000):
+            sketch.update(chunk)
+        # The rank error does not grow with the number of merges
+        percentiles = np.array([1, 10, 50, 90, 99])
+        ranks = np.searchsorted(np.sort(values), sketch.quantiles(percentiles)) / len(values)
+        np.testing.assert_allclose(ranks, percentiles / 100, atol=0.01)
+
+    def test_infinite_thresholds(self):
+        X = np.array([[0.0, 0.0], [1.0, 1.0], [np.inf, 2.0]])
+        X = np.repeat(X, [1, 1, 300], axis=0)
+        X[2:, 1] = np.linspace(2, 1e308, 300)
+        X[-1, 1] = np.inf
+        thresholds = Binner().fit(X).bin_thresholds_
+        assert all(np.isfinite(t).all() and (t <= 1e300).all() for t in thresholds)
+
+    def test_sketch_distinct_thresholds(self):
+        X, _ = _data()
+        sketch = QuantileSketch()
+        for chunk in np.array_split(X[:, 3], 10):
+            sketch.update(chunk)
+        # Exact as long as there are few distinct values
+        np.testing.assert_array_equal(sketch.thresholds(), Binner().fit(X).bin_thresholds_[3])
+
+    def test_bin_parquet(self, tmp_path):
+        X, y = _data()
+        frame = pl.DataFrame(X, schema=[f"x{i}" for i in range(X.shape[1])]).with_columns(y=y)
+        path = tmp_path / "train.parquet"
+        frame.write_parquet(path, row_group_size=len(frame) // 7 + 1)
+
+        binner, X_binned, y_binned = bin_parquet(path)
+        assert binner.columns_ == [f"x{i}" for i in range(X.shape[1])]
+        assert X_binned.dtype == np.uint8
+        np.testing.assert_array_equal(X_binned, binner.transform(frame.drop("y")))
+        np.testing.assert_array_equal(y_binned, y)
+        # Missing values go to the extra bin
+        assert (X_binned[::17, 2] == binner.max_bins).all()
+        np.testing.assert_array_equal(binner.bin_thresholds_[3], Binner().fit(X).bin_thresholds_[3])
+
+    def test_prebinned_matches_in_memory(self):
+        X, y = _data()
+        params = dict(max_iter=20, early_stopping=False, random_state=0)
+        binner = Binner().fit(X)
+        prebinned = PreBinnedHistGradientBoostingClassifier(**params).fit(
+            binner.transform(X), y, binner
+        )
+        model = HistGradientBoostingClassifier(**params).fit(X, y)
+
+        np.testing.assert_array_equal(prebinned.predict(X), model.predict(X))
+        np.testing.assert_allclose(prebinned.predict_proba(X), model.predict_proba(X))
+        np.testing.assert_array_equal(
+            prebinned.predict_binned(binner.transform(X)), model.predict(X)
+        )
+
+    def test_sklearn_version(self, monkeypatch):
+        X, y = _data(500)
+        binner = Binner().fit(X)
+        monkeypatch.setattr(sklearn, "__version__", "9.9.0")
+        with pytest.raises(ImportError, match="scikit-learn"):
+            PreBinnedHistGradientBoostingClassifier().fit(binner.transform(X), y, binner)
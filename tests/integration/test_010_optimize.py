@@ -0,0 +1,89 @@
+import json
+import time
+
+import polars as pl
+import pyarrow.parquet as pq
+import pytest
+from make_data import generate_data
+
+import src.utils.config as config
+
+
+class TestOptimize:
+    @pytest.fixture(scope="session", autouse=True)
+    def generate_test_data(self):
+        """Generate test data once per session, automatically."""
+        generate_data(output_dir="tests/integration/data")
+
+    @pytest.fixture(scope="class")
+    def minio(self):
+        return config.get_minio_client()
+
+    def _wait_optimized(self, minio, dataset_id, timeout=240):
+        start = time.monotonic()
+        while True:
+            info = minio.stat_object("datasets", dataset_id)
+            if info.metadata.get("x-amz-meta-optimized") == "1":
+                return info
+            assert time.monotonic() - start < timeout, "The dataset was not optimized in time"
+            time.sleep(1)
+
+    @pytest.mark.integration
+    @pytest.mark.parametrize("float32", [False, True])
+    def test_optimize(self, client, minio, tmp_path, float32):
+        path = "tests/integration/data/train.parquet"
+        dataset_id = client.upload(path, optimize=True, float32=float32)
+        info = self._wait_optimized(minio, dataset_id)
+
+        optimized_path = tmp_path / "optimized.parquet"
+        minio.fget_object("datasets", dataset_id, str(optimized_path))
+        original = pl.read_parquet(path)
+        optimized = pl.read_parquet(optimized_path)
+        assert optimized.columns == original.columns
+        if float32:
+            assert optimized["y"].dtype == original["y"].dtype
+            assert all(
+                optimized[name].dtype == pl.Float32 for name in optimized.columns if name != "y"
+            )
+            original = original.with_columns(pl.exclude("y").cast(pl.Float32))
+        assert optimized.equals(original)
+
+        file = pq.ParquetFile(optimized_path)
+        row_group_rows = int(info.metadata["x-amz-meta-row-group-rows"])
+        assert int(info.metadata["x-amz-meta-num-rows"]) == len(original)
+        assert all(
+            file.metadata.row_group(i).num_rows <= row_group_rows
+            for i in range(file.num_row_groups)
+        )
+        assert file.metadata.row_group(0).column(0).compression == "ZSTD"
+        stats = json.loads(file.metadata.metadata[b"neuralk:stats"])
+        assert set(stats) == set(original.columns)
+
+        # Optimized datasets are used like the others
+        model_id = client.fit(dataset_id, timeout=240)
+        assert client.download(client.predict(dataset_id, model_id, timeout=240))["y"].len() == len(
+            original
+        )
+
+    @pytest.mark.integration
+    def test_small_row_groups(self, client, minio, tmp_path):
+        path = tmp_path / "train.parquet"
+        original = pl.read_parquet("tests/integration/data/train.parquet")
+        original.write_parquet(path, row_group_size=100)
+        dataset_id = client.upload(str(path))
+        before = minio.stat_object("datasets", dataset_id)
+        client._optimize(dataset_id, float32=False)
+        info = self._wait_optimized(minio, dataset_id)
+
+        # The row groups of the source are merged up to the target size
+        optimized_path = tmp_path / "optimized.parquet"
+        minio.fget_object("datasets", dataset_id, str(optimized_path))
+        file = pq.ParquetFile(optimized_path)
+        row_group_rows = int(info.metadata["x-amz-meta-row-group-rows"])
+        assert file.num_row_groups == -(-len(original) // row_group_rows)
+        assert pl.read_parquet(optimized_path).equals(original)
+
+        # The previous version stays readable by the jobs that use it
+        assert info.version_id != before.version_id
+        previous = minio.stat_object("datasets", dataset_id, version_id=before.version_id)
+        assert previous.size == before.size
@@ -0,0 +1,87 @@
+import io
+
+import polars as pl
+import pytest
+import requests
+from make_data import generate_data
+from rq.job import Job
+
+import src.utils.config as config
+
+
+class TestPredictCache:
+    @pytest.fixture(scope="session", autouse=True)
+    def generate_test_data(self):
+        """Generate test data once per session, automatically."""
+        generate_data(output_dir="tests/integration/data")
+
+    @pytest.fixture(scope="class")
+    def model_id(self, client):
+        train_id = client.upload("tests/integration/data/train.parquet")
+        return client.fit(train_id, timeout=240)
+
+    def _post_predict(self, client, dataset_id, model_id, **params):
+        response = requests.post(
+            f"{client.url}/predict",
+            params={"dataset_id": dataset_id, "model_id": model_id, **params},
+        )
+        response.raise_for_status()
+        return response.json()
+
+    @pytest.mark.integration
+    def test_cache_hit(self, client, model_id):
+        test_id = client.upload("tests/integration/data/test.parquet")
+        prediction_id = client.predict(test_id, model_id, timeout=240)
+        assert client.predict(test_id, model_id, timeout=240) == prediction_id
+        # Another format is another prediction
+        assert (
+            client.predict(test_id, model_id, timeout=240, output_format="arrow") != prediction_id
+        )
+
+    @pytest.mark.integration
+    def test_coalescing(self, client, model_id):
+        test = pl.read_parquet("tests/integration/data/test.parquet")
+        # Content that no other test predicts on
+        test_id = client.upload_frame(test.head(len(test) - 1))
+        first = self._post_predict(client, test_id, model_id)
+        second = self._post_predict(client, test_id, model_id)
+        assert not first.get("shared")
+        assert second == {"id": first["id"], "shared": True}
+        client._wait(first["id"], timeout=240)
+        assert len(client.download(first["id"])) == len(test) - 1
+
+    @pytest.mark.integration
+    def test_dataset_version(self, client, model_id):
+        test = pl.read_parquet("tests/integration/data/test.parquet")
+        test_id = client.upload_frame(test)
+        prediction_id = client.predict(test_id, model_id, timeout=240)
+        # A dataset rewritten under the same ID is predicted again
+        buffer = io.BytesIO()
+        test.head(len(test) // 2).write_parquet(buffer)
+        config.get_minio_client().put_object(
+            "datasets", test_id, io.BytesIO(buffer.getvalue()), len(buffer.getvalue())
+        )
+        other_id = client.predict(test_id, model_id, timeout=240)
+        assert other_id != prediction_id
+        assert len(client.download(other_id)) == len(test) // 2
+
+    @pytest.mark.integration
+    def test_missing_job(self, client, model_id):
+        test_id = client.upload("tests/integration/data/test.parquet")
+        first = self._post_predict(client, test_id, model_id, output_format="numpy")
+        client._wait(first["id"], timeout=240)
+        Job.fetch(first["id"], connection=config.get_redis_connection()).delete()
+        # The entry of a job that no longer exists is dropped
+        second = self._post_predict(client, test_id, model_id, output_format="numpy")
+        assert second["id"] != first["id"]
+        assert not second.get("shared")
+
+    @pytest.mark.integration
+    def test_delete_model(self, client):
+        train_id = client.upload("tests/integration/data/train.parquet")
+        test_id = client.upload("tests/integration/data/test.parquet")
+        model_id = client.fit(train_id, timeout=240)
+        prediction_id = client.predict(test_id, model_id, timeout=240)
+        client.delete_model(model_id)
+        # The cached prediction is forgotten (the new one fails, without the model)
+        assert self._post_predict(client, test_id, model_id)["id"] != prediction_id
@@ -0,0 +1,93 @@
+import threading
+import time
+
+import pytest
+import requests
+
+from src.core.worker import Worker
+from src.utils.jobs import deadline_meta
+
+
+def _sleep(seconds):
+    time.sleep(seconds)
+
+
+def _when_started(job, action, timeout=30):
+    """Run `action` in a thread once `job` has started."""
+
+    def wait():
+        start = time.monotonic()
+        while job.get_status() != "started" and time.monotonic() - start < timeout:
+            time.sleep(0.1)
+        action()
+
+    thread = threading.Thread(target=wait, daemon=True)
+    thread.start()
+    return thread
+
+
+class TestDeadline:
+    def _work(self, queue):
+        Worker([queue], connection=queue.connection, job_monitoring_interval=1).work(burst=True)
+
+    @pytest.mark.integration
+    def test_skip_passed_deadline(self, queue):
+        job = queue.enqueue(_sleep, args=(0,), meta=deadline_meta(-1))
+        dependent = queue.enqueue(_sleep, args=(0,), depends_on=job)
+        self._work(queue)
+        assert job.get_status() == "canceled"
+        assert job.started_at is None, "The job should not run"
+        assert dependent.get_status() == "canceled"
+
+    @pytest.mark.integration
+    def test_stop_at_deadline(self, queue):
+        job = queue.enqueue(_sleep, args=(60,), meta=deadline_meta(10))
+        dependent = queue.enqueue(_sleep, args=(0,), depends_on=job)
+        start = time.monotonic()
+        self._work(queue)
+        assert time.monotonic() - start < 40, "The job should be stopped at its deadline"
+        assert job.get_status() == "stopped"
+        assert dependent.get_status() == "canceled"
+
+
+class TestCancel:
+    @pytest.mark.integration
+    def test_cancel_queued(self, client, queue):
+        job = queue.enqueue(_sleep, args=(0,))
+        dependent = queue.enqueue(_sleep, args=(0,), depends_on=job)
+        assert client.cancel(job.id) == "canceled"
+        Worker([queue], connection=queue.connection).work(burst=True)
+        assert job.get_status() == "canceled"
+        assert dependent.get_status() == "canceled"
+
+    @pytest.mark.integration
+    def test_cancel_deferred(self, client, queue):
+        job = queue.enqueue(_sleep, args=(0,))
+        dependent = queue.enqueue(_sleep, args=(0,), depends_on=job)
+        assert dependent.get_status() == "deferred"
+        assert client.cancel(dependent.id) == "canceled"
+        Worker([queue], connection=queue.connection).work(burst=True)
+        assert job.get_status() == "finished"
+        assert dependent.get_status() == "canceled"
+
+    @pytest.mark.integration
+    def test_cancel_started(self, client, queue):
+        job = queue.enqueue(_sleep, args=(60,))
+        dependent = queue.enqueue(_sleep, args=(0,), depends_on=job)
+        statuses = []
+        thread = _when_started(job, lambda: statuses.append(client.cancel(job.id)))
+        start = time.monotonic()
+        Worker([queue], connection=queue.connection).work(burst=True)
+        thread.join()
+        assert time.monotonic() - start < 30, "The job should be stopped"
+        assert statuses == ["started"]
+        assert job.get_status() == "stopped"
+        assert dependent.get_status() == "canceled"
+
+    @pytest.mark.integration
+    def test_cancel_ended(self, client, queue):
+        job = queue.enqueue(_sleep, args=(0,))
+        Worker([queue], connection=queue.connection).work(burst=True)
+        with pytest.raises(requests.exceptions.HTTPError):
+            client.cancel(job.id)
+        assert job.get_status() == "finished"
@@ -0,0 +1,104 @@
+import datetime
+import os
+import subprocess
+import sys
+import time
+import types
+import uuid
+
+import pytest
+
+import src.utils.config as config
+import src.utils.retention as retention
+from src.utils.jobs import cancel
+
+
+class _Minio:
+    """The objects of each bucket, by name, with their last modification."""
+
+    def __init__(self):
+        self.objects = {"datasets": {}, "models": {}, "results": {}}
+
+    def put(self, bucket, age):
+        name = str(uuid.uuid4())
+        now = datetime.datetime.now(datetime.timezone.utc)
+        self.objects[bucket][name] = now - datetime.timedelta(seconds=age)
+        return name
+
+    def list_objects(self, bucket, recursive=False):
+        return [
+            types.SimpleNamespace(object_name=name, last_modified=modified)
+            for name, modified in self.objects[bucket].items()
+        ]
+
+    def remove_objects(self, bucket, delete_objects):
+        for obj in delete_objects:
+            del self.objects[bucket][obj._name]
+        return iter([])
+
+
+def _noop():
+    pass
+
+
+class TestRetention:
+    @pytest.fixture
+    def minio(self, monkeypatch):
+        monkeypatch.setattr(config, "DATASET_RETENTION", 3600)
+        monkeypatch.setattr(config, "MODEL_RETENTION", 0)
+        monkeypatch.setattr(config, "RESULT_RETENTION", 3600)
+        return _Minio()
+
+    @pytest.mark.integration
+    def test_sweep_bucket(self, minio, queue):
+        connection = queue.connection
+        # Unused for longer than the retention: removed
+        minio.put("datasets", 7200)
+        recent = minio.put("datasets", 60)
+        used = minio.put("datasets", 7200)
+        kept = minio.put("datasets", 7200)
+        retention.track(connection, datasets=[used])
+
+        assert retention.sweep_bucket(minio, connection, "datasets", keep={kept}) == 1
+        assert set(minio.objects["datasets"]) == {recent, used, kept}
+
+    @pytest.mark.integration
+    def test_no_retention(self, minio, queue):
+        model = minio.put("models", 10**8)
+        last_used_key = retention.LAST_USED_KEY.format(bucket="models")
+        queue.connection.zadd(last_used_key, {model: 0})
+        assert retention.sweep_bucket(minio, queue.connection, "models") == 0
+        assert set(minio.objects["models"]) == {model}
+        assert not queue.connection.exists(last_used_key), "Old last uses should be removed"
+
+        retention.track(queue.connection, models=[model])
+        assert not queue.connection.exists(last_used_key), "Last uses should not be recorded"
+
+    @pytest.mark.integration
+    def test_sweep(self, minio, queue, monkeypatch):
+        monkeypatch.setattr(config, "FAILED_JOB_RETENTION", 1)
+        pending = minio.put("datasets", 7200)
+        old = minio.put("results", 7200)
+        # A queued job keeps the datasets it uses, however old
+        queue.enqueue(_noop, meta=retention.track(queue.connection, datasets=[pending]))
+        # Backdate the last use, which `track` just recorded
+        queue.connection.zadd(retention.LAST_USED_KEY.format(bucket="datasets"), {pending: 0})
+        canceled = queue.enqueue(_noop)
+        cancel(canceled)
+        time.sleep(2)
+
+        removed = retention.sweep(minio, queue)
+        assert removed["results"] == 1
+        assert removed["datasets"] == 0
+        assert removed["canceled jobs"] == 1
+        assert pending in minio.objects["datasets"]
+        assert old not in minio.objects["results"]
+        assert not queue.connection.exists(canceled.key), "Old canceled jobs should be removed"
+
+    @pytest.mark.parametrize("result_retention,ok", [("60", False), ("3600", True), ("0", True)])
+    def test_result_retention_covers_cache(self, result_retention, ok):
+        env = {**os.environ, "RESULT_RETENTION": result_retention, "PREDICT_CACHE_TTL": "3600"}
+        process = subprocess.run(
+            [sys.executable, "-c", "import src.utils.config"], env=env, capture_output=True
+        )
+        assert (process.returncode == 0) == ok, process.stderr
@@ -0,0 +1,38 @@
+import logging
+
+import pytest
+
+from src.utils.logger import _QueueHandler
+
+
+def _record(msg, *args):
+    return logging.LogRecord("test", logging.INFO, __file__, 1, msg, args, None)
+
+
+class TestLogger:
+    @pytest.fixture
+    def handler(self):
+        return _QueueHandler(None)
+
+    def test_immutable_args_formatted_later(self, handler):
+        record = handler.prepare(_record("Trained %s in %.2fs", "model", 1.5))
+        assert record.args == ("model", 1.5)
+        assert record.getMessage() == "Trained model in 1.50s"
+
+    def test_mutable_args_frozen(self, handler):
+        ids = ["a"]
+        record = handler.prepare(_record("Datasets: %s, %d", ids, 1))
+        ids.append("b")
+        assert record.args is None
+        assert record.getMessage() == "Datasets: ['a'], 1"
+
+    def test_mapping_args_frozen(self, handler):
+        stats = {"removed": 1}
+        record = handler.prepare(_record("Removed %(removed)s", stats))
+        stats["removed"] = 2
+        assert record.getMessage() == "Removed 1"
+
+    def test_mapping_args_immutable(self, handler):
+        record = handler.prepare(_record("Removed %(removed)s", {"removed": 1}))
+        assert record.args == {"removed": 1}
+        assert record.getMessage() == "Removed 1"
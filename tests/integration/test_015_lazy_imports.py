@@ -0,0 +1,26 @@
+import subprocess
+import sys
+
+HEAVY_MODULES = ("sklearn", "polars", "pyarrow", "cloudpickle", "joblib")
+
+
+def _imported(code):
+    """The heavy modules imported by a new interpreter that runs `code`."""
+    check = f"import sys; print(' '.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    output = subprocess.run(
+        [sys.executable, "-c", f"{code}; {check}"], capture_output=True, text=True, check=True
+    ).stdout
+    return set(output.split())
+
+
+class TestLazyImports:
+    def test_import_ml(self):
+        assert _imported("import src.core.ml") == set(), "ml should import its dependencies lazily"
+
+    def test_import_server(self):
+        assert (
+            _imported("import src.api.server") == set()
+        ), "The server should not import the dependencies of the tasks"
+
+    def test_warm_up(self):
+        assert _imported("import src.core.ml as ml; ml.warm_up()") == set(HEAVY_MODULES)
@@ -0,0 +1,77 @@
+import threading
+import time
+import types
+
+import pytest
+import requests
+
+from src.utils.health import Prober
+
+
+class _Minio:
+    def __init__(self, error=None, hang=None):
+        self.error = error
+        self.hang = hang
+
+    def list_buckets(self):
+        if self.hang is not None:
+            self.hang.wait()
+        if self.error is not None:
+            raise self.error
+        return [types.SimpleNamespace(name="datasets")]
+
+
+class TestProber:
+    @pytest.mark.integration
+    def test_ok(self, queue):
+        prober = Prober(_Minio(), queue, timeout=5, stale_after=60)
+        assert prober.snapshot()["status"] == "starting"
+        prober.check()
+        snapshot = prober.snapshot()
+        assert snapshot["status"] == "ok"
+        assert snapshot["services"]["minio"] == {"status": "ok", "buckets": ["datasets"]}
+        assert snapshot["services"]["queue"] == {"status": "ok", "jobs": 0}
+        assert not snapshot["stale"]
+
+    @pytest.mark.integration
+    def test_degraded(self, queue):
+        prober = Prober(_Minio(error=ConnectionError("refused")), queue, timeout=5)
+        prober.check()
+        snapshot = prober.snapshot()
+        assert snapshot["status"] == "degraded"
+        assert snapshot["services"]["minio"] == {"status": "error", "error": "refused"}
+        assert snapshot["services"]["redis"]["status"] == "ok"
+
+    @pytest.mark.integration
+    def test_timeout(self, queue):
+        hang = threading.Event()
+        prober = Prober(_Minio(hang=hang), queue, timeout=0.5)
+        try:
+            start = time.monotonic()
+            prober.check()
+            assert time.monotonic() - start < 2, "A service that hangs should not delay the check"
+            assert prober.snapshot()["services"]["minio"] == {
+                "status": "error",
+                "error": "timed out",
+            }
+            assert prober.snapshot()["services"]["redis"]["status"] == "ok"
+        finally:
+            hang.set()
+
+    @pytest.mark.integration
+    def test_stale(self, queue):
+        prober = Prober(_Minio(), queue, stale_after=0.1)
+        prober.check()
+        time.sleep(0.2)
+        assert prober.snapshot()["stale"]
+
+
+class TestHealthEndpoints:
+    @pytest.mark.integration
+    @pytest.mark.parametrize("path", ["health", "ready"])
+    def test_endpoint(self, client, path):
+        response = requests.get(f"{client.url}/{path}", timeout=2)
+        assert response.status_code == 200
+        snapshot = response.json()
+        assert snapshot["status"] == "ok"
+        assert set(snapshot["services"]) == {"redis", "minio", "queue"}
@@ -0,0 +1,95 @@
+import argparse
+import random
+
+import pytest
+
+import load_test
+from load_test import LoadTest, parse_mix, summarize
+
+
+def _args(*argv):
+    return load_test.parser.parse_args(list(argv))
+
+
+class TestLoadTest:
+    def test_parse_mix(self):
+        assert parse_mix("fit=1,predict=4") == {"fit": 1.0, "predict": 4.0}
+        assert parse_mix("download") == {"download": 1.0}
+        with pytest.raises(argparse.ArgumentTypeError):
+            parse_mix("fit=1,train=2")
+        assert _args().mix == {"fit": 1.0, "predict": 4.0}
+
+    @pytest.mark.parametrize(
+        "argv", [("--rates", "1", "0"), ("--step-duration", "-1"), ("--features", "3")]
+    )
+    def test_bad_args(self, argv):
+        with pytest.raises(SystemExit):
+            _args(*argv)
+
+    def test_summarize(self):
+        assert summarize([]) == {"count": 0}
+        summary = summarize(list(range(101)))
+        assert summary == {"count": 101, "mean": 50.0, "p50": 50.0, "p95": 95.0, "p99": 99.0}
+
+    def test_arrivals(self):
+        uniform = LoadTest(None, _args("--arrivals", "uniform")).arrivals(4, 10, random.Random(0))
+        assert uniform == pytest.approx([0.25 * i for i in range(1, 40)])
+        poisson = LoadTest(None, _args()).arrivals(4, 1000, random.Random(0))
+        assert len(poisson) == pytest.approx(4000, rel=0.05)
+        assert poisson == sorted(poisson)
+
+    def test_wait_timeout(self):
+        canceled = []
+
+        class _Client:
+            def info(self, job_id):
+                return {"status": "queued"}
+
+            def cancel(self, job_id):
+                canceled.append(job_id)
+
+        test = LoadTest(_Client(), _args("--timeout", "0", "--poll-interval", "0"))
+        # A shared (cached) prediction is not canceled
+        with pytest.raises(TimeoutError):
+            test.wait("shared", {}, cancel=False)
+        with pytest.raises(TimeoutError):
+            test.wait("own", {})
+        assert canceled == ["own"]
+
+    def test_report(self):
+        test = LoadTest(None, _args("--mix", "fit=1,predict=1", "--step-duration", "10"))
+        test.client = type("Client", (), {"url": "http://server"})()
+        test.records = [
+            {
+                "operation": "fit",
+                "step": 0,
+                "due": 0,
+                "late": 0,
+                "enqueue": 1,
+                "execution": 3,
+                "total": 5,
+            },
+            {"operation": "predict", "step": 0, "due": 1, "late": 0, "cached": True, "total": 2},
+            {"operation": "predict", "step": 0, "due": 2, "late": 1, "error": "TimeoutError: late"},
+            # Completes after the end of its step
+            {"operation": "predict", "step": 1, "due": 15, "late": 0, "cached": False, "total": 15},
+        ]
+        report = test.report([{"rate": 1, "start": 0}, {"rate": 2, "start": 10}], end=30)
+        assert report["url"] == "http://server"
+        first, second = report["steps"]
+        assert (first["requests"], first["errors"], first["throughput"]) == (3, 1, 0.2)
+        assert first["operations"]["fit"]["execution"]["p50"] == 3
+        assert first["operations"]["predict"]["cached"] == 1
+        assert first["operations"]["predict"]["error_samples"] == ["TimeoutError: late"]
+        assert second["throughput"] == 1 / 20
+
+    @pytest.mark.integration
+    def test_load_test(self, client):
+        argv = "--rates 1 --step-duration 5 --mix upload=1,predict=1,download=1"
+        args = _args(*argv.split(), "--samples", "1000", "--features", "5", "--timeout", "240")
+        test = LoadTest(client, args)
+        test.setup()
+        report = test.report(test.run(), end=0)
+        (step,) = report["steps"]
+        assert step["requests"] == len(test.records) > 0
+        assert step["errors"] == 0, step
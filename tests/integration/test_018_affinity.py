@@ -0,0 +1,83 @@
+import uuid
+
+import pytest
+from rq import Queue
+
+import src.utils.affinity as affinity
+import src.utils.config as config
+from src.core.worker import Worker
+
+
+def _noop():
+    pass
+
+
+class TestAffinity:
+    @pytest.fixture
+    def worker(self, queue, monkeypatch):
+        """A registered idle worker, with its own queue."""
+        monkeypatch.setattr(config, "AFFINITY_MAX_QUEUED", 2)
+        worker = Worker([queue], connection=queue.connection, name=str(uuid.uuid4()))
+        worker.register_birth()
+        worker.set_state("idle")
+        yield worker
+        affinity.release(queue, worker.name)
+        queue.connection.srem(affinity.WORKERS_KEY.format(queue=queue.name), worker.name)
+        worker.register_death()
+
+    @pytest.mark.integration
+    def test_route(self, queue, worker):
+        model_id = str(uuid.uuid4())
+        own_queue = affinity.worker_queue(queue, worker.name)
+        assert worker.queues[0] == own_queue, "Jobs routed to the worker should be taken first"
+        assert affinity.route(queue, model_id) == queue, "No worker has the model"
+
+        affinity.advertise(queue, worker.name, [model_id])
+        assert affinity.route(queue, model_id) == own_queue
+        own_queue.enqueue(_noop)
+        worker.set_state("busy")
+        assert affinity.route(queue, model_id) == queue, "The worker has too many jobs"
+
+        worker.set_state("idle")
+        affinity.forget_model(queue, model_id)
+        assert affinity.route(queue, model_id) == queue, "The model was deleted"
+
+    @pytest.mark.integration
+    def test_route_disabled(self, queue, worker, monkeypatch):
+        model_id = str(uuid.uuid4())
+        affinity.advertise(queue, worker.name, [model_id])
+        monkeypatch.setattr(config, "AFFINITY_MAX_QUEUED", 0)
+        assert affinity.route(queue, model_id) == queue
+
+    @pytest.mark.integration
+    def test_release_on_teardown(self, queue, worker):
+        model_id = str(uuid.uuid4())
+        affinity.advertise(queue, worker.name, [model_id])
+        own_queue = affinity.worker_queue(queue, worker.name)
+        jobs = [own_queue.enqueue(_noop) for _ in range(2)]
+
+        worker.teardown()
+        assert own_queue.count == 0
+        assert queue.get_job_ids() == [job.id for job in jobs]
+        assert affinity.route(queue, model_id) == queue, "The worker should forget its models"
+
+    @pytest.mark.integration
+    def test_release_dead_workers(self, queue):
+        other = Queue(f"test-{uuid.uuid4()}", connection=queue.connection)
+        # A worker that died, with jobs routed to it in both queues
+        name = str(uuid.uuid4())
+        jobs = {}
+        for q in (queue, other):
+            affinity.advertise(q, name, [str(uuid.uuid4())])
+            jobs[q.name] = affinity.worker_queue(q, name).enqueue(_noop)
+        try:
+            assert affinity.release_dead_workers(queue) == 1
+            assert queue.get_job_ids() == [jobs[queue.name].id]
+            assert other.count == 0, "The jobs of the other queue should stay in it"
+            assert affinity.worker_queues(other) == [affinity.worker_queue(other, name)]
+
+            assert affinity.release_dead_workers(other) == 1
+            assert other.get_job_ids() == [jobs[other.name].id]
+            assert affinity.worker_queues(other) == []
+        finally:
+            other.delete(delete_jobs=True)
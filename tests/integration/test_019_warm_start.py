@@ -0,0 +1,77 @@
+import numpy as np
+import polars as pl
+import pytest
+from make_data import generate_data
+from sklearn.datasets import make_classification
+from sklearn.ensemble import HistGradientBoostingClassifier
+
+import src.utils.config as config
+from src.core.binning import Binner, PreBinnedHistGradientBoostingClassifier
+
+
+class TestWarmStart:
+    @pytest.fixture(scope="session", autouse=True)
+    def generate_test_data(self):
+        """Generate test data once per session, automatically."""
+        generate_data(output_dir="tests/integration/data")
+
+    @pytest.fixture(scope="class")
+    def data(self):
+        X, y = make_classification(
+            n_samples=6000, n_features=8, n_classes=3, n_informative=4, random_state=0
+        )
+        return X[:3000], y[:3000], X[3000:], y[3000:]
+
+    def test_binner_from_model(self, data):
+        X, y, X_new, _ = data
+        model = HistGradientBoostingClassifier(max_iter=10).fit(X, y)
+        binner = Binner.from_model(model)
+        np.testing.assert_array_equal(binner.transform(X_new), model._bin_mapper.transform(X_new))
+
+    def test_warm_start_from(self, data):
+        X, y, X_new, y_new = data
+        model = HistGradientBoostingClassifier(max_iter=10, early_stopping=False).fit(X, y)
+        before = model.predict_proba(X_new)
+        binner = Binner.from_model(model)
+        # The appended rows need not have all the classes
+        mask = y_new != 2
+        warm = PreBinnedHistGradientBoostingClassifier.warm_start_from(model, 5)
+        warm.fit(binner.transform(X_new[mask]), y_new[mask], binner)
+
+        assert warm.n_iter_ == 15
+        np.testing.assert_array_equal(warm.classes_, model.classes_)
+        assert model.n_iter_ == 10, "The base model should be left untouched"
+        np.testing.assert_array_equal(model.predict_proba(X_new), before)
+        # The trees of the base model are kept as they are
+        staged = list(warm.staged_predict_proba(X_new))
+        np.testing.assert_allclose(staged[9], before)
+
+    @pytest.mark.integration
+    def test_warm_start_with_replay(self, client):
+        train = pl.read_parquet("tests/integration/data/train.parquet")
+        test = pl.read_parquet("tests/integration/data/test.parquet")
+        old_id = client.upload_frame(train.head(len(train) // 2))
+        new_id = client.upload_frame(train.tail(len(train) - len(train) // 2))
+        test_id = client.upload_frame(test)
+
+        base_id = client.fit(old_id, timeout=240)
+        model_id = client.fit(
+            new_id,
+            timeout=240,
+            base_model_id=base_id,
+            iterations=20,
+            replay_ids=[old_id],
+            replay=0.5,
+        )
+        lineage = config.get_minio_client().stat_object("models", model_id).metadata
+        assert lineage["x-amz-meta-base-model"] == base_id
+        assert lineage["x-amz-meta-generation"] == "1"
+        assert lineage["x-amz-meta-replayed-datasets"] == old_id
+
+        base_accuracy = (
+            client.download(client.predict(test_id, base_id, timeout=240))["y"] == test["y"]
+        ).mean()
+        accuracy = (
+            client.download(client.predict(test_id, model_id, timeout=240))["y"] == test["y"]
+        ).mean()
+        assert accuracy >= base_accuracy - 0.02, "Continuing the training should not lose accuracy"